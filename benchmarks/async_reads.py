@@ -0,0 +1,184 @@
+"""
+Load test of the profile, social link and rating GETs under ASGI, served
+by the DRF views (run in threads) or by main_profile.async_views.
+
+Each run seeds a throwaway test database and drives the ASGI application
+in-process with a fixed number of concurrent clients, then prints
+throughput and latency percentiles. Without --views both kinds of views
+are measured, each in a fresh interpreter since ASYNC_READ_VIEWS is read
+when the URLs are loaded.
+
+Run with: python -m benchmarks.async_reads [--concurrency N ...] [--requests N]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "realtinger.settings")
+
+
+def percentile(values, fraction):
+    """
+    Nearest-rank percentile of a sorted list
+    """
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def seed(ratings):
+    """
+    Creates a broker with a profile, social links and ratings, and returns
+    the URLs to read and the token of a buyer to read them with
+    """
+    # pylint: disable=C0415
+    from django.urls import reverse
+    from rest_framework.authtoken.models import Token
+
+    from main_profile.models import Rating, SocialLinks, UserProfile
+    from users_account.models import UserAccount
+
+    broker = UserAccount.objects.create_user(
+        email="broker@example.com",
+        password="pass1234",
+        username="broker",
+        user_type=UserAccount.LAND_BROKER,
+    )
+    profile = UserProfile.objects.create(
+        user=broker, firstname="Ada", lastname="Broker", location="Lagos"
+    )
+    for site in ["x", "linkedin", "instagram"]:
+        profile.social_media_accounts.add(
+            SocialLinks.objects.create(site_name=site, link=f"https://{site}.com/ada")
+        )
+    buyers = UserAccount.objects.bulk_create(
+        UserAccount(email=f"buyer{i}@example.com", username=f"buyer{i}")
+        for i in range(ratings)
+    )
+    Rating.objects.bulk_create(
+        Rating(user=buyer, rated_user=broker, rating=1 + i % 5, comment="ok")
+        for i, buyer in enumerate(buyers)
+    )
+    urls = [
+        reverse("user_profile:user_profile", args=[broker.pk]),
+        reverse("user_profile:social_account", args=[broker.pk]),
+        reverse("user_profile:ratings", args=[broker.pk]),
+    ]
+    return urls, Token.objects.create(user=buyers[0]).key
+
+
+async def get(application, path, token):
+    """
+    Sends one GET through the ASGI application and returns its status
+    """
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [
+            (b"host", b"testserver"),
+            (b"authorization", f"Token {token}".encode()),
+        ],
+        "client": ("127.0.0.1", 0),
+        "server": ("testserver", 80),
+    }
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await application(scope, receive, send)
+    return messages[0]["status"]
+
+
+async def load(application, urls, token, concurrency, requests):
+    """
+    Sends requests GETs, cycling through urls, from concurrency clients,
+    and returns the wall time and the sorted latencies
+    """
+    latencies = []
+    pending = iter(range(requests))
+
+    async def client():
+        for number in pending:
+            started = time.perf_counter()
+            status = await get(application, urls[number % len(urls)], token)
+            latencies.append(time.perf_counter() - started)
+            assert status == 200, status
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return time.perf_counter() - started, sorted(latencies)
+
+
+def run(args):
+    """
+    Measures the views picked by ASYNC_READ_VIEWS
+    """
+    django.setup()
+    # pylint: disable=C0415
+    from django.conf import settings
+    from django.core.asgi import get_asgi_application
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+
+    settings.DEBUG = False
+    settings.ALLOWED_HOSTS = ["testserver"]
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=0)
+    urls, token = seed(args.ratings)
+    application = get_asgi_application()
+
+    views = "async" if settings.ASYNC_READ_VIEWS else "sync"
+    asyncio.run(load(application, urls, token, 4, len(urls) * 10))
+    for concurrency in args.concurrency:
+        seconds, latencies = asyncio.run(
+            load(application, urls, token, concurrency, args.requests)
+        )
+        print(
+            f"{views} views, {concurrency} clients: "
+            f"{args.requests / seconds:.0f} req/s, "
+            f"p50 {statistics.median(latencies) * 1e3:.1f} ms, "
+            f"p99 {percentile(latencies, 0.99) * 1e3:.1f} ms",
+            flush=True,
+        )
+
+
+def main():
+    """
+    Runs the load test for one kind of views, or both in turn
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--views", choices=["sync", "async"])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--requests", type=int, default=600)
+    parser.add_argument("--ratings", type=int, default=200)
+    args = parser.parse_args()
+
+    if args.views:
+        os.environ["ASYNC_READ_VIEWS"] = str(args.views == "async").lower()
+        run(args)
+        return
+    for views in ["sync", "async"]:
+        subprocess.run(
+            [sys.executable, "-m", "benchmarks.async_reads", "--views", views]
+            + sys.argv[1:],
+            check=True,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Benchmark of account email rendering: parsing every rendered email with
+BeautifulSoup against the precompiled templates in users_account.emails.
+
+Run with: python -m benchmarks.email_render [--number N]
+"""
+import argparse
+import os
+import timeit
+import uuid
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "realtinger.settings")
+django.setup()
+
+# pylint: disable=C0413
+from django.template.loader import render_to_string
+
+from users_account.emails import (
+    confirm_email,
+    extract_confirm_email,
+    extract_password_reset_email,
+    password_reset_email,
+)
+from users_account.models import UserAccount
+
+
+def main():
+    """
+    Prints the per-email cost of both rendering paths
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=2000)
+    number = parser.parse_args().number
+
+    cases = [
+        (
+            "confirm_email",
+            "user/confirm_email.html",
+            extract_confirm_email,
+            confirm_email(),
+            {
+                "user": UserAccount(username="benchmark"),
+                "site_url": "example.com",
+                "token": uuid.uuid4(),
+            },
+        ),
+        (
+            "password_reset_email",
+            "user/password_reset_email.html",
+            extract_password_reset_email,
+            password_reset_email(),
+            {
+                "protocol": "https",
+                "domain": "example.com",
+                "uidb64": "MQ",
+                "token": "bx1y2z-0123456789abcdef:1700000000",
+            },
+        ),
+    ]
+
+    for name, template_name, extract, email, context in cases:
+        parsed = (*extract(render_to_string(template_name, context)),)
+        assert email.render(context)[:2] == parsed, name
+
+        before = timeit.timeit(
+            lambda: extract(render_to_string(template_name, context)),
+            number=number,
+        )
+        after = timeit.timeit(lambda: email.render(context), number=number)
+        print(
+            f"{name}: {before / number * 1e6:.1f} us/email parsed, "
+            f"{after / number * 1e6:.1f} us/email precompiled "
+            f"({before / after:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
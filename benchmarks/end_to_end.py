@@ -0,0 +1,535 @@
+"""
+End-to-end load test of the account and profile flows.
+
+Seeds a throwaway test database with buyers, brokers, profiles, social
+links and ratings, skewed the way real data is: a few top brokers with
+--top-reviews reviews each and a long tail with few, and reads aimed at
+the popular brokers. Then --concurrency clients each run flows of
+
+    register -> verify -> login -> create profile -> read a broker's
+    profile -> update own profile -> rate the broker -> list its ratings
+
+through the WSGI application (client threads) and the ASGI application
+(client tasks, with the async read views), each in a fresh interpreter.
+
+Prints and writes as JSON, per application, the throughput, the number
+of requests over their view's query budget and for every step its
+p50/p95/p99 latency and queries per request, and compares them against a
+baseline from an earlier run. Query budget warnings are printed as they
+happen. With --check the exit status is 1 when a request went over its
+budget, or a step got slower or ran more queries than the baseline allows.
+
+Run with: python -m benchmarks.end_to_end [--flows N] [--concurrency N]
+    [--output results.json] [--baseline benchmarks/end_to_end_baseline.json]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "realtinger.settings")
+
+BASELINE = os.path.join(os.path.dirname(__file__), "end_to_end_baseline.json")
+STEPS = [
+    "register",
+    "verify",
+    "login",
+    "create_profile",
+    "read_profile",
+    "update_profile",
+    "rate",
+    "list_ratings",
+]
+LOCATIONS = ["Lagos", "Abuja", "Ibadan", "Kano", "Port Harcourt", "Enugu"]
+# Most ratings are good ones
+STAR_WEIGHTS = [5, 5, 10, 30, 50]
+
+
+def percentile(values, fraction):
+    """
+    Nearest-rank percentile of a sorted list
+    """
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def broker_weights(count):
+    """
+    Zipf-like popularity of count brokers, the top ones first
+    """
+    return [1 / (rank + 1) ** 1.1 for rank in range(count)]
+
+
+def seed(args, rng):
+    """
+    Fills the database and returns the broker ids, most popular first
+    """
+    # pylint: disable=C0415
+    from django.contrib.auth.hashers import make_password
+    from django.core.management import call_command
+
+    from main_profile.models import Rating, SocialLinks, UserProfile
+    from users_account.models import UserAccount
+
+    # Hashing every seeded password would take minutes
+    password = make_password("pass1234")
+    buyers = UserAccount.objects.bulk_create(
+        UserAccount(
+            email=f"buyer{i}@bench.example",
+            username=f"buyer{i}",
+            password=password,
+            is_verified=True,
+        )
+        for i in range(args.users)
+    )
+    brokers = UserAccount.objects.bulk_create(
+        UserAccount(
+            email=f"broker{i}@bench.example",
+            username=f"broker{i}",
+            password=password,
+            is_verified=True,
+            user_type=UserAccount.LAND_BROKER,
+        )
+        for i in range(max(args.brokers, args.top_brokers))
+    )
+    # pylint: disable=E1101
+    profiles = UserProfile.objects.bulk_create(
+        UserProfile(
+            user=broker,
+            firstname=f"Broker{i}",
+            lastname="Bench",
+            location=rng.choices(LOCATIONS, weights=[40, 20, 15, 10, 10, 5])[0],
+            description="Land and houses " * rng.randint(1, 20),
+        )
+        for i, broker in enumerate(brokers)
+    )
+
+    links = []
+    for profile in profiles:
+        for site in rng.sample(["x", "linkedin", "instagram"], rng.randint(0, 3)):
+            links.append(
+                (profile, SocialLinks(site_name=site, link=f"https://{site}.com/b"))
+            )
+    SocialLinks.objects.bulk_create(link for _, link in links)
+    through = UserProfile.social_media_accounts.through
+    through.objects.bulk_create(
+        through(userprofile_id=profile.pk, sociallinks_id=link.pk)
+        for profile, link in links
+    )
+
+    # Ratings come from buyers in turn; only the API stops a buyer from
+    # rating the same broker twice
+    for rank, broker in enumerate(brokers):
+        if rank < args.top_brokers:
+            count = args.top_reviews
+        else:
+            count = int(args.tail_reviews / (rank - args.top_brokers + 1) ** 1.1)
+        for start in range(0, count, 5000):
+            Rating.objects.bulk_create(
+                Rating(
+                    user=buyers[(start + i) % len(buyers)],
+                    rated_user=broker,
+                    rating=rng.choices(range(1, 6), weights=STAR_WEIGHTS)[0],
+                    comment="Bench rating",
+                )
+                for i in range(min(5000, count - start))
+            )
+
+    # Rating counters, location keys, search index and leaderboards, which
+    # bulk_create bypasses
+    call_command("reconcile_ratings", verbosity=0)
+    call_command("rebuild_search_index", verbosity=0)
+    call_command("rebuild_leaderboards", verbosity=0)
+    return [broker.pk for broker in brokers]
+
+
+# pylint: disable=W0613
+def begin_immediate(sender, connection, **kwargs):
+    """
+    Makes a SQLite connection take the write lock when a transaction
+    begins, as Django 5.1's transaction_mode="IMMEDIATE" does. A
+    transaction that reads and then writes otherwise fails at once with
+    "database is locked" when another thread is writing, whatever the
+    timeout.
+    """
+    if connection.vendor == "sqlite":
+        # pylint: disable=W0212
+        connection._start_transaction_under_autocommit = lambda: (
+            connection.cursor().execute("BEGIN IMMEDIATE")
+        )
+
+
+class BudgetWarnings(logging.Handler):
+    """
+    Counts the query budget warnings logged while it is installed
+    """
+
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.count = 0
+
+    def emit(self, record):
+        self.count += 1
+
+
+class Recorder:
+    """
+    Latencies and query counts of the requests of every step
+    """
+
+    def __init__(self):
+        self.steps = {step: [] for step in STEPS}
+        self.failures = 0
+
+    def record(self, step, seconds, response):
+        """
+        Records one request, counting it as failed unless it succeeded
+        """
+        request = getattr(response, "wsgi_request", None) or response.asgi_request
+        self.steps[step].append((seconds, request.query_count))
+        if response.status_code >= 400:
+            self.failures += 1
+
+    def summary(self, seconds, flows, over_budget):
+        """
+        Throughput and per-step latencies and queries, as JSON data
+        """
+        requests = sum(len(samples) for samples in self.steps.values())
+        steps = {}
+        for step, samples in self.steps.items():
+            latencies = sorted(latency for latency, _ in samples)
+            steps[step] = {
+                "requests": len(samples),
+                "p50_ms": round(percentile(latencies, 0.5) * 1e3, 2),
+                "p95_ms": round(percentile(latencies, 0.95) * 1e3, 2),
+                "p99_ms": round(percentile(latencies, 0.99) * 1e3, 2),
+                "queries_per_request": round(
+                    sum(queries for _, queries in samples) / len(samples), 2
+                ),
+            }
+        return {
+            "flows_per_second": round(flows / seconds, 2),
+            "requests_per_second": round(requests / seconds, 2),
+            "failures": self.failures,
+            "over_budget": over_budget,
+            "steps": steps,
+        }
+
+
+class Flow:
+    """
+    The requests of one flow, sent by a test client of either kind
+    """
+
+    def __init__(self, number, brokers, weights, seed_value):
+        rng = random.Random(seed_value * 100003 + number)
+        self.broker = rng.choices(brokers, weights=weights)[0]
+        self.rating = rng.choices(range(1, 6), weights=STAR_WEIGHTS)[0]
+        self.email = f"flow{number}@bench.example"
+        self.username = f"flow{number}"
+        self.token = None
+
+    def requests(self):
+        """
+        Generator of (step, method, path, data, use token) for each request;
+        the response of each is sent back in
+        """
+        # pylint: disable=C0415
+        from django.urls import reverse
+
+        response = yield (
+            "register",
+            "post",
+            reverse("authentication:register"),
+            {"email": self.email, "password": "pass1234", "username": self.username},
+            False,
+        )
+        token = response.json()["token"]
+        yield "verify", "post", reverse("authentication:verify"), {
+            "token": token
+        }, False
+        response = yield (
+            "login",
+            "post",
+            reverse("authentication:login"),
+            {"email": self.email, "password": "pass1234"},
+            False,
+        )
+        user_id = response.json()["user"]
+        self.token = response.json()["token"]
+        own = reverse("user_profile:user_profile", args=[user_id])
+        yield (
+            "create_profile",
+            "post",
+            own,
+            {"firstname": "Bench", "lastname": "Buyer", "location": "Lagos"},
+            True,
+        )
+        yield (
+            "read_profile",
+            "get",
+            reverse("user_profile:user_profile", args=[self.broker]),
+            None,
+            True,
+        )
+        yield "update_profile", "put", own, {"location": "Abuja"}, True
+        ratings = reverse("user_profile:ratings", args=[self.broker])
+        yield "rate", "post", ratings, {"rating": self.rating, "comment": "ok"}, True
+        yield "list_ratings", "get", ratings, None, True
+
+
+def run_wsgi(args, brokers, weights, recorder):
+    """
+    Runs the flows from client threads through the WSGI application
+    """
+    # pylint: disable=C0415
+    from django.test import Client
+
+    def run(number):
+        client = Client()
+        flow = Flow(number, brokers, weights, args.seed)
+        requests = flow.requests()
+        response = None
+        while True:
+            try:
+                step, method, path, data, authenticated = requests.send(response)
+            except StopIteration:
+                return
+            headers = {}
+            if authenticated:
+                headers["HTTP_AUTHORIZATION"] = f"Token {flow.token}"
+            started = time.perf_counter()
+            if method == "get":
+                response = client.get(path, **headers)
+            else:
+                response = getattr(client, method)(
+                    path, data, content_type="application/json", **headers
+                )
+            recorder.record(step, time.perf_counter() - started, response)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as executor:
+        list(executor.map(run, range(args.flows)))
+    return time.perf_counter() - started
+
+
+def run_asgi(args, brokers, weights, recorder):
+    """
+    Runs the flows from client tasks through the ASGI application
+    """
+    # pylint: disable=C0415
+    from django.test import AsyncClient
+
+    pending = iter(range(args.flows))
+
+    async def run():
+        for number in pending:
+            client = AsyncClient()
+            flow = Flow(number, brokers, weights, args.seed)
+            requests = flow.requests()
+            response = None
+            while True:
+                try:
+                    step, method, path, data, authenticated = requests.send(response)
+                except StopIteration:
+                    break
+                headers = {}
+                if authenticated:
+                    headers["AUTHORIZATION"] = f"Token {flow.token}"
+                started = time.perf_counter()
+                if method == "get":
+                    response = await client.get(path, **headers)
+                else:
+                    response = await getattr(client, method)(
+                        path, data, content_type="application/json", **headers
+                    )
+                recorder.record(step, time.perf_counter() - started, response)
+
+    async def run_all():
+        await asyncio.gather(*(run() for _ in range(args.concurrency)))
+
+    started = time.perf_counter()
+    asyncio.run(run_all())
+    return time.perf_counter() - started
+
+
+def measure(args):
+    """
+    Seeds a test database and runs the flows through one application,
+    returning its results
+    """
+    django.setup()
+    # pylint: disable=C0415
+    from django.conf import settings
+    from django.db import connection
+    from django.db.backends.signals import connection_created
+    from django.test import override_settings
+    from django.test.utils import setup_test_environment
+
+    from users_account import hashing
+
+    settings.DEBUG = False
+    # Budget warnings still reach stderr, through logging's last resort
+    # handler, and are counted in the results
+    warnings = BudgetWarnings()
+    logging.getLogger("realtinger.query_budget").addHandler(warnings)
+    setup_test_environment()
+    # Flows write from several threads, which an in-memory SQLite database
+    # shared between them refuses with "table is locked"
+    database = connection.settings_dict
+    if database["ENGINE"] == "django.db.backends.sqlite3":
+        database["TEST"]["NAME"] = os.path.join(
+            tempfile.gettempdir(), f"end_to_end_{args.server}.sqlite3"
+        )
+        database["OPTIONS"]["timeout"] = 60
+        connection_created.connect(begin_immediate)
+    # A run that crashed leaves its database behind
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    brokers = seed(args, rng)
+    seeded = time.perf_counter() - started
+    print(f"{args.server}: seeded in {seeded:.1f}s", file=sys.stderr, flush=True)
+    weights = broker_weights(len(brokers))
+
+    recorder = Recorder()
+    run = run_wsgi if args.server == "wsgi" else run_asgi
+    # Every flow comes from the same address and would be throttled
+    with override_settings(THROTTLE_RATES={}):
+        seconds = run(args, brokers, weights, recorder)
+    hashing.shutdown_pool()
+    connection.creation.destroy_test_db(database["NAME"], verbosity=0)
+    return recorder.summary(seconds, args.flows, warnings.count)
+
+
+def compare(results, baseline, tolerance):
+    """
+    Lines describing how results differ from the baseline, and whether
+    anything regressed past the tolerance
+    """
+    lines, regressed = [], False
+    for server, result in results.items():
+        base = baseline.get("results", {}).get(server)
+        if base is None:
+            continue
+        ratio = result["requests_per_second"] / base["requests_per_second"]
+        slower = ratio < 1 - tolerance
+        regressed |= slower
+        lines.append(
+            f"{server}: {result['requests_per_second']} req/s, "
+            f"{ratio - 1:+.0%} against the baseline{' REGRESSED' if slower else ''}"
+        )
+        for step, numbers in result["steps"].items():
+            before = base["steps"].get(step)
+            if before is None:
+                continue
+            changes = []
+            for key in ["p50_ms", "p95_ms", "p99_ms"]:
+                change = numbers[key] / before[key] - 1 if before[key] else 0
+                changes.append(f"{key[:3]} {change:+.0%}")
+                regressed |= change > tolerance
+            queries = numbers["queries_per_request"] - before["queries_per_request"]
+            changes.append(f"queries {queries:+.2f}")
+            # Query counts do not depend on the machine
+            regressed |= queries > 0.5
+            lines.append(f"  {step}: " + ", ".join(changes))
+    return lines, regressed
+
+
+def main():
+    """
+    Runs the benchmark for one application, or both in turn and reports
+    """
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--server", choices=["wsgi", "asgi"])
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--brokers", type=int, default=200)
+    parser.add_argument("--top-brokers", type=int, default=3)
+    parser.add_argument("--top-reviews", type=int, default=100000)
+    parser.add_argument("--tail-reviews", type=int, default=500)
+    parser.add_argument("--flows", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="File to write the results to")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument(
+        "--check", action="store_true", help="Exit with 1 on a regression"
+    )
+    args = parser.parse_args()
+
+    if args.server:
+        # The results are the last line of output, for the parent
+        print(json.dumps(measure(args)), flush=True)
+        return
+
+    results = {}
+    for server in ["wsgi", "asgi"]:
+        env = dict(os.environ, ASYNC_READ_VIEWS=str(server == "asgi").lower())
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.end_to_end", "--server", server]
+            + sys.argv[1:],
+            check=True,
+            env=env,
+            stdout=subprocess.PIPE,
+            text=True,
+        ).stdout
+        results[server] = json.loads(output.strip().splitlines()[-1])
+
+    report = {
+        "config": {
+            key: getattr(args, key)
+            for key in [
+                "users",
+                "brokers",
+                "top_brokers",
+                "top_reviews",
+                "tail_reviews",
+                "flows",
+                "concurrency",
+                "seed",
+            ]
+        },
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(text + "\n")
+
+    over_budget = False
+    for server, result in results.items():
+        if result["over_budget"]:
+            print(
+                f"{server}: {result['over_budget']} requests went over their "
+                "query budget",
+                file=sys.stderr,
+            )
+            over_budget = True
+    regressed = False
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+        if baseline.get("config") != report["config"]:
+            print("The baseline was run with other settings", file=sys.stderr)
+        lines, regressed = compare(results, baseline, args.tolerance)
+        print("\n".join(lines), file=sys.stderr)
+    if (over_budget or regressed) and args.check:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
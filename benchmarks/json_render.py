@@ -0,0 +1,79 @@
+"""
+Benchmark of JSON rendering: DRF's JSONRenderer against the orjson-backed
+ORJSONRenderer in realtinger.renderers, on a page of serialized ratings.
+
+Run with: python -m benchmarks.json_render [--ratings N] [--number N]
+"""
+import argparse
+import os
+import timeit
+import tracemalloc
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "realtinger.settings")
+django.setup()
+
+# pylint: disable=C0413
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from main_profile.models import Rating
+from main_profile.serializers import RatingSerializer
+from realtinger.renderers import ORJSONRenderer
+
+
+def peak_allocation(render, data):
+    """
+    Peak memory allocated while rendering data once, in bytes
+    """
+    tracemalloc.start()
+    render(data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    """
+    Prints the per-render time and peak allocation of both renderers
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--ratings", type=int, default=5000)
+    parser.add_argument("--number", type=int, default=50)
+    args = parser.parse_args()
+
+    now = timezone.now()
+    data = RatingSerializer(
+        [
+            Rating(
+                id=i,
+                user_id=i,
+                rated_user_id=1,
+                rating=1 + i % 5,
+                comment=f"Great broker, would buy again ({i})",
+                created_at=now,
+            )
+            for i in range(args.ratings)
+        ],
+        many=True,
+    ).data
+
+    renderers = [("JSONRenderer", JSONRenderer()), ("ORJSONRenderer", ORJSONRenderer())]
+    outputs = {renderer.render(data) for _, renderer in renderers}
+    assert len(outputs) == 1, "renderers disagree"
+
+    results = {}
+    for name, renderer in renderers:
+        seconds = timeit.timeit(lambda r=renderer: r.render(data), number=args.number)
+        results[name] = seconds / args.number
+        print(
+            f"{name}: {results[name] * 1e3:.2f} ms/render, "
+            f"{peak_allocation(renderer.render, data) / 1024:.0f} KiB peak "
+            f"for {args.ratings} ratings"
+        )
+    print(f"speedup: {results['JSONRenderer'] / results['ORJSONRenderer']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Benchmark of logins per second in one worker process: concurrent client
+threads post credentials to the login endpoint, with passwords hashed on
+the request threads (PASSWORD_HASHING_WORKERS=0) or in process pools of
+increasing size.
+
+Run with: python -m benchmarks.login_throughput [--threads N] [--logins N]
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "realtinger.settings")
+django.setup()
+
+# pylint: disable=C0413
+from django.conf import settings
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment
+from django.urls import reverse
+
+from users_account import hashing
+from users_account.models import UserAccount
+
+
+def login(email):
+    """
+    Logs in once with a fresh client and returns the status code
+    """
+    response = Client().post(
+        reverse("authentication:login"), {"email": email, "password": "pass1234"}
+    )
+    return response.status_code
+
+
+def measure(users, threads, logins):
+    """
+    Logins per second with threads concurrent clients
+    """
+    emails = [users[number % len(users)] for number in range(logins)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        statuses = list(executor.map(login, emails))
+    seconds = time.perf_counter() - started
+    assert set(statuses) == {200}, statuses
+    return logins / seconds
+
+
+def main():
+    """
+    Prints logins/sec with hashing inline and in pools of each size
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--logins", type=int, default=48)
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 2, 4])
+    args = parser.parse_args()
+
+    settings.DEBUG = False
+    # Query budget warnings would drown out the results
+    logging.disable(logging.WARNING)
+    setup_test_environment()
+    # Logins write, which an in-memory SQLite database shared between
+    # threads refuses with "table is locked"
+    database = connection.settings_dict
+    if database["ENGINE"] == "django.db.backends.sqlite3":
+        database["TEST"]["NAME"] = os.path.join(
+            tempfile.gettempdir(), "login_throughput.sqlite3"
+        )
+        database["OPTIONS"]["timeout"] = 60
+    connection.creation.create_test_db(verbosity=0)
+    users = [
+        UserAccount.objects.create_user(
+            email=f"user{i}@example.com",
+            password="pass1234",
+            username=f"user{i}",
+            is_verified=True,
+        ).email
+        for i in range(args.threads)
+    ]
+
+    for workers in args.workers:
+        # Every login comes from the same address and would be throttled
+        with override_settings(PASSWORD_HASHING_WORKERS=workers, THROTTLE_RATES={}):
+            # Starts the pool outside the measurement
+            hashing.make_password("warm up")
+            rate = measure(users, args.threads, args.logins)
+        hashing.shutdown_pool()
+        print(
+            f"{workers or 'no'} hashing processes, {args.threads} threads: "
+            f"{rate:.1f} logins/s (cpu count {os.cpu_count()})",
+            flush=True,
+        )
+    connection.creation.destroy_test_db(database["NAME"], verbosity=0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Benchmark of list serialization: RatingSerializer(many=True) on model
+instances against main_profile.readers on the equivalent .values() rows.
+Neither side touches the database, so this measures serialization alone.
+
+Run with: python -m benchmarks.values_read [--ratings N] [--number N]
+"""
+import argparse
+import os
+import timeit
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "realtinger.settings")
+django.setup()
+
+# pylint: disable=C0413
+from django.utils import timezone
+
+from main_profile.models import Rating
+from main_profile.readers import rating_reader, read_ratings
+from main_profile.serializers import RatingSerializer
+
+
+def main():
+    """
+    Prints the time to serialize a list of ratings both ways
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--ratings", type=int, default=1000)
+    parser.add_argument("--number", type=int, default=20)
+    args = parser.parse_args()
+
+    now = timezone.now()
+    ratings = [
+        Rating(
+            id=i,
+            user_id=i,
+            rated_user_id=1,
+            rating=1 + i % 5,
+            comment=f"Great broker, would buy again ({i})",
+            created_at=now,
+        )
+        for i in range(args.ratings)
+    ]
+    columns = {"user": "user_id", "rated_user": "rated_user_id"}
+    rows = [
+        {
+            column: getattr(rating, columns.get(column, column))
+            for column in rating_reader.columns
+        }
+        for rating in ratings
+    ]
+    assert read_ratings(rows) == RatingSerializer(ratings, many=True).data
+
+    timings = {
+        "RatingSerializer": lambda: RatingSerializer(ratings, many=True).data,
+        "ValuesReader": lambda: read_ratings(rows),
+    }
+    results = {}
+    for name, serialize in timings.items():
+        results[name] = timeit.timeit(serialize, number=args.number) / args.number
+        print(f"{name}: {results[name] * 1e3:.2f} ms for {args.ratings} ratings")
+    print(f"speedup: {results['RatingSerializer'] / results['ValuesReader']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
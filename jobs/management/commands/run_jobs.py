@@ -0,0 +1,53 @@
+"""
+Management command that runs the background job worker
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from jobs.worker import Worker
+
+
+class Command(BaseCommand):
+    """
+    Runs queued jobs on a thread pool until interrupted
+    """
+
+    help = "Run the background job worker"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--threads",
+            type=int,
+            default=settings.JOBS_WORKER_THREADS,
+            help="Number of jobs run concurrently",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=None,
+            help="Number of jobs claimed at a time, defaults to --threads",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=settings.JOBS_POLL_INTERVAL,
+            help="Seconds to sleep when the queue is empty",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Run a single batch and exit",
+        )
+
+    def handle(self, *args, **options):
+        worker = Worker(threads=options["threads"], batch_size=options["batch_size"])
+        if options["once"]:
+            count = worker.run_once()
+            self.stdout.write(f"Ran {count} jobs")
+            return
+
+        self.stdout.write(f"Worker started with {worker.threads} threads")
+        try:
+            worker.run_forever(poll_interval=options["poll_interval"])
+        except KeyboardInterrupt:
+            self.stdout.write("Worker stopped")
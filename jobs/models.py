@@ -0,0 +1,48 @@
+"""
+Models for the background jobs app
+"""
+from django.db import models
+from django.utils import timezone
+
+
+class Job(models.Model):
+    """
+    A unit of background work, run by the run_jobs worker
+    """
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    DEAD = "dead"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (DEAD, "Dead"),
+    ]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # pylint: disable=R0903
+    class Meta:
+        """
+        Meta class
+        """
+
+        indexes = [
+            # Serves the worker's "next due job" scan
+            models.Index(fields=["status", "run_at"], name="job_status_run_at_idx"),
+        ]
+
+    # pylint: disable=E0307
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
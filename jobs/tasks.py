@@ -0,0 +1,41 @@
+"""
+Task registry and enqueue helpers for background jobs
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Job
+
+registry = {}
+
+
+def task(name):
+    """
+    Registers the decorated function as the handler for jobs called name.
+    Handlers receive the job payload as keyword arguments.
+    """
+
+    def decorator(func):
+        registry[name] = func
+        return func
+
+    return decorator
+
+
+def enqueue(name, payload=None, delay=0, max_attempts=None):
+    """
+    Queues a job. The row is written in the caller's transaction, so it
+    only becomes visible to workers once that transaction commits and
+    vanishes with it on rollback.
+    """
+    if max_attempts is None:
+        max_attempts = settings.JOBS_MAX_ATTEMPTS
+    # pylint: disable=E1101
+    return Job.objects.create(
+        name=name,
+        payload=payload or {},
+        max_attempts=max_attempts,
+        run_at=timezone.now() + timedelta(seconds=delay),
+    )
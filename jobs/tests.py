@@ -0,0 +1,116 @@
+"""
+Tests for the background jobs app
+"""
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .models import Job
+from .tasks import enqueue, registry
+from .worker import Worker
+
+calls = []
+
+
+def record(**payload):
+    """
+    Handler that remembers its payload
+    """
+    calls.append(payload)
+
+
+def explode(**payload):
+    """
+    Handler that always fails
+    """
+    raise RuntimeError(f"boom {payload}")
+
+
+@mock.patch.dict(registry, {"record": record, "explode": explode})
+@override_settings(JOBS_RETRY_BACKOFF=10, JOBS_RETRY_BACKOFF_MAX=15)
+class WorkerTests(TestCase):
+    """
+    Tests for claiming, running and retrying jobs
+    """
+
+    def setUp(self):
+        calls.clear()
+        self.worker = Worker(threads=2)
+
+    def test_runs_due_jobs(self):
+        job = enqueue("record", {"value": 1})
+        enqueue("record", {"value": 2}, delay=60)
+
+        self.assertEqual(self.worker.run_once(), 1)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+        self.assertEqual(job.attempts, 1)
+        self.assertEqual(calls, [{"value": 1}])
+
+    def test_claimed_jobs_are_not_claimed_again(self):
+        enqueue("record")
+
+        self.assertEqual(len(self.worker.claim()), 1)
+        self.assertEqual(self.worker.claim(), [])
+
+    def test_stale_claims_are_reclaimed(self):
+        job = enqueue("record")
+        self.worker.claim()
+        # pylint: disable=E1101
+        Job.objects.filter(pk=job.pk).update(
+            locked_at=timezone.now() - timedelta(hours=1)
+        )
+
+        self.assertEqual([j.pk for j in self.worker.claim()], [job.pk])
+
+    def test_jobs_that_keep_killing_workers_are_dead_lettered(self):
+        job = enqueue("record", max_attempts=2)
+        for attempt in range(1, 3):
+            self.assertEqual([j.pk for j in self.worker.claim()], [job.pk])
+            job.refresh_from_db()
+            self.assertEqual(job.attempts, attempt)
+            # The worker dies without finishing the job
+            # pylint: disable=E1101
+            Job.objects.filter(pk=job.pk).update(
+                locked_at=timezone.now() - timedelta(hours=1)
+            )
+
+        with self.assertLogs("jobs.worker", "ERROR"):
+            self.assertEqual(self.worker.claim(), [])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.DEAD, 2))
+        self.assertIn("abandoned", job.last_error.lower())
+        self.assertEqual(calls, [])
+
+    def test_failures_back_off_then_dead_letter(self):
+        job = enqueue("explode", max_attempts=3)
+
+        self.worker.run_once()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.PENDING)
+        self.assertIn("boom", job.last_error)
+        self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=5))
+
+        with self.assertLogs("jobs.worker", "ERROR"):
+            for _ in range(2):
+                # pylint: disable=E1101
+                Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+                self.worker.run_once()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DEAD)
+        self.assertEqual(job.attempts, 3)
+
+    def test_backoff_is_exponential_and_capped(self):
+        self.assertEqual([self.worker.backoff(n) for n in range(1, 4)], [10, 15, 15])
+
+    def test_unknown_jobs_are_dead_lettered(self):
+        job = enqueue("missing")
+        with self.assertLogs("jobs.worker", "ERROR"):
+            self.worker.run_once()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DEAD)
@@ -0,0 +1,184 @@
+"""
+Worker that claims and runs queued jobs
+"""
+import logging
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+from .tasks import registry
+
+logger = logging.getLogger(__name__)
+
+
+class Worker:
+    """
+    Claims due jobs from the database and runs them on a thread pool
+    """
+
+    def __init__(self, threads=None, batch_size=None):
+        self.threads = threads or settings.JOBS_WORKER_THREADS
+        self.batch_size = batch_size or self.threads
+
+    @staticmethod
+    def stale_jobs(now):
+        """
+        Running jobs whose worker has held them past the lock timeout and
+        is presumed dead
+        """
+        stale = now - timedelta(seconds=settings.JOBS_LOCK_TIMEOUT)
+        # pylint: disable=E1101
+        return Job.objects.filter(status=Job.RUNNING, locked_at__lt=stale)
+
+    def due_jobs(self, now):
+        """
+        Pending jobs that are due, plus stale running jobs
+        """
+        # pylint: disable=E1101
+        return (
+            Job.objects.filter(status=Job.PENDING, run_at__lte=now)
+            | self.stale_jobs(now)
+        ).order_by("run_at", "id")
+
+    def bury_stale(self, now):
+        """
+        Dead-letters the stale jobs that used up their attempts, which
+        would otherwise be taken back forever when they kill every worker
+        that runs them. Every claim counts as an attempt, so a job taken
+        back has its attempt counted like one that failed.
+        """
+        buried = (
+            self.stale_jobs(now)
+            .filter(attempts__gte=F("max_attempts"))
+            .update(
+                status=Job.DEAD,
+                locked_at=None,
+                last_error="Abandoned by its worker on its last attempt",
+            )
+        )
+        if buried:
+            logger.error("%d jobs were abandoned on their last attempt", buried)
+
+    def claim(self):
+        """
+        Marks up to batch_size due jobs as running and returns them.
+        Concurrent workers never claim the same job.
+        """
+        now = timezone.now()
+        claimed = {
+            "status": Job.RUNNING,
+            "locked_at": now,
+            "attempts": F("attempts") + 1,
+        }
+
+        with transaction.atomic():
+            self.bury_stale(now)
+            due = self.due_jobs(now)
+            if connection.features.has_select_for_update_skip_locked:
+                ids = list(
+                    due.select_for_update(skip_locked=True).values_list(
+                        "id", flat=True
+                    )[: self.batch_size]
+                )
+                # pylint: disable=E1101
+                Job.objects.filter(id__in=ids).update(**claimed)
+            else:
+                # SQLite has no row locks: claim each candidate with a
+                # conditional update that only one worker can win
+                ids = [
+                    pk
+                    for pk, status, locked_at in due.values_list(
+                        "id", "status", "locked_at"
+                    )[: self.batch_size]
+                    # pylint: disable=E1101
+                    if Job.objects.filter(
+                        pk=pk, status=status, locked_at=locked_at
+                    ).update(**claimed)
+                ]
+
+        # pylint: disable=E1101
+        return list(Job.objects.filter(id__in=ids).order_by("run_at", "id"))
+
+    def backoff(self, attempts):
+        """
+        Seconds to wait before retrying a job that failed attempts times
+        """
+        delay = settings.JOBS_RETRY_BACKOFF * 2 ** (attempts - 1)
+        return min(delay, settings.JOBS_RETRY_BACKOFF_MAX)
+
+    def run_job(self, job):
+        """
+        Runs a claimed job and records the outcome
+        """
+        try:
+            handler = registry[job.name]
+        except KeyError:
+            logger.error("No handler registered for job %s", job)
+            self.finish(job, Job.DEAD, f"Unknown job {job.name}")
+            return
+
+        try:
+            handler(**job.payload)
+        # pylint: disable=broad-exception-caught
+        except Exception:
+            error = traceback.format_exc()
+            if job.attempts >= job.max_attempts:
+                logger.error("Job %s failed for good: %s", job, error)
+                self.finish(job, Job.DEAD, error)
+            else:
+                run_at = timezone.now() + timedelta(seconds=self.backoff(job.attempts))
+                self.finish(job, Job.PENDING, error, run_at=run_at)
+            return
+
+        self.finish(job, Job.DONE)
+
+    def finish(self, job, status, error="", **fields):
+        """
+        Releases the claim on a job, unless another worker reclaimed it
+        """
+        # pylint: disable=E1101
+        Job.objects.filter(
+            pk=job.pk, status=Job.RUNNING, locked_at=job.locked_at
+        ).update(status=status, locked_at=None, last_error=error, **fields)
+
+    def run_in_thread(self, job):
+        """
+        Runs a job on a pool thread, which owns its own DB connection
+        """
+        try:
+            self.run_job(job)
+        finally:
+            close_old_connections()
+            connection.close()
+
+    def run_once(self, executor=None):
+        """
+        Claims one batch of jobs and runs it to completion, returning the
+        number of jobs run. Without an executor the jobs run inline.
+        """
+        jobs = self.claim()
+        if executor is None:
+            for job in jobs:
+                self.run_job(job)
+        else:
+            list(executor.map(self.run_in_thread, jobs))
+        return len(jobs)
+
+    def run_forever(self, poll_interval=None):
+        """
+        Keeps running batches, sleeping when the queue is empty
+        """
+        if poll_interval is None:
+            poll_interval = settings.JOBS_POLL_INTERVAL
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            while True:
+                if not self.run_once(executor):
+                    close_old_connections()
+                    time.sleep(poll_interval)
@@ -1,6 +1,24 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def install_search_index(sender, using, **kwargs):
+    """
+    Creates the full-text index migrations cannot express once the profile
+    table exists
+    """
+    # pylint: disable=C0415
+    from .search import install_search_index as install
+
+    install(using)
 
 
 class MainProfileConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "main_profile"
+
+    def ready(self):
+        # pylint: disable=C0415,W0611
+        from . import signals
+
+        post_migrate.connect(install_search_index, sender=self)
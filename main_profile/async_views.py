@@ -0,0 +1,190 @@
+"""
+Async versions of the profile, social links and ratings GETs.
+
+Under ASGI a sync view runs in a thread, one request at a time per thread.
+These views run on the event loop instead and only leave it for the
+database and the shared caches, through Django's async ORM and cache
+APIs, so a worker can keep many more reads in flight. They are plain
+Django views answering exactly as the DRF views do: token authentication,
+IsAuthenticated, the same bodies, statuses and validators. Every other
+method is handed to the DRF view, in a thread.
+
+urls.py uses them when ASYNC_READ_VIEWS is set, which asgi.py does.
+"""
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.dateparse import parse_datetime
+from rest_framework import exceptions, status
+from rest_framework.request import Request
+
+from users_account.authentication import CachedTokenAuthentication
+from users_account.models import UserAccount
+from realtinger.renderers import ORJSONRenderer
+from realtinger.routers import areplica_reads
+
+from . import cache as profile_cache
+from . import conditional
+from .models import Rating, UserProfile
+from .pagination import KeysetPagination
+from .readers import aread_profiles, profile_reader, rating_reader, read_ratings
+from .views import (
+    CreateProfile,
+    CreateSocial,
+    UserRatingView,
+    social_accounts,
+    social_rows,
+)
+
+authenticator = CachedTokenAuthentication()
+renderer = ORJSONRenderer()
+
+
+def render(data, status_code=status.HTTP_200_OK):
+    """
+    JSON response with the body a DRF Response of data would have
+    """
+    return HttpResponse(
+        renderer.render(data), status=status_code, content_type=renderer.media_type
+    )
+
+
+async def authenticate(request):
+    """
+    Checks a request the way CachedTokenAuthentication and IsAuthenticated
+    do, raising the same exceptions
+    """
+    result = await authenticator.aauthenticate(request)
+    if result is None:
+        raise exceptions.NotAuthenticated()
+    return result[0]
+
+
+def read_view(view_class, handler):
+    """
+    View answering GET and HEAD with an async handler and every other
+    method with the DRF view_class
+    """
+    sync_view = view_class.as_view()
+    delegate = sync_to_async(sync_view)
+    allow = ", ".join(view_class().allowed_methods)
+
+    async def view(request, *args, **kwargs):
+        if request.method not in ("GET", "HEAD"):
+            return await delegate(request, *args, **kwargs)
+        try:
+            # As DRF does, for the middlewares and handlers
+            request.user = await authenticate(request)
+            response = await handler(request, *args, **kwargs)
+        except exceptions.APIException as exception:
+            response = render({"detail": exception.detail}, exception.status_code)
+            if isinstance(
+                exception,
+                (exceptions.NotAuthenticated, exceptions.AuthenticationFailed),
+            ):
+                response.headers[
+                    "WWW-Authenticate"
+                ] = authenticator.authenticate_header(request)
+        response.headers.setdefault("Allow", allow)
+        patch_vary_headers(response, ["Accept"])
+        return response
+
+    # What DRF views carry, for the CSRF and query budget middlewares
+    view.csrf_exempt = True
+    view.view_class = view_class
+    return view
+
+
+async def get_profile(request, pk):
+    """
+    CreateProfile.get()
+    """
+    async with areplica_reads(request.user.pk) as reads:
+        version, data = await profile_cache.aget_profile(pk)
+        if data is None:
+            # pylint: disable=E1101
+            row = (
+                await UserProfile.objects.filter(user_id=pk)
+                .values(*profile_reader.columns)
+                .afirst()
+            )
+            if row is None:
+                return render(
+                    {"success": False, "message": "User does not exist"},
+                    status.HTTP_404_NOT_FOUND,
+                )
+            updated_at = row["updated_at"]
+        else:
+            updated_at = parse_datetime(data["updated_at"])
+
+        etag, last_modified = conditional.validators(request, updated_at)
+        not_modified = conditional.not_modified(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        if data is None:
+            data = (await aread_profiles([row]))[0]
+            await profile_cache.aset_profile(pk, version, data, reads.from_replica)
+        return conditional.set_validators(render(data), etag, last_modified)
+
+
+async def get_social(request, pk):
+    """
+    CreateSocial.get()
+    """
+    async with areplica_reads(request.user.pk):
+        rows = [row async for row in social_rows(pk)]
+        if not rows:
+            if not await UserAccount.objects.filter(pk=pk).aexists():
+                raise exceptions.NotFound()
+            return render(
+                {"message": "User has no profile", "success": False},
+                status.HTTP_400_BAD_REQUEST,
+            )
+
+        etag, last_modified = conditional.validators(request, rows[0]["updated_at"])
+        not_modified = conditional.not_modified(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        links = social_accounts(rows)
+        if links:
+            return conditional.set_validators(render(links), etag, last_modified)
+        return render(
+            {"success": False, "message": "User haven't added a social account"},
+            status.HTTP_400_BAD_REQUEST,
+        )
+
+
+async def get_ratings(request, user_id):
+    """
+    UserRatingView.get()
+    """
+    async with areplica_reads(request.user.pk):
+        # pylint: disable=E1101
+        updated_at = (
+            await UserProfile.objects.filter(user_id=user_id)
+            .values_list("updated_at", flat=True)
+            .afirst()
+        )
+        validators = None
+        if updated_at is not None:
+            validators = conditional.validators(request, updated_at)
+            not_modified = conditional.not_modified(request, *validators)
+            if not_modified is not None:
+                return not_modified
+
+        paginator = KeysetPagination()
+        ratings = await paginator.apaginate_queryset(
+            Rating.objects.filter(rated_user_id=user_id).values(*rating_reader.columns),
+            Request(request),
+        )
+        response = render(paginator.get_paginated_data(read_ratings(ratings)))
+        if validators is not None:
+            conditional.set_validators(response, *validators)
+        return response
+
+
+profile = read_view(CreateProfile, get_profile)
+social_account = read_view(CreateSocial, get_social)
+ratings = read_view(UserRatingView, get_ratings)
@@ -0,0 +1,134 @@
+"""
+Cache of serialized profile responses.
+
+Payloads are stored under a key that includes a per-user version number.
+Every write to a profile bumps its version once the write has committed,
+so readers move to a fresh key and a payload built from pre-write data
+can only ever land under a version nobody reads any more.
+
+A version bump only reaches the processes that read the same cache, so
+profiles are not cached at all while the default cache is a per-process
+one: every other worker would keep serving the pre-write payload.
+"""
+import time
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from realtinger.access_log import count_cache_hit
+from realtinger.caches import is_shared
+
+
+def version_key(user_id):
+    """
+    Cache key holding the current profile version of a user
+    """
+    return f"profile:version:{user_id}"
+
+
+def payload_key(user_id, version):
+    """
+    Cache key holding a user's serialized profile at a version
+    """
+    return f"profile:{user_id}:{version}"
+
+
+def new_version():
+    """
+    A version larger than any handed out before, used when the version
+    key is missing so payloads cached before an eviction are never reused
+    """
+    return time.time_ns()
+
+
+def get_version(user_id):
+    """
+    Current profile version of a user
+    """
+    version = cache.get(version_key(user_id))
+    if version is None:
+        version = new_version()
+        if not cache.add(version_key(user_id), version, None):
+            version = cache.get(version_key(user_id), version)
+    return version
+
+
+def get_profile(user_id):
+    """
+    Returns (version, payload) for a user, payload being None on a miss.
+    A payload built after a miss should be stored with that version, which
+    is None when profiles are not cached.
+    """
+    if not is_shared():
+        return None, None
+    version = get_version(user_id)
+    payload = cache.get(payload_key(user_id, version))
+    if payload is not None:
+        count_cache_hit()
+    return version, payload
+
+
+def set_profile(user_id, version, payload, from_replica=False):
+    """
+    Caches a serialized profile under the version read before building it.
+    A payload read from a replica is not cached: it may predate a write
+    whose version bump has already happened, and would then be served to
+    the writer under the new version.
+    """
+    if version is None or from_replica:
+        return
+    cache.set(payload_key(user_id, version), payload, settings.PROFILE_CACHE_TTL)
+
+
+async def aget_version(user_id):
+    """
+    get_version() for async views
+    """
+    version = await cache.aget(version_key(user_id))
+    if version is None:
+        version = new_version()
+        if not await cache.aadd(version_key(user_id), version, None):
+            version = await cache.aget(version_key(user_id), version)
+    return version
+
+
+async def aget_profile(user_id):
+    """
+    get_profile() for async views
+    """
+    if not is_shared():
+        return None, None
+    version = await aget_version(user_id)
+    payload = await cache.aget(payload_key(user_id, version))
+    if payload is not None:
+        count_cache_hit()
+    return version, payload
+
+
+async def aset_profile(user_id, version, payload, from_replica=False):
+    """
+    set_profile() for async views
+    """
+    if version is None or from_replica:
+        return
+    await cache.aset(payload_key(user_id, version), payload, settings.PROFILE_CACHE_TTL)
+
+
+def bump_version(user_id):
+    """
+    Moves readers of a user's profile to a new, empty cache key
+    """
+    try:
+        cache.incr(version_key(user_id))
+    except ValueError:
+        cache.set(version_key(user_id), new_version(), None)
+
+
+def invalidate_profile(user_id):
+    """
+    Bumps a user's profile version once the current transaction commits,
+    or straight away outside a transaction
+    """
+    transaction.on_commit(partial(bump_version, user_id))
@@ -0,0 +1,43 @@
+"""
+Conditional GETs of profile data.
+
+UserProfile.updated_at moves whenever a profile, its social links or its
+ratings change, so it validates the responses of all three. Validators
+are computed from it alone, and requests whose If-None-Match or
+If-Modified-Since still match get a 304 before anything is serialized.
+"""
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def validators(request, updated_at):
+    """
+    ETag and Last-Modified timestamp of the response to a request for data
+    last changed at updated_at. The ETag covers the path and query string,
+    so every page of a list gets its own.
+    """
+    resource = hashlib.sha1(request.get_full_path().encode()).hexdigest()[:16]
+    version = int(updated_at.timestamp() * 1_000_000)
+    return quote_etag(f"{version}-{resource}"), int(updated_at.timestamp())
+
+
+def set_validators(response, etag, last_modified):
+    """
+    Adds the validators of a response to its headers
+    """
+    response.headers["ETag"] = etag
+    response.headers["Last-Modified"] = http_date(last_modified)
+    return response
+
+
+def not_modified(request, etag, last_modified):
+    """
+    A 304 (or 412) response if the request's preconditions say the client
+    already has this representation, else None
+    """
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
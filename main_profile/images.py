@@ -0,0 +1,119 @@
+"""
+Resized copies of profile images.
+
+Uploads are stored as sent; a background job (see tasks.py) then renders
+a WebP and a JPEG copy of each image at every PROFILE_IMAGE_SIZES size.
+Decoding and resizing are CPU bound and hold the GIL, so they run in a
+process pool of PROFILE_IMAGE_WORKERS processes shared by the job worker
+threads, or inline when it is 0.
+"""
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+FORMATS = {"webp": "WEBP", "jpeg": "JPEG"}
+EXTENSIONS = {"webp": "webp", "jpeg": "jpg"}
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def render_variants(data, sizes, quality):
+    """
+    Renders every size of an encoded image in every format. Returns
+    {size: {format: bytes}}, never upscaling and with the EXIF
+    orientation applied and all metadata dropped.
+    """
+    image = Image.open(BytesIO(data))
+    # Lets the JPEG decoder downscale while decoding instead of afterwards
+    largest = max(sizes)
+    image.draft("RGB", (largest, largest))
+    image = ImageOps.exif_transpose(image)
+
+    has_alpha = image.mode in ("RGBA", "LA") or "transparency" in image.info
+    image = image.convert("RGBA" if has_alpha else "RGB")
+
+    variants = {}
+    # Each size is resized from the previous, larger one
+    for size in sorted(sizes, reverse=True):
+        image.thumbnail((size, size), Image.Resampling.LANCZOS)
+        flat = image
+        if has_alpha:
+            flat = Image.new("RGB", image.size, "white")
+            flat.paste(image, mask=image.getchannel("A"))
+        variants[size] = {
+            "webp": encode(image, "webp", quality),
+            "jpeg": encode(flat, "jpeg", quality),
+        }
+    return variants
+
+
+def encode(image, fmt, quality):
+    """
+    Encodes an image without any metadata
+    """
+    buffer = BytesIO()
+    options = {"quality": quality}
+    if fmt == "jpeg":
+        options.update(optimize=True, progressive=True)
+    else:
+        options.update(method=4)
+    image.save(buffer, FORMATS[fmt], **options)
+    return buffer.getvalue()
+
+
+def variant_names(variants):
+    """
+    Storage names of every copy in an image_variants mapping
+    """
+    return [name for formats in variants.values() for name in formats.values()]
+
+
+def delete_variants(names):
+    """
+    Deletes stored copies by storage name
+    """
+    for name in names:
+        default_storage.delete(name)
+
+
+def get_pool(workers):
+    """
+    The shared process pool, started on first use
+    """
+    # pylint: disable=W0603
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Forking a process that runs job threads and holds database
+            # connections is unsafe, so workers are spawned fresh
+            _pool = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+def shutdown_pool():
+    """
+    Stops the shared process pool, if it was started
+    """
+    # pylint: disable=W0603
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+
+def render(data, sizes, quality, workers):
+    """
+    Renders the variants of an image in the process pool, or inline when
+    workers is 0
+    """
+    if not workers:
+        return render_variants(data, sizes, quality)
+    return get_pool(workers).submit(render_variants, data, sizes, quality).result()
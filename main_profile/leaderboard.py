@@ -0,0 +1,196 @@
+"""
+Per-location leaderboards of the top rated brokers.
+
+Each location keeps its LEADERBOARD_SIZE best brokers, ranked by
+(average_rating, profile id), as LeaderboardEntry rows, so reading a board
+is an index range scan over at most LEADERBOARD_SIZE rows. Boards are
+updated incrementally whenever a profile's rating or location changes.
+
+A full board always holds rows that rank at least as high as every
+eligible profile left off it. A single profile changing only ever needs
+its own row updated, swapped with the lowest row, or swapped with the best
+profile off the board, which keeps that true without re-sorting.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Func, Q, Subquery
+
+from users_account.models import UserAccount
+from .models import LeaderboardEntry, UserProfile
+
+
+def rank(score, profile_id):
+    """
+    Sort key of a board entry, higher ranks first
+    """
+    return (score, profile_id)
+
+
+def eligible_profiles(location_key=None):
+    """
+    Profiles that may appear on a location's board, or any board: rated
+    brokers
+    """
+    # pylint: disable=E1101
+    profiles = UserProfile.objects.filter(
+        rating_count__gt=0, user__user_type=UserAccount.LAND_BROKER
+    )
+    if location_key is not None:
+        profiles = profiles.filter(location_key=location_key)
+    return profiles
+
+
+def compute_board(location_key, size=None):
+    """
+    Top (profile id, score) pairs of a location by a full sort, used to
+    rebuild boards and to check them
+    """
+    size = size or settings.LEADERBOARD_SIZE
+    return list(
+        eligible_profiles(location_key)
+        .order_by("-average_rating", "-id")
+        .values_list("id", "average_rating")[:size]
+    )
+
+
+def best_outsider(location_key, board_ids):
+    """
+    Highest ranked eligible profile of a location that is not on its board
+    """
+    return (
+        eligible_profiles(location_key)
+        .exclude(id__in=board_ids)
+        .order_by("-average_rating", "-id")
+        .values_list("id", "average_rating")
+        .first()
+    )
+
+
+def fill_vacancy(location_key):
+    """
+    Promotes the best profile off a board after the board lost an entry
+    """
+    # pylint: disable=E1101
+    board = LeaderboardEntry.objects.filter(location_key=location_key)
+    # The best profile off the board and the size of the board, in one query
+    best = (
+        eligible_profiles(location_key)
+        .exclude(id__in=board.values("profile_id"))
+        .annotate(
+            board_size=Subquery(
+                board.order_by()
+                .annotate(size=Func(F("id"), function="COUNT"))
+                .values("size")
+            )
+        )
+        .order_by("-average_rating", "-id")
+        .values_list("id", "average_rating", "board_size")
+        .first()
+    )
+    if best is not None and best[2] < settings.LEADERBOARD_SIZE:
+        LeaderboardEntry.objects.create(
+            location_key=location_key, profile_id=best[0], score=best[1]
+        )
+
+
+def update_broker(user_id):
+    """
+    Brings the boards up to date after the rating or location of a user's
+    profile changed. Call it in the transaction that made the change.
+    """
+    # pylint: disable=E1101
+    profile = (
+        UserProfile.objects.filter(user_id=user_id)
+        .values(
+            "id", "location_key", "average_rating", "rating_count", "user__user_type"
+        )
+        .first()
+    )
+    if profile is None:
+        return
+    profile_id, score = profile["id"], profile["average_rating"]
+    key = None
+    if (
+        profile["location_key"]
+        and profile["rating_count"]
+        and profile["user__user_type"] == UserAccount.LAND_BROKER
+    ):
+        key = profile["location_key"]
+
+    entries = LeaderboardEntry.objects.select_for_update().filter(
+        Q(profile_id=profile_id) | Q(location_key=key)
+        if key
+        else Q(profile_id=profile_id)
+    )
+    own = None
+    board = []
+    for entry in entries:
+        if entry.profile_id == profile_id:
+            own = entry
+        if entry.location_key == key:
+            board.append(entry)
+    board.sort(key=lambda entry: rank(entry.score, entry.profile_id), reverse=True)
+
+    if own is not None and own.location_key != key:
+        # Moved away or no longer eligible
+        own.delete()
+        fill_vacancy(own.location_key)
+        own = None
+    if key is None:
+        return
+
+    size = settings.LEADERBOARD_SIZE
+    for extra in board[size:]:
+        # Concurrent inserts into a board that was not full can overfill it
+        extra.delete()
+    board = board[:size]
+
+    if own is not None:
+        if score < own.score and len(board) >= size:
+            best = best_outsider(key, [entry.profile_id for entry in board])
+            if best is not None and rank(best[1], best[0]) > rank(score, profile_id):
+                own.profile_id, own.score = best
+                own.save(update_fields=["profile", "score"])
+                return
+        own.score = score
+        own.save(update_fields=["score"])
+    elif len(board) < size:
+        LeaderboardEntry.objects.create(
+            location_key=key, profile_id=profile_id, score=score
+        )
+    elif rank(score, profile_id) > rank(board[-1].score, board[-1].profile_id):
+        lowest = board[-1]
+        lowest.profile_id, lowest.score = profile_id, score
+        lowest.save(update_fields=["profile", "score"])
+
+
+def rebuild_location(location_key):
+    """
+    Replaces a location's board with one computed by a full sort, an empty
+    one for the empty location
+    """
+    with transaction.atomic():
+        # pylint: disable=E1101
+        LeaderboardEntry.objects.filter(location_key=location_key).delete()
+        LeaderboardEntry.objects.bulk_create(
+            LeaderboardEntry(location_key=location_key, profile_id=pk, score=score)
+            for pk, score in (compute_board(location_key) if location_key else [])
+        )
+
+
+def top_brokers(location):
+    """
+    The board of a location, best first, as dicts ready to render
+    """
+    # pylint: disable=E1101
+    return list(
+        LeaderboardEntry.objects.filter(location_key=location)
+        .order_by("-score", "-profile_id")
+        .values(
+            "score",
+            user=F("profile__user_id"),
+            firstname=F("profile__firstname"),
+            lastname=F("profile__lastname"),
+            rating_count=F("profile__rating_count"),
+        )
+    )
@@ -0,0 +1,43 @@
+"""
+Management command that deletes expired upload sessions
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from main_profile.models import UploadSession
+
+
+class Command(BaseCommand):
+    """
+    Deletes resumable uploads that were not finalized before they expired,
+    along with the chunks they received
+    """
+
+    help = "Delete expired resumable profile image uploads"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of sessions deleted per transaction",
+        )
+
+    def handle(self, *args, **options):
+        # pylint: disable=E1101
+        expired = UploadSession.objects.filter(expires_at__lte=timezone.now())
+        deleted = 0
+        while True:
+            with transaction.atomic():
+                ids = list(
+                    expired.values_list("pk", flat=True)[: options["batch_size"]]
+                )
+                if not ids:
+                    break
+                UploadSession.objects.filter(pk__in=ids).delete()
+
+            deleted += len(ids)
+            self.stdout.write(f"Deleted {deleted} expired uploads")
+
+        self.stdout.write(self.style.SUCCESS(f"Done: {deleted} uploads deleted"))
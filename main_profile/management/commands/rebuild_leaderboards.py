@@ -0,0 +1,35 @@
+"""
+Management command that recomputes the broker leaderboards
+"""
+from django.core.management.base import BaseCommand
+
+from main_profile.leaderboard import eligible_profiles, rebuild_location
+from main_profile.models import LeaderboardEntry
+
+
+class Command(BaseCommand):
+    """
+    Rebuilds the board of every location from a full sort of its
+    profiles, dropping boards of locations nobody rated is left in
+    """
+
+    help = "Recompute the top rated brokers of every location from scratch"
+
+    def handle(self, *args, **options):
+        # pylint: disable=E1101
+        locations = set(
+            eligible_profiles()
+            .exclude(location_key="")
+            .values_list("location_key", flat=True)
+            .distinct()
+        )
+        locations |= set(
+            LeaderboardEntry.objects.values_list("location_key", flat=True).distinct()
+        )
+        for count, location_key in enumerate(sorted(locations), 1):
+            rebuild_location(location_key)
+            self.stdout.write(f"Rebuilt {count} of {len(locations)} leaderboards")
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Done: {len(locations)} leaderboards rebuilt")
+        )
@@ -0,0 +1,65 @@
+"""
+Management command that rebuilds the broker search data
+"""
+from django.core.management.base import BaseCommand
+
+from main_profile.models import UserProfile, normalize_location
+from main_profile.search import install_search_index, rebuild_search_index
+
+
+class Command(BaseCommand):
+    """
+    Backfills the normalized location of every profile and rebuilds the
+    full-text index, for profiles written before search existed or by
+    bulk operations that bypass UserProfile.save
+    """
+
+    help = "Backfill profile location keys and rebuild the full-text index"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=500,
+            help="Number of profiles backfilled per query",
+        )
+        parser.add_argument("--database", default="default", help="Database to rebuild")
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        using = options["database"]
+        last_pk = 0
+        checked = updated = 0
+
+        while True:
+            # pylint: disable=E1101
+            profiles = list(
+                UserProfile.objects.using(using)
+                .filter(pk__gt=last_pk)
+                .order_by("pk")
+                .only("pk", "location", "location_key")[:chunk_size]
+            )
+            if not profiles:
+                break
+
+            stale = []
+            for profile in profiles:
+                key = normalize_location(profile.location)
+                if profile.location_key != key:
+                    profile.location_key = key
+                    stale.append(profile)
+            UserProfile.objects.using(using).bulk_update(stale, ["location_key"])
+
+            last_pk = profiles[-1].pk
+            checked += len(profiles)
+            updated += len(stale)
+            self.stdout.write(f"Checked {checked} profiles, updated {updated}")
+
+        install_search_index(using)
+        rebuild_search_index(using)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Done: {updated} of {checked} location keys updated, "
+                "search index rebuilt"
+            )
+        )
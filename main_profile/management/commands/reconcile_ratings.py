@@ -0,0 +1,78 @@
+"""
+Management command that repairs the rating counters on user profiles
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from main_profile.cache import invalidate_profile
+from main_profile.models import Rating, UserProfile
+
+
+class Command(BaseCommand):
+    """
+    Recomputes the rating histogram, count, sum and average of every
+    profile from the Rating table, one chunk of profiles at a time
+    """
+
+    help = "Reconcile profile rating counters against the Rating table"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=500,
+            help="Number of profiles locked and repaired per transaction",
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        last_pk = 0
+        checked = repaired = 0
+
+        while True:
+            with transaction.atomic():
+                # Locking the chunk makes concurrent rating writes wait
+                # until the repaired counters are committed, after which
+                # their increments apply on top of the correct values.
+                # pylint: disable=E1101
+                profiles = list(
+                    UserProfile.objects.select_for_update()
+                    .filter(pk__gt=last_pk)
+                    .order_by("pk")[:chunk_size]
+                )
+                if not profiles:
+                    break
+
+                histograms = {profile.user_id: {} for profile in profiles}
+                for row in (
+                    Rating.objects.filter(rated_user_id__in=list(histograms))
+                    .values("rated_user_id", "rating")
+                    .annotate(count=Count("id"))
+                ):
+                    histograms[row["rated_user_id"]][row["rating"]] = row["count"]
+
+                stale = []
+                for profile in profiles:
+                    before = [getattr(profile, f) for f in UserProfile.RATING_FIELDS]
+                    profile.set_rating_histogram(histograms[profile.user_id])
+                    after = [getattr(profile, f) for f in UserProfile.RATING_FIELDS]
+                    if before != after:
+                        profile.updated_at = timezone.now()
+                        stale.append(profile)
+
+                UserProfile.objects.bulk_update(
+                    stale, UserProfile.RATING_FIELDS + ["updated_at"]
+                )
+                for profile in stale:
+                    invalidate_profile(profile.user_id)
+
+            last_pk = profiles[-1].pk
+            checked += len(profiles)
+            repaired += len(stale)
+            self.stdout.write(f"Checked {checked} profiles, repaired {repaired}")
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Done: {repaired} of {checked} profiles repaired")
+        )
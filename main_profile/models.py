@@ -1,9 +1,94 @@
 """
 Models for the profile app
 """
-from users_accounts.models import UserAccount
+import uuid
+from functools import partial
+
+from realtinger.metrics import histogram
+from users_account.models import UserAccount
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+from django.utils import timezone
+
+from .storage import ContentAddressedStorage
+
+rating_update_seconds = histogram(
+    "rating_update_seconds",
+    "Time to fold a new rating into a profile's counters",
+)
+
+
+def normalize_location(location):
+    """
+    Case- and whitespace-insensitive form of a location
+    """
+    return " ".join((location or "").split()).lower()
+
+
+class ImageBlob(models.Model):
+    """
+    Number of profiles using a content-addressed image file, see storage.py
+    """
+
+    name = models.CharField(max_length=255, unique=True)
+    # 0 once the last profile let go of the file, until
+    # delete_unreferenced() deletes the file and the row together
+    refcount = models.PositiveIntegerField(default=0)
+
+    @classmethod
+    def lock(cls, name):
+        """
+        Locks the row of the file called name, if there is one, until the
+        transaction ends, so the file is not deleted while an upload of the
+        same content starts using it
+        """
+        # pylint: disable=E1101
+        list(cls.objects.select_for_update().filter(name=name).values_list("pk"))
+
+    @classmethod
+    def retain(cls, name):
+        """
+        Counts one more profile using the file called name
+        """
+        # The UPDATE locks the row like select_for_update() would, and
+        # brings a row at 0 back into use before its file is deleted
+        # pylint: disable=E1101
+        if cls.objects.filter(name=name).update(refcount=F("refcount") + 1):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(name=name, refcount=1)
+        except IntegrityError:
+            # Another upload of the same content created it first
+            cls.objects.filter(name=name).update(refcount=F("refcount") + 1)
+
+    @classmethod
+    def release(cls, name):
+        """
+        Counts one profile fewer using the file called name, and deletes
+        the file once the last one has gone and the transaction commits
+        """
+        # The UPDATE locks the row like select_for_update() would. Checking
+        # the new count would take another query, so delete_unreferenced()
+        # always runs and checks it under its own lock.
+        # pylint: disable=E1101
+        cls.objects.filter(name=name, refcount__gt=0).update(refcount=F("refcount") - 1)
+        transaction.on_commit(partial(cls.delete_unreferenced, name))
+
+    @classmethod
+    def delete_unreferenced(cls, name):
+        """
+        Deletes a file and its row if no profile uses it any more. Uploads
+        lock the row before storing the file (see storage.py), and the
+        DELETE waits for that lock and then checks the count again, so an
+        upload that is not committed yet is never missed.
+        """
+        with transaction.atomic():
+            # pylint: disable=E1101
+            if cls.objects.filter(name=name, refcount=0).delete()[0]:
+                UserProfile.image_storage.delete(name)
 
 
 class SocialLinks(models.Model):
@@ -43,28 +128,192 @@ class UserProfile(models.Model):
     contact_number = models.CharField(max_length=20, blank=True, null=True)
     description = models.TextField(blank=True, null=True)
     location = models.CharField(max_length=255, blank=True, null=True)
+    # Normalized copy of location used for filtering, see normalize_location
+    location_key = models.CharField(max_length=255, blank=True, editable=False)
     website = models.URLField(blank=True, null=True)
     average_rating = models.FloatField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_1_count = models.PositiveIntegerField(default=0)
+    rating_2_count = models.PositiveIntegerField(default=0)
+    rating_3_count = models.PositiveIntegerField(default=0)
+    rating_4_count = models.PositiveIntegerField(default=0)
+    rating_5_count = models.PositiveIntegerField(default=0)
+    # Moves on every change to the profile, its social links or its
+    # ratings, and validates conditional GETs of all three
+    updated_at = models.DateTimeField(default=timezone.now, editable=False)
+
+    STARS = range(1, 6)
+    HISTOGRAM_FIELDS = [f"rating_{star}_count" for star in STARS]
+    RATING_FIELDS = ["average_rating", "rating_count", "rating_sum"] + HISTOGRAM_FIELDS
+
+    @classmethod
+    def add_rating(cls, user_id, rating):
+        """
+        Folds a new rating into the counters of the profile owned by
+        user_id with a single UPDATE, so concurrent ratings never
+        overwrite each other. Must run in the same transaction as the
+        rating insert. Returns the number of profiles updated.
+        """
+        star_field = f"rating_{rating}_count"
+        # Every right-hand side reads the pre-update row, so the average
+        # is computed from the same sum and count that are being written.
+        with rating_update_seconds.time():
+            # pylint: disable=E1101
+            return cls.objects.filter(user_id=user_id).update(
+                rating_count=F("rating_count") + 1,
+                rating_sum=F("rating_sum") + rating,
+                average_rating=Cast(F("rating_sum") + rating, FloatField())
+                / (F("rating_count") + 1),
+                **{star_field: F(star_field) + 1},
+                updated_at=timezone.now(),
+            )
+
+    @classmethod
+    def remove_ratings(cls, user_id, histogram):
+        """
+        Takes ratings, given as a {star: count} mapping, out of the
+        counters of the profile owned by user_id with a single UPDATE, as
+        add_rating() adds one. Must run in the same transaction as the
+        rating delete. Returns the number of profiles updated.
+        """
+        count = sum(histogram.values())
+        total = sum(star * stars for star, stars in histogram.items())
+        # pylint: disable=E1101
+        return cls.objects.filter(user_id=user_id).update(
+            rating_count=F("rating_count") - count,
+            rating_sum=F("rating_sum") - total,
+            # 0 once the last rating is gone
+            average_rating=Coalesce(
+                Cast(F("rating_sum") - total, FloatField())
+                / NullIf(F("rating_count") - count, 0),
+                Value(0.0),
+            ),
+            **{
+                f"rating_{star}_count": F(f"rating_{star}_count") - stars
+                for star, stars in histogram.items()
+            },
+            updated_at=timezone.now(),
+        )
+
+    @classmethod
+    def touch(cls, user_id):
+        """
+        Marks the profile owned by user_id as changed, for changes to rows
+        that hang off it
+        """
+        # pylint: disable=E1101
+        return cls.objects.filter(user_id=user_id).update(updated_at=timezone.now())
 
-    def update_average_rating(self):
-        ratings = Rating.objects.filter(rated_user=self.user)
-        count = ratings.count()
+    def update_average_rating(self, rating):
+        """
+        Records a new rating on this profile and refreshes the
+        rating fields from the database
+        """
+        UserProfile.add_rating(self.user_id, rating)
+        self.refresh_from_db(fields=self.RATING_FIELDS)
 
-        if count == 0:
-            self.average_rating = 0
-        else:
-            total_rating = sum([rating.rating for rating in ratings])
-            self.average_rating = total_rating / count
+    def set_rating_histogram(self, histogram):
+        """
+        Overwrites the rating counters from a {star: count} mapping,
+        used when reconciling them against the Rating table
+        """
+        for star in self.STARS:
+            setattr(self, f"rating_{star}_count", histogram.get(star, 0))
+        self.rating_count = sum(histogram.values())
+        self.rating_sum = sum(star * count for star, count in histogram.items())
+        self.average_rating = (
+            self.rating_sum / self.rating_count if self.rating_count else 0
+        )
 
-        self.save()
+    @property
+    def rating_histogram(self):
+        """
+        Number of ratings per star, keyed by the star as a string
+        """
+        return {str(star): getattr(self, f"rating_{star}_count") for star in self.STARS}
 
+    image_storage = ContentAddressedStorage()
+    # Named after a hash of its content and shared by identical uploads
     profile_image = models.ImageField(
-        upload_to="profile_images/", blank=True, null=True
+        upload_to="profile_images/", storage=image_storage, blank=True, null=True
     )
+    # {size: {format: storage name}} of the resized copies, see images.py
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     social_media_accounts = models.ManyToManyField(
         SocialLinks, related_name="social_profiles"
     )
 
+    # pylint: disable=R0903
+    class Meta:
+        """
+        Meta class
+        """
+
+        indexes = [
+            # Serve the broker search, sorted by rating with or without a
+            # location filter and paginated on (average_rating, id)
+            models.Index(
+                fields=["location_key", "average_rating", "id"],
+                name="profile_location_rating_idx",
+            ),
+            models.Index(fields=["average_rating", "id"], name="profile_rating_idx"),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembers which image file the row points to, see save()
+        if "profile_image" in field_names:
+            instance.stored_image = values[field_names.index("profile_image")]
+        return instance
+
+    def save(self, *args, **kwargs):
+        self.location_key = normalize_location(self.location)
+        self.updated_at = timezone.now()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            update_fields = {*update_fields, "updated_at"}
+            if "location" in update_fields:
+                update_fields.add("location_key")
+            kwargs["update_fields"] = update_fields
+        track_image = update_fields is None or "profile_image" in update_fields
+        if track_image:
+            stored = self.get_stored_image()
+        super().save(*args, **kwargs)
+        if track_image:
+            self.count_image_references(stored)
+
+    def get_stored_image(self):
+        """
+        Name of the image file the row currently points to, or None
+        """
+        if hasattr(self, "stored_image"):
+            return self.stored_image
+        if self._state.adding:
+            return None
+        # Loaded with profile_image deferred
+        # pylint: disable=E1101
+        return (
+            UserProfile.objects.filter(pk=self.pk)
+            .values_list("profile_image", flat=True)
+            .first()
+        )
+
+    def count_image_references(self, stored):
+        """
+        Moves this profile's reference from the image file the row pointed
+        to onto the one it points to now
+        """
+        image = self.profile_image.name or None
+        stored = stored or None
+        if image != stored:
+            if image:
+                ImageBlob.retain(image)
+            if stored:
+                ImageBlob.release(stored)
+        self.stored_image = image
+
 
 class Rating(models.Model):
     user = models.ForeignKey(UserAccount, on_delete=models.CASCADE)
@@ -77,5 +326,71 @@ class Rating(models.Model):
     comment = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # pylint: disable=R0903
+    class Meta:
+        """
+        Meta class
+        """
+
+        indexes = [
+            # Serves the keyset-paginated ratings list of a user
+            models.Index(
+                fields=["rated_user", "created_at", "id"],
+                name="rating_rated_user_created_idx",
+            ),
+        ]
+
     def __str__(self):
         return f"{self.user.username} -> {self.rated_user.username}"
+
+
+class LeaderboardEntry(models.Model):
+    """
+    One of the top rated brokers of a location, see leaderboard.py
+    """
+
+    location_key = models.CharField(max_length=255)
+    profile = models.OneToOneField(
+        UserProfile, related_name="leaderboard_entry", on_delete=models.CASCADE
+    )
+    score = models.FloatField()
+
+    # pylint: disable=R0903
+    class Meta:
+        """
+        Meta class
+        """
+
+        indexes = [
+            # Reads a location's board in rank order
+            models.Index(
+                fields=["location_key", "-score", "-profile"],
+                name="leaderboard_location_rank_idx",
+            ),
+        ]
+
+
+class UploadSession(models.Model):
+    """
+    A resumable profile image upload in progress, see uploads.py
+    """
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        UserAccount, related_name="upload_sessions", on_delete=models.CASCADE
+    )
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    # pylint: disable=R0903
+    class Meta:
+        """
+        Meta class
+        """
+
+        indexes = [
+            # Finds the sessions to purge
+            models.Index(fields=["expires_at"], name="upload_session_expiry_idx"),
+        ]
@@ -0,0 +1,152 @@
+"""
+Pagination for the profile app
+"""
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination that seeks past the last row of the previous page
+    instead of counting an offset, so every page costs one index range
+    scan however deep it is. The last ordering field must be unique.
+    """
+
+    ordering = ("-created_at", "-id")
+    page_size = 20
+    max_page_size = 100
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    invalid_cursor_message = "Invalid cursor"
+
+    def __init__(self, ordering=None):
+        if ordering is not None:
+            self.ordering = tuple(ordering)
+        self.fields = [field.lstrip("-") for field in self.ordering]
+        self.next_position = None
+        self.request = None
+        self.page_size_requested = self.page_size
+
+    def get_page_size(self, request):
+        """
+        Reads the requested page size, capped at max_page_size
+        """
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def encode_cursor(self, position):
+        """
+        Turns the ordering values of a row into an opaque token
+        """
+        payload = json.dumps(position, default=str, separators=(",", ":"))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+    def decode_cursor(self, queryset, token):
+        """
+        Turns a token back into typed ordering values
+        """
+        try:
+            padded = token + "=" * (-len(token) % 4)
+            position = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            if not isinstance(position, list) or len(position) != len(self.fields):
+                raise ValueError(token)
+            # pylint: disable=W0212
+            return [
+                queryset.model._meta.get_field(field).to_python(value)
+                for field, value in zip(self.fields, position)
+            ]
+        except (ValueError, TypeError, ValidationError) as exception:
+            raise NotFound(self.invalid_cursor_message) from exception
+
+    def seek_filter(self, position):
+        """
+        Builds the row-value comparison (a, b) > (x, y) as nested Q objects,
+        led by a >= bound on a alone. The OR of the comparison is not an
+        index range on its own, so without that bound the database would
+        still step through every row before the cursor.
+        """
+        condition = Q()
+        for index, field in enumerate(self.ordering):
+            name = field.lstrip("-")
+            lookup = "lt" if field.startswith("-") else "gt"
+            step = Q(**{f"{name}__{lookup}": position[index]})
+            for previous, value in zip(self.fields[:index], position[:index]):
+                step &= Q(**{previous: value})
+            condition |= step
+        first = self.ordering[0]
+        bound = "lte" if first.startswith("-") else "gte"
+        return Q(**{f"{self.fields[0]}__{bound}": position[0]}) & condition
+
+    def page_queryset(self, queryset, request):
+        """
+        The rows of the requested page plus one, which tells whether there
+        is a next page
+        """
+        self.request = request
+        self.page_size_requested = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        token = request.query_params.get(self.cursor_query_param)
+        if token:
+            queryset = queryset.filter(
+                self.seek_filter(self.decode_cursor(queryset, token))
+            )
+        return queryset[: self.page_size_requested + 1]
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.cut_page(list(self.page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        paginate_queryset() for async views
+        """
+        queryset = self.page_queryset(queryset, request)
+        return self.cut_page([row async for row in queryset])
+
+    def cut_page(self, rows):
+        """
+        Drops the extra row fetched by page_queryset(), remembering where
+        the next page starts
+        """
+        page_size = self.page_size_requested
+        page, extra = rows[:page_size], rows[page_size:]
+        if extra:
+            last = page[-1]
+            self.next_position = [
+                getattr(last, field) if not isinstance(last, dict) else last[field]
+                for field in self.fields
+            ]
+        else:
+            self.next_position = None
+        return page
+
+    def get_next_link(self):
+        """
+        Absolute URL of the following page, or None on the last page
+        """
+        if self.next_position is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(self.next_position),
+        )
+
+    def get_paginated_data(self, data):
+        """
+        Body of the response for a page of serialized rows
+        """
+        return {"next": self.get_next_link(), "results": data}
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
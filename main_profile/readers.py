@@ -0,0 +1,143 @@
+"""
+Read-only serialization straight from .values() rows.
+
+A ModelSerializer builds its output by deep-copying its fields for every
+call and reading each attribute of a model instance, which is most of the
+cost of a profile or ratings GET. A ValuesReader is compiled once from a
+serializer class, keeping its keys in order with one converter per key
+(the field's own to_representation for plain fields), and turns rows
+fetched with .values(*reader.columns) into the same dicts serializer.data
+holds when the serializer has no request in its context.
+
+Only GETs use readers; writes and validation go through the serializers.
+"""
+from functools import partial
+
+from rest_framework import serializers
+
+from .models import SocialLinks
+from .serializers import (
+    RatingSerializer,
+    SocialLinksSerializer,
+    UserProfileserializer,
+    variant_urls,
+)
+
+
+def file_url(storage, name):
+    """
+    What a FileField renders for a stored file name without a request
+    """
+    return storage.url(name) if name else None
+
+
+class ValuesReader:
+    """
+    Turns .values() rows into the output of a serializer class. Keys that
+    do not map to a single column are given in extra as key: (column,
+    convert), with a column of None for keys the caller fills in itself.
+    """
+
+    def __init__(self, serializer_class, extra=None):
+        extra = extra or {}
+        # pylint: disable=W0212
+        model_fields = serializer_class.Meta.model._meta
+        self.fields = []
+        for key, field in serializer_class().fields.items():
+            if key in extra:
+                column, convert = extra[key]
+            elif isinstance(field, serializers.BaseSerializer):
+                raise TypeError(f"Nested serializer {key} needs an extra entry")
+            elif isinstance(field, serializers.RelatedField):
+                # .values() gives the primary key, which is what is rendered
+                column, convert = field.source, None
+            elif isinstance(field, serializers.FileField):
+                storage = model_fields.get_field(field.source).storage
+                column, convert = field.source, partial(file_url, storage)
+            else:
+                column, convert = field.source, field.to_representation
+            self.fields.append((key, column, convert))
+        self.columns = [column for _, column, _ in self.fields if column is not None]
+
+    def read(self, row):
+        """
+        Output of the serializer for one row
+        """
+        data = {}
+        for key, column, convert in self.fields:
+            if column is None:
+                data[key] = None
+                continue
+            value = row[column]
+            if convert is not None and value is not None:
+                value = convert(value)
+            data[key] = value
+        return data
+
+
+rating_reader = ValuesReader(RatingSerializer)
+social_links_reader = ValuesReader(SocialLinksSerializer)
+profile_reader = ValuesReader(
+    UserProfileserializer,
+    extra={
+        "social_media_accounts": (None, None),
+        "profile_image_variants": ("image_variants", variant_urls),
+    },
+)
+
+
+def read_ratings(rows):
+    """
+    Output of RatingSerializer(many=True) for rows fetched with
+    .values(*rating_reader.columns)
+    """
+    return [rating_reader.read(row) for row in rows]
+
+
+def social_link_rows(profiles):
+    """
+    Rows of the social links of the profiles read from rows, oldest first
+    """
+    # pylint: disable=E1101
+    return (
+        SocialLinks.objects.filter(
+            social_profiles__in=[profile["id"] for profile in profiles]
+        )
+        .order_by("id")
+        .values("social_profiles", *social_links_reader.columns)
+    )
+
+
+def attach_social_links(profiles, link_rows):
+    """
+    Sets social_media_accounts on profiles from their social_link_rows()
+    """
+    links = {profile["id"]: [] for profile in profiles}
+    for row in link_rows:
+        links[row["social_profiles"]].append(social_links_reader.read(row))
+    for profile in profiles:
+        profile["social_media_accounts"] = links[profile["id"]]
+    return profiles
+
+
+def read_profiles(rows):
+    """
+    Output of UserProfileserializer(many=True) for rows fetched with
+    .values(*profile_reader.columns), with the social links of all of
+    them loaded in one more query
+    """
+    profiles = [profile_reader.read(row) for row in rows]
+    if not profiles:
+        return profiles
+    return attach_social_links(profiles, social_link_rows(profiles))
+
+
+async def aread_profiles(rows):
+    """
+    read_profiles() for async views
+    """
+    profiles = [profile_reader.read(row) for row in rows]
+    if not profiles:
+        return profiles
+    link_rows = [row async for row in social_link_rows(profiles)]
+    return attach_social_links(profiles, link_rows)
@@ -0,0 +1,158 @@
+"""
+Full-text search over profile names and descriptions.
+
+On Postgres the text is matched through an expression GIN index on its
+tsvector. On SQLite an FTS5 table mirrors the indexed columns and is kept
+in sync by triggers. Other backends, or SQLite builds without FTS5, fall
+back to case-insensitive substring matching.
+"""
+import sqlite3
+from functools import lru_cache
+
+from django.db import connections
+from django.db.models import BooleanField, Q
+from django.db.models.expressions import RawSQL
+
+from .models import UserProfile
+
+# pylint: disable=W0212
+TABLE = UserProfile._meta.db_table
+FTS_TABLE = f"{TABLE}_fts"
+SEARCH_FIELDS = ["firstname", "lastname", "description"]
+GIN_INDEX = "profile_search_gin_idx"
+
+
+def tsvector(table=None):
+    """
+    The tsvector expression the GIN index is built on. Queries must use
+    the same expression, optionally table-qualified, to hit the index.
+    """
+    prefix = f'"{table}".' if table else ""
+    columns = " || ' ' || ".join(
+        f"coalesce({prefix}\"{field}\", '')" for field in SEARCH_FIELDS
+    )
+    return f"to_tsvector('simple', {columns})"
+
+
+@lru_cache(maxsize=None)
+def sqlite_has_fts5():
+    """
+    Whether the SQLite library Python links against includes FTS5
+    """
+    try:
+        sqlite3.connect(":memory:").execute("CREATE VIRTUAL TABLE t USING fts5(x)")
+    except sqlite3.OperationalError:
+        return False
+    return True
+
+
+def fts_enabled(connection):
+    """
+    Whether searches on a connection go through a full-text index
+    """
+    if connection.vendor == "postgresql":
+        return True
+    return connection.vendor == "sqlite" and sqlite_has_fts5()
+
+
+def install_search_index(using="default"):
+    """
+    Creates the full-text index of a database if it is missing
+    """
+    connection = connections[using]
+    if not fts_enabled(connection):
+        return
+
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS "{GIN_INDEX}" '
+                f'ON "{TABLE}" USING gin (({tsvector()}))'
+            )
+            return
+
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+            [FTS_TABLE],
+        )
+        if cursor.fetchone():
+            return
+
+        columns = ", ".join(SEARCH_FIELDS)
+        new = ", ".join(f"new.{field}" for field in SEARCH_FIELDS)
+        old = ", ".join(f"old.{field}" for field in SEARCH_FIELDS)
+        cursor.execute(
+            f'CREATE VIRTUAL TABLE "{FTS_TABLE}" USING fts5('
+            f"{columns}, content='{TABLE}', content_rowid='id')"
+        )
+        cursor.execute(
+            f'CREATE TRIGGER "{FTS_TABLE}_ai" AFTER INSERT ON "{TABLE}" BEGIN '
+            f'INSERT INTO "{FTS_TABLE}"(rowid, {columns}) VALUES (new.id, {new}); '
+            "END"
+        )
+        cursor.execute(
+            f'CREATE TRIGGER "{FTS_TABLE}_ad" AFTER DELETE ON "{TABLE}" BEGIN '
+            f'INSERT INTO "{FTS_TABLE}"("{FTS_TABLE}", rowid, {columns}) '
+            f"VALUES ('delete', old.id, {old}); "
+            "END"
+        )
+        # Only text changes touch the index, not the rating counter updates
+        cursor.execute(
+            f'CREATE TRIGGER "{FTS_TABLE}_au" AFTER UPDATE OF {columns} '
+            f'ON "{TABLE}" BEGIN '
+            f'INSERT INTO "{FTS_TABLE}"("{FTS_TABLE}", rowid, {columns}) '
+            f"VALUES ('delete', old.id, {old}); "
+            f'INSERT INTO "{FTS_TABLE}"(rowid, {columns}) VALUES (new.id, {new}); '
+            "END"
+        )
+        rebuild_search_index(using)
+
+
+def rebuild_search_index(using="default"):
+    """
+    Repopulates the SQLite FTS5 table from the profiles table. Postgres
+    indexes need no rebuild.
+    """
+    connection = connections[using]
+    if connection.vendor == "sqlite" and fts_enabled(connection):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO "{FTS_TABLE}"("{FTS_TABLE}") VALUES (\'rebuild\')'
+            )
+
+
+def fts5_query(text):
+    """
+    Turns free text into an FTS5 query matching every word, with the
+    words quoted so user input cannot inject query syntax
+    """
+    return " ".join('"' + word.replace('"', '""') + '"' for word in text.split())
+
+
+def text_filter(text, using="default"):
+    """
+    Filter matching profiles whose name or description contains every
+    word of text
+    """
+    connection = connections[using]
+    if connection.vendor == "postgresql":
+        return RawSQL(
+            f"{tsvector(TABLE)} @@ plainto_tsquery('simple', %s)",
+            [text],
+            output_field=BooleanField(),
+        )
+    if fts_enabled(connection):
+        return RawSQL(
+            f'"{TABLE}"."id" IN (SELECT rowid FROM "{FTS_TABLE}" '
+            f'WHERE "{FTS_TABLE}" MATCH %s)',
+            [fts5_query(text)],
+            output_field=BooleanField(),
+        )
+
+    condition = Q()
+    for word in text.split():
+        condition &= Q(
+            *[Q(**{f"{field}__icontains": word}) for field in SEARCH_FIELDS],
+            _connector=Q.OR,
+        )
+    return condition
@@ -1,10 +1,22 @@
 """
 Serializer for the user profile
 """
+from django.core.files.storage import default_storage
 from rest_framework import serializers
 from .models import UserProfile, SocialLinks, Rating
 
 
+def variant_urls(image_variants):
+    """
+    URLs of the resized copies of a profile image by size and format, from
+    the storage names in UserProfile.image_variants
+    """
+    return {
+        size: {fmt: default_storage.url(name) for fmt, name in formats.items()}
+        for size, formats in image_variants.items()
+    }
+
+
 class SocialLinksSerializer(serializers.ModelSerializer):
     """
     Serializer for SocialLinks model.
@@ -40,6 +52,7 @@ class RatingSerializer(serializers.ModelSerializer):
 
         model = Rating
         fields = "__all__"
+        read_only_fields = ["user", "rated_user"]
 
 
 class UserProfileserializer(serializers.ModelSerializer):
@@ -48,6 +61,7 @@ class UserProfileserializer(serializers.ModelSerializer):
     """
 
     social_media_accounts = SocialLinksSerializer(many=True, read_only=True)
+    profile_image_variants = serializers.SerializerMethodField()
 
     class Meta:
         """
@@ -55,7 +69,15 @@ class UserProfileserializer(serializers.ModelSerializer):
         """
 
         model = UserProfile
-        fields = "__all__"
+        exclude = ["location_key", "image_variants"]
+        read_only_fields = ["user"] + UserProfile.RATING_FIELDS
+
+    def get_profile_image_variants(self, profile):
+        """
+        URLs of the resized copies of the profile image by size and format,
+        empty until they have been rendered
+        """
+        return variant_urls(profile.image_variants)
 
     def validate(self, attrs):
         """
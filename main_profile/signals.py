@@ -0,0 +1,63 @@
+"""
+Signal handlers for the profile app
+"""
+from functools import partial
+
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.signals import post_delete, pre_delete
+from django.dispatch import receiver
+
+from users_account.models import UserAccount
+from . import images, leaderboard, uploads
+from .cache import invalidate_profile
+from .models import ImageBlob, Rating, UploadSession, UserProfile
+
+
+# pylint: disable=W0613
+@receiver(post_delete, sender=UserProfile)
+def release_deleted_image(sender, instance, **kwargs):
+    """
+    Drops the reference a deleted profile, including one deleted along
+    with its user, held on its image file, and deletes the resized copies
+    of the image once the deletion commits
+    """
+    if instance.profile_image:
+        ImageBlob.release(instance.profile_image.name)
+    variants = images.variant_names(instance.image_variants)
+    if variants:
+        transaction.on_commit(partial(images.delete_variants, variants))
+
+
+# pylint: disable=W0613
+@receiver(pre_delete, sender=UserAccount)
+def remove_deleted_raters_ratings(sender, instance, **kwargs):
+    """
+    Takes the ratings a deleted user gave out of the counters of the
+    profiles they rated, which the database cascade deleting the ratings
+    leaves alone, and marks those profiles as changed
+    """
+    histograms = {}
+    # pylint: disable=E1101
+    for row in (
+        Rating.objects.filter(user_id=instance.pk)
+        .exclude(rated_user_id=instance.pk)
+        .values("rated_user_id", "rating")
+        .annotate(count=Count("id"))
+        .order_by()
+    ):
+        histograms.setdefault(row["rated_user_id"], {})[row["rating"]] = row["count"]
+    for rated_user_id, histogram in histograms.items():
+        UserProfile.remove_ratings(rated_user_id, histogram)
+        leaderboard.update_broker(rated_user_id)
+        invalidate_profile(rated_user_id)
+
+
+# pylint: disable=W0613
+@receiver(post_delete, sender=UploadSession)
+def discard_deleted_upload(sender, instance, **kwargs):
+    """
+    Deletes the chunks received by an upload session that was finalized,
+    expired or deleted along with its user
+    """
+    uploads.discard(instance)
@@ -0,0 +1,85 @@
+"""
+Content-addressed storage for profile images.
+
+Files are named after the SHA-256 of their content, so uploading an image
+that is already stored reuses the existing file and its URL never changes
+for as long as it exists, which lets the web server serve the whole
+prefix with immutable cache headers. The digest is computed while the
+upload is streamed to disk, never by reading the file into memory.
+
+Files can be shared by several profiles; ImageBlob in models.py counts
+the profiles using each one so it is deleted with the last of them.
+"""
+import hashlib
+import os
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.utils.deconstruct import deconstructible
+
+
+def content_name(directory, digest, extension):
+    """
+    Storage name of the file with a given digest. The first two hex digits
+    become a subdirectory so no single directory grows too large.
+    """
+    return f"{directory}/{digest[:2]}/{digest}{extension.lower()}"
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage that ignores the name a file is saved under,
+    except for its directory and extension, and names it after its
+    content instead
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # A name taken by the same content is the right name to return
+        return name
+
+    def _save(self, name, content):
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1]
+        os.makedirs(self.path(directory), exist_ok=True)
+
+        # Uploads spooled to a temporary file usually live on another file
+        # system, where moving them would be a copy anyway
+        digest = hashlib.sha256()
+        handle, source = tempfile.mkstemp(dir=self.path(directory), suffix=".part")
+        try:
+            with os.fdopen(handle, "wb") as part:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    part.write(chunk)
+            final = content_name(directory, digest.hexdigest(), extension)
+            return self.store(source, final)
+        finally:
+            if os.path.exists(source):
+                os.remove(source)
+
+    def store(self, source, name):
+        """
+        Moves the local file at source, on the same file system, in place
+        as name and returns name. Call it in the transaction that goes on
+        to count the file as used.
+
+        The ImageBlob row of name stays locked until that transaction ends,
+        so a deletion of the last copy in use waits for it and then finds
+        the file used again. The file is replaced even when identical
+        content is already stored, as that copy may be one whose deletion
+        committed just before the lock was taken.
+        """
+        # pylint: disable=C0415
+        from .models import ImageBlob
+
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with transaction.atomic():
+            ImageBlob.lock(name)
+            # Atomic, so readers of the stored copy never see a partial file
+            os.replace(source, path)
+        if self.file_permissions_mode is not None:
+            os.chmod(path, self.file_permissions_mode)
+        return name
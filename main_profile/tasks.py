@@ -0,0 +1,57 @@
+"""
+Background tasks for the profile app
+"""
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from jobs.tasks import task
+from . import images
+from .cache import bump_version
+from .models import UserProfile
+
+
+@task("render_profile_image")
+def render_profile_image(profile_id, user_id, name, stale=()):
+    """
+    Stores the resized copies of a profile image and records them on the
+    profile, unless the image was replaced in the meantime. Copies of the
+    image it replaced, listed in stale, are deleted.
+    """
+    with default_storage.open(name) as source:
+        data = source.read()
+    variants = images.render(
+        data,
+        settings.PROFILE_IMAGE_SIZES,
+        settings.PROFILE_IMAGE_QUALITY,
+        settings.PROFILE_IMAGE_WORKERS,
+    )
+
+    stem = os.path.splitext(os.path.basename(name))[0]
+    stored = {}
+    updated = False
+    try:
+        for size, formats in variants.items():
+            copies = stored[str(size)] = {}
+            for fmt, content in formats.items():
+                copies[fmt] = default_storage.save(
+                    f"{settings.PROFILE_IMAGE_VARIANTS_DIR}/{stem}_{size}."
+                    f"{images.EXTENSIONS[fmt]}",
+                    ContentFile(content),
+                )
+
+        # pylint: disable=E1101
+        updated = UserProfile.objects.filter(
+            pk=profile_id, profile_image=name
+        ).update(image_variants=stored, updated_at=timezone.now())
+    finally:
+        # Nothing points at the copies unless the profile was updated,
+        # including when saving a copy failed and the job will run again
+        if not updated:
+            images.delete_variants(images.variant_names(stored))
+    if updated:
+        bump_version(user_id)
+    images.delete_variants(stale)
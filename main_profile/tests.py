@@ -1,3 +1,1358 @@
-from django.test import TestCase
+"""
+Tests for the profile app
+"""
+import hashlib
+import importlib
+import os
+import random
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import OperationalError, connections
+from django.test import override_settings
+from django.urls import clear_url_caches, reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from PIL import Image
+from rest_framework.test import APITestCase
+
+from jobs.worker import Worker
+
+from realtinger import routers
+from realtinger import urls as project_urls
+from realtinger.testing import QueryBudgetTestMixin, SharedCacheTestMixin
+from users_account.authentication import token_cache
+from users_account.models import UserAccount
+from . import cache as profile_cache
+from . import images, leaderboard, readers, uploads
+from . import urls as profile_urls
+from .models import (
+    ImageBlob,
+    LeaderboardEntry,
+    Rating,
+    SocialLinks,
+    UploadSession,
+    UserProfile,
+)
+from .pagination import KeysetPagination
+from .serializers import RatingSerializer, SocialLinksSerializer, UserProfileserializer
+
+
+class ProfileTestCase(SharedCacheTestMixin, QueryBudgetTestMixin, APITestCase):
+    """
+    Creates a broker with a profile and a few buyers to rate them, with a
+    cache shared between processes
+    """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        token_cache.clear()
+        self.broker = UserAccount.objects.create_user(
+            email="broker@example.com",
+            password="pass1234",
+            username="broker",
+            user_type=UserAccount.LAND_BROKER,
+            is_verified=True,
+        )
+        # pylint: disable=E1101
+        self.profile = UserProfile.objects.create(
+            user=self.broker, firstname="Ada", lastname="Broker", location="Lagos"
+        )
+        self.buyers = [
+            UserAccount.objects.create_user(
+                email=f"buyer{i}@example.com",
+                password="pass1234",
+                username=f"buyer{i}",
+                is_verified=True,
+            )
+            for i in range(3)
+        ]
+
+    def rate(self, buyer, rating, broker=None):
+        """
+        Posts a rating for the broker as the given buyer
+        """
+        broker = broker or self.broker
+        self.client.force_authenticate(user=buyer)
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                reverse("user_profile:ratings", args=[broker.pk]),
+                {"rating": rating, "comment": "ok"},
+            )
+
+
+class RatingAggregateTests(ProfileTestCase):
+    """
+    Tests for the incremental rating counters
+    """
+
+    def test_ratings_update_counters(self):
+        for buyer, rating in zip(self.buyers, [5, 4, 2]):
+            response = self.rate(buyer, rating)
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.rating_count, 3)
+        self.assertEqual(self.profile.rating_sum, 11)
+        self.assertAlmostEqual(self.profile.average_rating, 11 / 3)
+
+    def test_rating_user_without_profile_is_rolled_back(self):
+        other = UserAccount.objects.create_user(
+            email="noprofile@example.com", password="pass1234", username="noprofile"
+        )
+        response = self.rate(self.buyers[0], 5, broker=other)
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        # pylint: disable=E1101
+        self.assertFalse(Rating.objects.filter(rated_user=other).exists())
+
+    def test_rating_fields_are_read_only(self):
+        self.client.force_authenticate(user=self.broker)
+        self.client.put(
+            reverse("user_profile:user_profile", args=[self.broker.pk]),
+            {"average_rating": 5, "rating_count": 100},
+        )
+
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.average_rating, 0)
+        self.assertEqual(self.profile.rating_count, 0)
+
+    def test_deleting_a_rater_takes_their_rating_out(self):
+        url = reverse("user_profile:user_profile", args=[self.broker.pk])
+        self.rate(self.buyers[0], 5)
+        self.rate(self.buyers[1], 2)
+        etag = self.client.get(url).headers["ETag"]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.buyers[0].delete()
+
+        self.profile.refresh_from_db()
+        self.assertEqual((self.profile.rating_count, self.profile.rating_sum), (1, 2))
+        self.assertEqual(self.profile.average_rating, 2)
+        self.assertEqual(self.profile.rating_histogram["5"], 0)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["rating_count"], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.buyers[1].delete()
+        self.profile.refresh_from_db()
+        self.assertEqual(
+            (self.profile.rating_count, self.profile.average_rating), (0, 0)
+        )
+        # pylint: disable=E1101
+        self.assertFalse(LeaderboardEntry.objects.filter(profile=self.profile).exists())
+
+    def test_reconcile_command_repairs_counters(self):
+        for buyer, rating in zip(self.buyers, [5, 3, 1]):
+            # pylint: disable=E1101
+            Rating.objects.create(user=buyer, rated_user=self.broker, rating=rating)
+
+        out = StringIO()
+        call_command("reconcile_ratings", chunk_size=1, stdout=out)
+
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.rating_count, 3)
+        self.assertEqual(self.profile.rating_sum, 9)
+        self.assertEqual(self.profile.average_rating, 3)
+        self.assertEqual(
+            self.profile.rating_histogram, {"1": 1, "2": 0, "3": 1, "4": 0, "5": 1}
+        )
+        self.assertIn("1 of 1 profiles repaired", out.getvalue())
+
+
+class RatingSummaryTests(ProfileTestCase):
+    """
+    Tests for the precomputed rating histogram
+    """
+
+    def test_summary_returns_histogram(self):
+        for buyer, rating in zip(self.buyers, [5, 5, 2]):
+            self.rate(buyer, rating)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                reverse("user_profile:rating_summary", args=[self.broker.pk])
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["count"], 3)
+        self.assertAlmostEqual(response.data["average"], 4)
+        self.assertEqual(
+            response.data["histogram"], {"1": 0, "2": 1, "3": 0, "4": 0, "5": 2}
+        )
+
+    def test_summary_without_profile(self):
+        self.client.force_authenticate(user=self.buyers[0])
+        response = self.client.get(
+            reverse("user_profile:rating_summary", args=[self.buyers[1].pk])
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class RatingPaginationTests(ProfileTestCase):
+    """
+    Tests for the keyset-paginated ratings list
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.buyers += [
+            UserAccount.objects.create_user(
+                email=f"extra{i}@example.com",
+                password="pass1234",
+                username=f"extra{i}",
+            )
+            for i in range(2)
+        ]
+        # pylint: disable=E1101
+        for buyer in self.buyers:
+            Rating.objects.create(user=buyer, rated_user=self.broker, rating=4)
+        # Ties on created_at must be broken by id
+        first = Rating.objects.order_by("id").first()
+        Rating.objects.filter(id__lte=first.id + 2).update(created_at=first.created_at)
+        self.client.force_authenticate(user=self.buyers[0])
+
+    def test_pages_cover_every_rating_once(self):
+        url = reverse("user_profile:ratings", args=[self.broker.pk]) + "?page_size=2"
+        seen = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data["results"]), 2)
+            seen += [rating["id"] for rating in response.data["results"]]
+            url = response.data["next"]
+
+        # pylint: disable=E1101
+        expected = list(
+            Rating.objects.order_by("-created_at", "-id").values_list("id", flat=True)
+        )
+        self.assertEqual(seen, expected)
+
+    def test_seek_is_bounded_on_the_leading_field(self):
+        now = timezone.now()
+        descending = KeysetPagination().seek_filter([now, 7])
+        self.assertEqual(descending.connector, "AND")
+        self.assertEqual(descending.children[0], ("created_at__lte", now))
+
+        ascending = KeysetPagination(ordering=("created_at", "id")).seek_filter(
+            [now, 7]
+        )
+        self.assertEqual(ascending.children[0], ("created_at__gte", now))
+
+    def test_page_size_is_capped(self):
+        response = self.client.get(
+            reverse("user_profile:ratings", args=[self.broker.pk]) + "?page_size=1000"
+        )
+        self.assertEqual(len(response.data["results"]), 5)
+        self.assertIsNone(response.data["next"])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(
+            reverse("user_profile:ratings", args=[self.broker.pk]) + "?cursor=abc"
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ProfileCacheTests(ProfileTestCase):
+    """
+    Tests for the cached profile responses
+    """
+
+    def setUp(self):
+        super().setUp()
+        # pylint: disable=E1101
+        token = Token.objects.create(user=self.buyers[0])
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+        self.url = reverse("user_profile:user_profile", args=[self.broker.pk])
+
+    def test_cached_get_runs_no_queries(self):
+        first = self.client.get(self.url)
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(first.data, second.data)
+
+    def test_process_local_cache_is_not_used(self):
+        with override_settings(
+            CACHES={
+                "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+            }
+        ):
+            self.client.get(self.url)
+            with self.assertNumQueries(2):
+                response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_update_invalidates_profile(self):
+        self.client.get(self.url)
+        self.client.force_authenticate(user=self.broker)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(self.url, {"location": "Abuja"})
+
+        self.assertEqual(self.client.get(self.url).data["location"], "Abuja")
+
+    def test_social_link_invalidates_profile(self):
+        self.client.get(self.url)
+        self.client.force_authenticate(user=self.broker)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("user_profile:social_account", args=[self.broker.pk]),
+                {"site_name": "x", "link": "https://x.com/broker"},
+            )
+
+        links = self.client.get(self.url).data["social_media_accounts"]
+        self.assertEqual([link["site_name"] for link in links], ["x"])
+
+    def test_rating_invalidates_profile(self):
+        self.client.get(self.url)
+        self.rate(self.buyers[1], 4)
+
+        self.assertEqual(self.client.get(self.url).data["average_rating"], 4)
+
+    def test_evicted_version_does_not_revive_old_payload(self):
+        self.client.get(self.url)
+        cache.delete(profile_cache.version_key(self.broker.pk))
+        UserProfile.objects.filter(pk=self.profile.pk).update(location="Kano")
+
+        self.assertEqual(self.client.get(self.url).data["location"], "Kano")
+
+
+class QueryBudgetTests(ProfileTestCase):
+    """
+    Pins the number of queries each profile endpoint runs
+    """
+
+    def setUp(self):
+        super().setUp()
+        # pylint: disable=E1101
+        self.link = SocialLinks.objects.create(site_name="x", link="https://x.com/a")
+        self.profile.social_media_accounts.add(self.link)
+        self.client.force_authenticate(user=self.broker)
+        self.profile_url = reverse("user_profile:user_profile", args=[self.broker.pk])
+        self.social_url = reverse("user_profile:social_account", args=[self.broker.pk])
+
+    def test_profile_endpoints(self):
+        self.assertQueryCount(self.client.get(self.profile_url), 2)
+        self.assertQueryCount(self.client.get(self.profile_url), 0)
+        self.assertQueryCount(
+            self.client.put(self.profile_url, {"location": "Abuja"}), 5
+        )
+        self.assertQueryCount(self.client.delete(self.profile_url), 4)
+        self.assertQueryCount(
+            self.client.post(self.profile_url, {"firstname": "a", "lastname": "b"}),
+            3,
+        )
+
+    def test_social_endpoints(self):
+        self.assertQueryCount(self.client.get(self.social_url), 1)
+        self.assertQueryCount(
+            self.client.post(
+                self.social_url, {"site_name": "y", "link": "https://y.co"}
+            ),
+            4,
+        )
+        self.assertQueryCount(
+            self.client.put(
+                self.social_url, {"social_link_id": self.link.pk, "site_name": "z"}
+            ),
+            4,
+        )
+        self.assertQueryCount(
+            self.client.delete(self.social_url, {"social_link_id": self.link.pk}), 5
+        )
+
+    def test_rating_endpoints(self):
+        self.assertQueryCount(self.rate(self.buyers[0], 5), 6)
+        url = reverse("user_profile:ratings", args=[self.broker.pk])
+        self.assertQueryCount(self.client.get(url), 2)
+        url = reverse("user_profile:rating_summary", args=[self.broker.pk])
+        self.assertQueryCount(self.client.get(url), 1)
+
+
+class ProfileBatchTests(ProfileTestCase):
+    """
+    Tests for the batch profile endpoint
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.brokers = [self.broker]
+        for i in range(2):
+            broker = UserAccount.objects.create_user(
+                email=f"broker{i}@example.com",
+                password="pass1234",
+                username=f"broker{i}",
+                user_type=UserAccount.LAND_BROKER,
+            )
+            # pylint: disable=E1101
+            profile = UserProfile.objects.create(
+                user=broker, firstname=f"Broker{i}", lastname="B"
+            )
+            profile.social_media_accounts.add(
+                SocialLinks.objects.create(site_name="x", link="https://x.com/b")
+            )
+            self.brokers.append(broker)
+        self.client.force_authenticate(user=self.buyers[0])
+
+    def get(self, ids):
+        """
+        Requests a batch of profiles
+        """
+        return self.client.get(
+            reverse("user_profile:profiles"), {"ids": ",".join(map(str, ids))}
+        )
+
+    def test_returns_profiles_in_request_order(self):
+        ids = [self.brokers[2].pk, self.buyers[1].pk, self.brokers[0].pk, 999999]
+        response = self.get(ids)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [profile["user"] for profile in response.data["results"]],
+            [self.brokers[2].pk, self.brokers[0].pk],
+        )
+        self.assertEqual(response.data["missing"], [self.buyers[1].pk, 999999])
+        self.assertEqual(len(response.data["results"][0]["social_media_accounts"]), 1)
+        self.assertQueryCount(response, 2)
+
+    def test_rejects_too_many_ids(self):
+        response = self.get(range(1, 102))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_rejects_malformed_ids(self):
+        response = self.client.get(reverse("user_profile:profiles"), {"ids": "1,a"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class BrokerSearchTests(ProfileTestCase):
+    """
+    Tests for the broker search endpoint
+    """
+
+    def setUp(self):
+        super().setUp()
+        rows = [
+            ("Bola", "Lagos ", "Waterfront homes in Lekki", 4.5),
+            ("Chidi", "lagos", "Farmland and plots", 3.0),
+            ("Dayo", "Abuja", "Homes near the city centre", 4.8),
+            ("Efe", "LAGOS", "Duplex homes and lekki plots", 4.5),
+        ]
+        self.profiles = {}
+        for name, location, description, rating in rows:
+            broker = UserAccount.objects.create_user(
+                email=f"{name}@example.com",
+                password="pass1234",
+                username=name,
+                user_type=UserAccount.LAND_BROKER,
+            )
+            # pylint: disable=E1101
+            profile = UserProfile.objects.create(
+                user=broker,
+                firstname=name,
+                location=location,
+                description=description,
+            )
+            UserProfile.objects.filter(pk=profile.pk).update(average_rating=rating)
+            self.profiles[name] = profile
+        # A buyer's profile never shows up in broker search
+        UserProfile.objects.create(
+            user=self.buyers[1], firstname="Buyer", location="Lagos"
+        )
+        self.client.force_authenticate(user=self.buyers[0])
+
+    def search(self, **params):
+        """
+        Runs a search and returns the first names of the results
+        """
+        response = self.client.get(reverse("user_profile:broker_search"), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [profile["firstname"] for profile in response.data["results"]]
+
+    def test_location_is_normalized(self):
+        self.assertEqual(
+            self.search(location="  Lagos"), ["Efe", "Bola", "Chidi", "Ada"]
+        )
+
+    def test_min_rating_and_sort(self):
+        self.assertEqual(self.search(min_rating=4.5), ["Dayo", "Efe", "Bola"])
+        self.assertEqual(
+            self.search(min_rating=4.5, sort="recent"), ["Efe", "Dayo", "Bola"]
+        )
+
+    def test_text_query_matches_every_word(self):
+        self.assertEqual(self.search(q="homes"), ["Dayo", "Efe", "Bola"])
+        self.assertEqual(
+            self.search(q="lekki homes", location="lagos"), ["Efe", "Bola"]
+        )
+        self.assertEqual(self.search(q='"plots" OR'), [])
+        self.assertEqual(self.search(q="efe"), ["Efe"])
+
+    def test_text_index_follows_profile_edits(self):
+        profile = self.profiles["Chidi"]
+        profile.description = "Homes by the lagoon"
+        profile.save()
+        self.profiles["Dayo"].delete()
+        self.assertEqual(self.search(q="homes"), ["Efe", "Bola", "Chidi"])
+
+    def test_pages_follow_the_sort(self):
+        seen = []
+        params = {"page_size": 2}
+        while True:
+            response = self.client.get(reverse("user_profile:broker_search"), params)
+            self.assertQueryCount(response, 2)
+            seen += [profile["firstname"] for profile in response.data["results"]]
+            if response.data["next"] is None:
+                break
+            params["cursor"] = response.data["next"].split("cursor=")[1].split("&")[0]
+        self.assertEqual(seen, ["Dayo", "Efe", "Bola", "Chidi", "Ada"])
+
+    def test_rejects_bad_parameters(self):
+        url = reverse("user_profile:broker_search")
+        response = self.client.get(url, {"min_rating": "high"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(url, {"sort": "name"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_rebuild_command_backfills_location_keys(self):
+        # pylint: disable=E1101
+        UserProfile.objects.update(location_key="")
+        call_command("rebuild_search_index", stdout=StringIO())
+        self.assertEqual(self.search(location="lagos"), ["Efe", "Bola", "Chidi", "Ada"])
+
+
+@override_settings(LEADERBOARD_SIZE=3)
+class LeaderboardTests(ProfileTestCase):
+    """
+    Tests for the per-location top broker leaderboards
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.brokers = []
+        for i in range(8):
+            broker = UserAccount.objects.create_user(
+                email=f"lb{i}@example.com",
+                password="pass1234",
+                username=f"lb{i}",
+                user_type=UserAccount.LAND_BROKER,
+            )
+            # pylint: disable=E1101
+            UserProfile.objects.create(
+                user=broker, firstname=f"Lb{i}", location=["Lagos", "Abuja"][i % 2]
+            )
+            self.brokers.append(broker)
+
+    def board(self, location_key):
+        """
+        (profile id, score) pairs on a location's board, best first
+        """
+        # pylint: disable=E1101
+        return list(
+            LeaderboardEntry.objects.filter(location_key=location_key)
+            .order_by("-score", "-profile_id")
+            .values_list("profile_id", "score")
+        )
+
+    def assertBoardsConsistent(self):
+        """
+        Checks every board against a full sort of its location
+        """
+        # pylint: disable=C0103
+        for location_key in ["lagos", "abuja", "kano"]:
+            self.assertEqual(
+                self.board(location_key), leaderboard.compute_board(location_key)
+            )
+
+    def test_incremental_updates_match_full_sort(self):
+        rng = random.Random(12)
+        for step in range(300):
+            broker = rng.choice(self.brokers)
+            if step % 25 == 24:
+                # pylint: disable=E1101
+                profile = UserProfile.objects.get(user=broker)
+                profile.location = rng.choice(["Lagos", "abuja ", "Kano"])
+                profile.save()
+            else:
+                UserProfile.add_rating(broker.pk, rng.randint(1, 5))
+            leaderboard.update_broker(broker.pk)
+            self.assertBoardsConsistent()
+
+    def test_rating_endpoint_updates_board(self):
+        self.rate(self.buyers[0], 2, self.brokers[0])
+        self.rate(self.buyers[0], 4, self.brokers[2])
+        self.rate(self.buyers[1], 5, self.brokers[2])
+        # The original broker is also in Lagos
+        self.rate(self.buyers[1], 3)
+
+        response = self.client.get(
+            reverse("user_profile:top_brokers"), {"location": " LAGOS"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [row["firstname"] for row in response.data["results"]],
+            ["Lb2", "Ada", "Lb0"],
+        )
+        self.assertEqual(response.data["results"][0]["score"], 4.5)
+        self.assertQueryCount(response, 1)
+        self.assertBoardsConsistent()
+
+    def test_deleting_a_profile_promotes_the_next_broker(self):
+        for buyer, broker, rating in [
+            (self.buyers[0], self.broker, 5),
+            (self.buyers[0], self.brokers[0], 4),
+            (self.buyers[0], self.brokers[2], 3),
+            (self.buyers[0], self.brokers[4], 2),
+        ]:
+            self.rate(buyer, rating, broker)
+        self.client.force_authenticate(user=self.broker)
+        self.client.delete(reverse("user_profile:user_profile", args=[self.broker.pk]))
+        self.assertEqual(len(self.board("lagos")), 3)
+        self.assertBoardsConsistent()
+
+    def test_rebuild_command(self):
+        for broker in self.brokers:
+            UserProfile.add_rating(broker.pk, 1 + broker.pk % 5)
+        # pylint: disable=E1101
+        LeaderboardEntry.objects.create(
+            location_key="nowhere",
+            profile=UserProfile.objects.get(user=self.broker),
+            score=5,
+        )
+        call_command("rebuild_leaderboards", stdout=StringIO())
+        self.assertBoardsConsistent()
+        self.assertEqual(self.board("nowhere"), [])
+
+
+class ProfileImageTests(ProfileTestCase):
+    """
+    Tests for the resized copies of profile images
+    """
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = override_settings(MEDIA_ROOT=media_root, PROFILE_IMAGE_WORKERS=0)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.client.force_authenticate(user=self.broker)
+        self.url = reverse("user_profile:user_profile", args=[self.broker.pk])
+
+    @staticmethod
+    def upload(name="photo.jpg", color="red"):
+        """
+        A 400x200 JPEG with EXIF data saying it must be turned upright
+        """
+        image = Image.new("RGB", (400, 200), color)
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: rotate 90 degrees clockwise
+        exif[0x010F] = "PhoneMaker"  # Make
+        buffer = BytesIO()
+        image.save(buffer, "JPEG", exif=exif)
+        return SimpleUploadedFile(name, buffer.getvalue(), "image/jpeg")
+
+    def run_jobs(self):
+        """
+        Runs every queued job inline
+        """
+        worker = Worker()
+        while worker.run_once():
+            pass
+
+    def get_variants(self):
+        """
+        The variant URLs the profile endpoint currently returns
+        """
+        return self.client.get(self.url).data["profile_image_variants"]
+
+    def open_variant(self, url):
+        """
+        Opens a stored variant from its URL
+        """
+        name = url.split(settings.MEDIA_URL, 1)[1]
+        with default_storage.open(name) as file:
+            image = Image.open(BytesIO(file.read()))
+            image.load()
+        return image
+
+    def test_upload_renders_variants_in_the_background(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put(
+                self.url, {"profile_image": self.upload()}, format="multipart"
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["data"]["profile_image_variants"], {})
+
+        self.run_jobs()
+        variants = self.get_variants()
+        self.assertEqual(sorted(variants, key=int), ["64", "256", "1024"])
+        for size, expected in [("64", (32, 64)), ("256", (128, 256))]:
+            for fmt in ["webp", "jpeg"]:
+                image = self.open_variant(variants[size][fmt])
+                self.assertEqual(image.format, fmt.upper())
+                self.assertEqual(image.size, expected)
+                self.assertEqual(dict(image.getexif()), {})
+        # Never upscaled
+        self.assertEqual(self.open_variant(variants["1024"]["jpeg"]).size, (200, 400))
+
+    def test_replacing_the_image_deletes_old_variants(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(self.url, {"profile_image": self.upload()}, "multipart")
+        self.run_jobs()
+        old = self.get_variants()["64"]["webp"].split(settings.MEDIA_URL, 1)[1]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(
+                self.url, {"profile_image": self.upload(color="blue")}, "multipart"
+            )
+        self.assertEqual(self.get_variants(), {})
+        self.run_jobs()
+        self.assertFalse(default_storage.exists(old))
+        self.assertNotIn(old, self.get_variants()["64"]["webp"])
+
+    @override_settings(LEADERBOARD_SIZE=1)
+    def test_worst_case_writes_stay_within_budget(self):
+        brokers = []
+        for location in ["Lagos", "Abuja"]:
+            broker = UserAccount.objects.create_user(
+                email=f"{location}@example.com",
+                password="pass1234",
+                username=location,
+                user_type=UserAccount.LAND_BROKER,
+            )
+            # pylint: disable=E1101
+            UserProfile.objects.create(
+                user=broker, firstname="B", lastname="B", location=location
+            )
+            UserProfile.add_rating(broker.pk, 3)
+            brokers.append(broker)
+        UserProfile.add_rating(self.broker.pk, 5)
+        call_command("rebuild_leaderboards", stdout=StringIO())
+        self.client.put(self.url, {"profile_image": self.upload()}, "multipart")
+
+        # A new image, and a move that leaves a vacancy on the Lagos board
+        # and takes the top of the Abuja board
+        response = self.client.put(
+            self.url,
+            {"profile_image": self.upload(color="blue"), "location": "Abuja"},
+            "multipart",
+        )
+        self.assertQueryCount(response, 14)
+        self.assertEqual(leaderboard.top_brokers("abuja")[0]["user"], self.broker.pk)
+
+        response = self.client.delete(self.url)
+        self.assertQueryCount(response, 7)
+        self.assertEqual(leaderboard.top_brokers("abuja")[0]["user"], brokers[1].pk)
+
+    def test_deleting_the_profile_deletes_variants(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(self.url, {"profile_image": self.upload()}, "multipart")
+        self.run_jobs()
+        # pylint: disable=E1101
+        names = images.variant_names(UserProfile.objects.get().image_variants)
+        self.assertTrue(all(default_storage.exists(name) for name in names))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(self.url)
+        self.assertFalse(any(default_storage.exists(name) for name in names))
+
+    def test_failed_render_leaves_no_variants(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(self.url, {"profile_image": self.upload()}, "multipart")
+        save = default_storage.save
+        saved = []
+
+        def fail_on_third(name, content):
+            if len(saved) == 2:
+                raise OSError("disk full")
+            saved.append(save(name, content))
+            return saved[-1]
+
+        with mock.patch.object(default_storage, "save", side_effect=fail_on_third):
+            self.run_jobs()
+        self.assertEqual(len(saved), 2)
+        self.assertFalse(any(default_storage.exists(name) for name in saved))
+        self.assertEqual(self.get_variants(), {})
+
+    def test_upload_during_pending_deletion_keeps_the_file(self):
+        upload = self.upload()
+        digest = hashlib.sha256(upload.read()).hexdigest()
+        upload.seek(0)
+        name = f"profile_images/{digest[:2]}/{digest}.jpg"
+        self.client.put(self.url, {"profile_image": upload}, "multipart")
+
+        # The last profile lets go of the file, whose deletion waits for
+        # the commit
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.put(
+                self.url, {"profile_image": self.upload(color="blue")}, "multipart"
+            )
+        # pylint: disable=E1101
+        self.assertEqual(ImageBlob.objects.get(name=name).refcount, 0)
+
+        other = UserAccount.objects.create_user(
+            email="twin@example.com", password="pass1234", username="twin"
+        )
+        self.client.force_authenticate(user=other)
+        self.client.post(
+            reverse("user_profile:user_profile", args=[other.pk]),
+            {"firstname": "Twin", "lastname": "B", "profile_image": self.upload()},
+            "multipart",
+        )
+        for callback in callbacks:
+            callback()
+
+        self.assertEqual(ImageBlob.objects.get(name=name).refcount, 1)
+        self.assertTrue(default_storage.exists(name))
+
+    def test_process_pool(self):
+        self.addCleanup(images.shutdown_pool)
+        buffer = BytesIO(self.upload().read())
+        variants = images.render(buffer.getvalue(), [64], 80, workers=1)
+        self.assertEqual(Image.open(BytesIO(variants[64]["webp"])).size, (32, 64))
+
+    def test_identical_uploads_share_one_file(self):
+        upload = self.upload()
+        digest = hashlib.sha256(upload.read()).hexdigest()
+        upload.seek(0)
+        self.client.put(self.url, {"profile_image": upload}, "multipart")
+        other = UserAccount.objects.create_user(
+            email="twin@example.com", password="pass1234", username="twin"
+        )
+        self.client.force_authenticate(user=other)
+        response = self.client.post(
+            reverse("user_profile:user_profile", args=[other.pk]),
+            {"firstname": "Twin", "lastname": "B", "profile_image": self.upload()},
+            "multipart",
+        )
+
+        name = f"profile_images/{digest[:2]}/{digest}.jpg"
+        self.assertTrue(response.data["data"]["profile_image"].endswith(name))
+        # pylint: disable=E1101
+        self.assertEqual(ImageBlob.objects.get(name=name).refcount, 2)
+        self.assertEqual(
+            len(default_storage.listdir(f"profile_images/{digest[:2]}")[1]), 1
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            other.delete()
+        self.assertEqual(ImageBlob.objects.get(name=name).refcount, 1)
+        self.assertTrue(default_storage.exists(name))
+
+        self.client.force_authenticate(user=self.broker)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(
+                self.url, {"profile_image": self.upload(color="blue")}, "multipart"
+            )
+        self.assertFalse(ImageBlob.objects.filter(name=name).exists())
+        self.assertFalse(default_storage.exists(name))
+
+
+class ResumableUploadTests(ProfileTestCase):
+    """
+    Tests for resumable profile image uploads
+    """
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = override_settings(MEDIA_ROOT=media_root, PROFILE_IMAGE_WORKERS=0)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.client.force_authenticate(user=self.broker)
+        self.content = ProfileImageTests.upload().read()
+
+    def start(self, size=None):
+        """
+        Creates an upload session and returns its URL
+        """
+        response = self.client.post(
+            reverse("user_profile:upload_sessions"),
+            {"filename": "photo.JPG", "size": size or len(self.content)},
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return reverse("user_profile:upload", args=[response.data["id"]])
+
+    def send(self, url, offset, data):
+        """
+        PUTs one chunk
+        """
+        return self.client.put(
+            f"{url}?offset={offset}", data, content_type="application/octet-stream"
+        )
+
+    def test_chunks_resume_and_finalize_without_copying(self):
+        url = self.start()
+        half = len(self.content) // 2
+        self.assertEqual(self.send(url, 0, self.content[:half]).data["offset"], half)
+
+        # A client that lost track of the offset is told where to resume
+        response = self.send(url, 0, self.content[:half])
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data["offset"], half)
+        self.assertEqual(self.client.get(url).data["offset"], half)
+
+        self.send(url, half, self.content[half:])
+        # pylint: disable=E1101
+        session = UploadSession.objects.get()
+        inode = os.stat(uploads.part_path(session)).st_ino
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f"{url}finalize/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        digest = hashlib.sha256(self.content).hexdigest()
+        self.profile.refresh_from_db()
+        self.assertEqual(
+            self.profile.profile_image.name,
+            f"profile_images/{digest[:2]}/{digest}.jpg",
+        )
+        self.assertEqual(os.stat(self.profile.profile_image.path).st_ino, inode)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(os.path.exists(uploads.part_path(session)))
+        self.assertEqual(ImageBlob.objects.get().refcount, 1)
+
+    def test_chunk_past_declared_size_is_rejected(self):
+        url = self.start(size=10)
+        self.send(url, 0, b"12345")
+        response = self.send(url, 5, b"6789012")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data["offset"], 5)
+
+    def test_empty_chunk(self):
+        url = self.start(size=10)
+        self.send(url, 0, b"12345")
+        response = self.send(url, 5, b"")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["offset"], 5)
+
+    def test_incomplete_or_invalid_uploads_are_not_attached(self):
+        url = self.start(size=10)
+        self.send(url, 0, b"12345")
+        response = self.client.post(f"{url}finalize/")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.send(url, 5, b"67890")
+        response = self.client.post(f"{url}finalize/")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.profile.refresh_from_db()
+        self.assertFalse(self.profile.profile_image)
+
+    def test_decompression_bomb_is_not_attached(self):
+        # A few hundred bytes of PNG claiming 200 million pixels
+        buffer = BytesIO()
+        Image.new("1", (20000, 10000)).save(buffer, "PNG")
+        self.content = buffer.getvalue()
+        url = self.start()
+        self.send(url, 0, self.content)
+
+        response = self.client.post(f"{url}finalize/")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.profile.refresh_from_db()
+        self.assertFalse(self.profile.profile_image)
+
+    def test_rejects_oversized_and_non_image_uploads(self):
+        url = reverse("user_profile:upload_sessions")
+        with override_settings(PROFILE_UPLOAD_MAX_SIZE=100):
+            response = self.client.post(url, {"filename": "a.jpg", "size": 101})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(url, {"filename": "a.exe", "size": 10})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_expired_uploads_are_gone(self):
+        url = self.start()
+        self.send(url, 0, self.content[:10])
+        # pylint: disable=E1101
+        session = UploadSession.objects.get()
+        UploadSession.objects.update(expires_at=timezone.now())
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_410_GONE)
+        self.assertFalse(os.path.exists(uploads.part_path(session)))
+
+        self.start()
+        UploadSession.objects.update(expires_at=timezone.now())
+        call_command("purge_uploads", stdout=StringIO())
+        self.assertFalse(UploadSession.objects.exists())
+
+    def test_other_users_cannot_touch_an_upload(self):
+        url = self.start()
+        self.client.force_authenticate(user=self.buyers[0])
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ConditionalGetTests(ProfileTestCase):
+    """
+    Tests for ETag and Last-Modified validation of profile data
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(user=self.buyers[0])
+        self.profile_url = reverse("user_profile:user_profile", args=[self.broker.pk])
+        self.social_url = reverse("user_profile:social_account", args=[self.broker.pk])
+        self.ratings_url = reverse("user_profile:ratings", args=[self.broker.pk])
+        # pylint: disable=E1101
+        self.profile.social_media_accounts.add(
+            SocialLinks.objects.create(site_name="x", link="https://x.com/a")
+        )
+        UserProfile.touch(self.broker.pk)
+
+    def test_not_modified_before_serializing(self):
+        response = self.client.get(self.profile_url)
+        etag = response.headers["ETag"]
+        self.assertIn("Last-Modified", response.headers)
+
+        cache.clear()
+        with mock.patch("main_profile.views.read_profiles") as read_profiles:
+            response = self.client.get(self.profile_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.headers["ETag"], etag)
+        read_profiles.assert_not_called()
+        self.assertQueryCount(response, 1)
+
+    def test_cached_profile_validates_without_queries(self):
+        response = self.client.get(self.profile_url)
+        response = self.client.get(
+            self.profile_url, HTTP_IF_NONE_MATCH=response.headers["ETag"]
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertQueryCount(response, 0)
+
+    def test_if_modified_since(self):
+        response = self.client.get(self.social_url)
+        response = self.client.get(
+            self.social_url,
+            HTTP_IF_MODIFIED_SINCE=response.headers["Last-Modified"],
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertQueryCount(response, 1)
+
+    def test_changes_move_every_validator(self):
+        etags = [
+            self.client.get(url).headers["ETag"]
+            for url in [self.profile_url, self.social_url, self.ratings_url]
+        ]
+        self.client.force_authenticate(user=self.broker)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                self.social_url, {"site_name": "y", "link": "https://y.co"}
+            )
+        self.rate(self.buyers[0], 4)
+
+        for url, etag in zip(
+            [self.profile_url, self.social_url, self.ratings_url], etags
+        ):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotEqual(response.headers["ETag"], etag)
+
+    def test_each_page_has_its_own_etag(self):
+        for buyer in self.buyers:
+            self.rate(buyer, 5)
+        self.client.force_authenticate(user=self.buyers[0])
+        first = self.client.get(self.ratings_url, {"page_size": 2})
+        second = self.client.get(first.data["next"])
+        self.assertNotEqual(first.headers["ETag"], second.headers["ETag"])
+        response = self.client.get(
+            first.data["next"], HTTP_IF_NONE_MATCH=second.headers["ETag"]
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+
+class ReaderParityTests(ProfileTestCase):
+    """
+    Tests that the values() readers return what the serializers would
+    """
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        for buyer, rating in zip(self.buyers, [5, 3, 4]):
+            self.rate(buyer, rating)
+        # pylint: disable=E1101
+        for site in ["x", "y"]:
+            self.profile.social_media_accounts.add(
+                SocialLinks.objects.create(site_name=site, link=f"https://{site}.co")
+            )
+        self.profile.refresh_from_db()
+        self.profile.profile_image = ProfileImageTests.upload()
+        self.profile.image_variants = {"64": {"webp": "profile_images/v/a.webp"}}
+        self.profile.description = "Sells land \u2028 near the lagoon"
+        self.profile.save()
+        # A profile with every optional field empty
+        other = UserAccount.objects.create_user(
+            email="other@example.com",
+            password="pass1234",
+            username="other",
+            user_type=UserAccount.LAND_BROKER,
+        )
+        UserProfile.objects.create(user=other, firstname="Bo")
+
+    def assertSameOutput(self, expected, actual):
+        """
+        Checks values, key order and rendered JSON all match
+        """
+        renderer = JSONRenderer()
+        self.assertEqual(actual, expected)
+        self.assertEqual(renderer.render(actual), renderer.render(expected))
+
+    def test_profiles(self):
+        # pylint: disable=E1101
+        profiles = UserProfile.objects.order_by("id")
+        expected = UserProfileserializer(
+            profiles.prefetch_related("social_media_accounts"), many=True
+        ).data
+        actual = readers.read_profiles(profiles.values(*readers.profile_reader.columns))
+        self.assertSameOutput(expected, actual)
+        self.assertTrue(actual[0]["profile_image"])
+        self.assertEqual(len(actual[0]["social_media_accounts"]), 2)
+        self.assertIsNone(actual[1]["profile_image"])
+
+    def test_ratings(self):
+        # pylint: disable=E1101
+        ratings = Rating.objects.order_by("-created_at", "-id")
+        expected = RatingSerializer(ratings, many=True).data
+        actual = readers.read_ratings(ratings.values(*readers.rating_reader.columns))
+        self.assertSameOutput(expected, actual)
+
+    def test_endpoints_match_serializers(self):
+        self.client.force_authenticate(user=self.buyers[0])
+        # pylint: disable=E1101
+        self.assertSameOutput(
+            UserProfileserializer(self.profile).data,
+            self.client.get(
+                reverse("user_profile:user_profile", args=[self.broker.pk])
+            ).json(),
+        )
+        self.assertSameOutput(
+            RatingSerializer(
+                Rating.objects.order_by("-created_at", "-id"), many=True
+            ).data,
+            self.client.get(
+                reverse("user_profile:ratings", args=[self.broker.pk])
+            ).json()["results"],
+        )
+
+    def test_nested_serializers_need_extra(self):
+        with self.assertRaises(TypeError):
+            readers.ValuesReader(UserProfileserializer)
+        self.assertEqual(
+            readers.social_links_reader.columns,
+            list(SocialLinksSerializer().fields),
+        )
+
+
+class AsyncReadViewTests(ProfileTestCase):
+    """
+    Tests for the async profile, social link and rating GETs
+    """
+
+    def setUp(self):
+        super().setUp()
+        for buyer, rating in zip(self.buyers, [5, 3, 4]):
+            self.rate(buyer, rating)
+        # pylint: disable=E1101
+        self.profile.social_media_accounts.add(
+            SocialLinks.objects.create(site_name="x", link="https://x.com/a")
+        )
+        UserProfile.touch(self.broker.pk)
+        self.urls = [
+            reverse("user_profile:user_profile", args=[self.broker.pk]),
+            reverse("user_profile:social_account", args=[self.broker.pk]),
+            reverse("user_profile:ratings", args=[self.broker.pk]) + "?page_size=2",
+        ]
+        self.client.force_authenticate(user=self.buyers[0])
+        self.sync_responses = [self.client.get(url) for url in self.urls]
+        cache.clear()
+
+        async_views = override_settings(ASYNC_READ_VIEWS=True)
+        async_views.enable()
+        self.addCleanup(self.reload_urls)
+        self.addCleanup(async_views.disable)
+        self.reload_urls()
+        self.headers = {
+            "AUTHORIZATION": f"Token {Token.objects.create(user=self.buyers[0]).key}"
+        }
+
+    @staticmethod
+    def reload_urls():
+        """
+        Rebuilds the URL patterns for the current ASYNC_READ_VIEWS
+        """
+        importlib.reload(profile_urls)
+        importlib.reload(project_urls)
+        clear_url_caches()
+
+    async def test_same_responses_as_sync_views(self):
+        for url, expected in zip(self.urls, self.sync_responses):
+            response = await self.async_client.get(url, **self.headers)
+            self.assertEqual(response.status_code, expected.status_code)
+            self.assertEqual(response.json(), expected.json())
+            self.assertEqual(response.headers["ETag"], expected.headers["ETag"])
+            self.assertEqual(response.headers["Content-Type"], "application/json")
+            self.assertIn("Accept", response.headers["Vary"])
+
+    async def test_not_modified(self):
+        for url, expected in zip(self.urls, self.sync_responses):
+            response = await self.async_client.get(
+                url, **self.headers, IF_NONE_MATCH=expected.headers["ETag"]
+            )
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    async def test_cached_reads_run_no_queries(self):
+        url = self.urls[0]
+        await self.async_client.get(url, **self.headers)
+        response = await self.async_client.get(url, **self.headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.asgi_request.query_count, 0)
+
+    async def test_authentication_is_required(self):
+        response = await self.async_client.get(self.urls[0])
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response.headers["WWW-Authenticate"], "Token")
+        self.assertEqual(
+            response.json(), {"detail": "Authentication credentials were not provided."}
+        )
+
+        response = await self.async_client.get(
+            self.urls[0], AUTHORIZATION="Token invalid"
+        )
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response.json(), {"detail": "Invalid token."})
+
+    async def test_missing_users(self):
+        response = await self.async_client.get(
+            reverse("user_profile:social_account", args=[9999]), **self.headers
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response.json(), {"detail": "Not found."})
+
+        response = await self.async_client.get(
+            reverse("user_profile:user_profile", args=[9999]), **self.headers
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_writes_go_to_the_drf_views(self):
+        self.client.force_authenticate(user=self.broker)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                self.urls[1], {"site_name": "y", "link": "https://y.co"}
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Async views read the token, force_authenticate does not reach them
+        response = self.client.get(
+            self.urls[1], HTTP_AUTHORIZATION=self.headers["AUTHORIZATION"]
+        )
+        self.assertEqual([link["site_name"] for link in response.json()], ["x", "y"])
+
+
+@skipUnless("replica" in settings.DATABASES, "needs the SQLite stand-in replica")
+@override_settings(DATABASE_REPLICAS=["replica"])
+class ReplicaRoutingTests(ProfileTestCase):
+    """
+    Tests for reading profiles and ratings from a replica, with the
+    stand-in replica database holding an older copy of the data
+    """
+
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        super().setUp()
+        routers.reset_health()
+        self.addCleanup(routers.reset_health)
+        self.broker.save(using="replica")
+        # pylint: disable=E1101
+        UserProfile.objects.using("replica").create(
+            user_id=self.broker.pk, firstname="Stale", location="Lagos"
+        )
+        self.profile_url = reverse("user_profile:user_profile", args=[self.broker.pk])
+        self.ratings_url = reverse("user_profile:ratings", args=[self.broker.pk])
+
+    def test_reads_go_to_the_replica(self):
+        self.client.force_authenticate(user=self.buyers[0])
+        response = self.client.get(self.profile_url)
+        self.assertEqual(response.json()["firstname"], "Stale")
+
+        self.rate(self.buyers[1], 5)
+        self.client.force_authenticate(user=self.buyers[0])
+        self.assertEqual(self.client.get(self.ratings_url).json()["results"], [])
+
+    def test_writers_read_their_writes_from_the_primary(self):
+        self.rate(self.buyers[1], 5)
+
+        response = self.client.get(self.ratings_url)
+        self.assertEqual(len(response.json()["results"]), 1)
+        self.assertEqual(self.client.get(self.profile_url).json()["firstname"], "Ada")
+
+        self.client.force_authenticate(user=self.buyers[0])
+        self.assertEqual(self.client.get(self.ratings_url).json()["results"], [])
+
+    def test_unhealthy_replica_falls_back_to_the_primary(self):
+        self.client.force_authenticate(user=self.buyers[0])
+        with mock.patch.object(
+            connections["replica"], "cursor", side_effect=OperationalError("down")
+        ), self.assertLogs("realtinger.routers", "WARNING"):
+            response = self.client.get(self.profile_url)
+        self.assertEqual(response.json()["firstname"], "Ada")
+
+    def test_health_is_checked_once_per_interval(self):
+        self.client.force_authenticate(user=self.buyers[0])
+        with mock.patch.object(routers, "ping", return_value=False) as ping:
+            self.client.get(self.profile_url)
+            self.client.get(self.ratings_url)
+        ping.assert_called_once_with("replica")
+
+    def test_replica_payloads_are_not_cached(self):
+        self.client.force_authenticate(user=self.buyers[0])
+        self.client.get(self.profile_url)
+        version = profile_cache.get_version(self.broker.pk)
+        key = profile_cache.payload_key(self.broker.pk, version)
+        self.assertIsNone(cache.get(key))
+
+    def test_replica_read_after_a_write_is_not_served_to_the_writer(self):
+        self.client.force_authenticate(user=self.broker)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(self.profile_url, {"firstname": "Grace"})
+        self.client.force_authenticate(user=self.buyers[0])
+        self.assertEqual(self.client.get(self.profile_url).json()["firstname"], "Stale")
+
+        self.client.force_authenticate(user=self.broker)
+        response = self.client.get(self.profile_url)
+        self.assertEqual(response.json()["firstname"], "Grace")
+
+    def test_process_local_cache_keeps_reads_on_the_primary(self):
+        self.client.force_authenticate(user=self.buyers[0])
+        with override_settings(
+            CACHES={
+                "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+            }
+        ):
+            response = self.client.get(self.profile_url)
+        self.assertEqual(response.json()["firstname"], "Ada")
+
+    async def test_async_views_read_from_the_replica(self):
+        async_views = override_settings(ASYNC_READ_VIEWS=True)
+        async_views.enable()
+        self.addCleanup(AsyncReadViewTests.reload_urls)
+        self.addCleanup(async_views.disable)
+        AsyncReadViewTests.reload_urls()
+        token = await Token.objects.acreate(user=self.buyers[0])
+        response = await self.async_client.get(
+            self.profile_url, AUTHORIZATION=f"Token {token.key}"
+        )
+        self.assertEqual(response.json()["firstname"], "Stale")
@@ -0,0 +1,144 @@
+"""
+Resumable profile image uploads.
+
+A client creates an UploadSession declaring the total size, then sends
+the file as a series of PUTs each carrying the offset it starts at. Each
+chunk is streamed from the request into a part file in small reads, so
+memory use does not depend on the chunk or file size, and a client whose
+connection drops asks for the session's offset and carries on from
+there. Finalizing hashes the part file and renames it into the
+content-addressed image storage, so the assembled file is never copied.
+"""
+import fcntl
+import hashlib
+import os
+
+from django.conf import settings
+from django.utils import timezone
+from PIL import Image
+
+from .models import UserProfile
+from .storage import content_name
+
+READ_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    """
+    Raised when a chunk or a finalize request cannot be applied, with the
+    HTTP status to answer with
+    """
+
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def part_path(session):
+    """
+    Local path of the file a session's chunks are appended to. It lives on
+    the image storage's file system so finalizing is a rename.
+    """
+    return UserProfile.image_storage.path(
+        f"{settings.PROFILE_UPLOAD_DIR}/{session.pk}.part"
+    )
+
+
+def is_expired(session):
+    """
+    Whether a session is past its expiry time
+    """
+    return session.expires_at <= timezone.now()
+
+
+def get_offset(session):
+    """
+    Number of bytes of a session received so far
+    """
+    try:
+        return os.path.getsize(part_path(session))
+    except FileNotFoundError:
+        return 0
+
+
+def write_chunk(session, offset, stream):
+    """
+    Appends the body of a request, read from stream, to a session's part
+    file at offset, which must be where the previous chunk ended. Returns
+    the number of bytes received so far. An empty body, for which DRF's
+    request.stream is None, is an empty chunk.
+    """
+    path = part_path(session)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "ab") as part:
+        try:
+            # Two requests appending to the same session must not interleave
+            fcntl.flock(part, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError as exception:
+            raise UploadError("Another chunk is being uploaded", 409) from exception
+
+        # The file, not the row, is the source of truth for the offset: a
+        # request that died after writing but before saving loses nothing
+        received = part.seek(0, os.SEEK_END)
+        if offset != received:
+            raise UploadError(f"Expected a chunk at offset {received}", 409)
+
+        try:
+            while stream is not None:
+                data = stream.read(READ_SIZE)
+                if not data:
+                    break
+                received += len(data)
+                if received > session.size:
+                    raise UploadError("Chunk goes past the declared size", 400)
+                part.write(data)
+        except UploadError:
+            part.truncate(offset)
+            raise
+    return received
+
+
+def store(session):
+    """
+    Moves a complete part file into the image storage and returns its
+    storage name. Raises UploadError if it is incomplete or not an image.
+    """
+    path = part_path(session)
+    received = get_offset(session)
+    if received != session.size:
+        raise UploadError(f"Only {received} of {session.size} bytes received", 400)
+
+    try:
+        with Image.open(path) as image:
+            image.verify()
+    # DecompressionBombError, for images whose dimensions alone are too
+    # large to decode, is not an OSError
+    except (
+        OSError,
+        SyntaxError,
+        ValueError,
+        Image.DecompressionBombError,
+    ) as exception:
+        raise UploadError("Upload is not a valid image", 400) from exception
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as part:
+        for data in iter(lambda: part.read(READ_SIZE), b""):
+            digest.update(data)
+    extension = os.path.splitext(session.filename)[1]
+    # pylint: disable=W0212
+    directory = UserProfile._meta.get_field("profile_image").upload_to.rstrip("/")
+    name = content_name(directory, digest.hexdigest(), extension)
+    UserProfile.image_storage.store(path, name)
+    discard(session)
+    return name
+
+
+def discard(session):
+    """
+    Deletes a session's part file, if any is left
+    """
+    try:
+        os.remove(part_path(session))
+    except FileNotFoundError:
+        pass
@@ -9,16 +9,35 @@ from . import views
 # pylint: disable=C0103
 app_name = "user_profile"
 
+if settings.ASYNC_READ_VIEWS:
+    # GETs answered on the event loop, see async_views.py
+    from . import async_views
+
+    profile_view = async_views.profile
+    social_account_view = async_views.social_account
+    ratings_view = async_views.ratings
+else:
+    profile_view = views.CreateProfile.as_view()
+    social_account_view = views.CreateSocial.as_view()
+    ratings_view = views.UserRatingView.as_view()
+
 urlpatterns = [
+    path("api/v1/profile/<int:pk>/", profile_view, name="user_profile"),
+    path("api/v1/profiles/", views.ProfileBatchView.as_view(), name="profiles"),
+    path("api/v1/brokers/", views.BrokerSearchView.as_view(), name="broker_search"),
+    path("api/v1/brokers/top/", views.TopBrokersView.as_view(), name="top_brokers"),
+    path("api/v1/social_account/<int:pk>/", social_account_view, name="social_account"),
+    path("api/v1/ratings/<int:user_id>/", ratings_view, name="ratings"),
     path(
-        "api/v1/profile/<int:pk>/", views.CreateProfile.as_view(), name="user_profile"
-    ),
-    path(
-        "api/v1/social_account/<int:pk>/",
-        views.CreateSocial.as_view(),
-        name="social_account",
+        "api/v1/ratings/<int:user_id>/summary/",
+        views.RatingSummaryView.as_view(),
+        name="rating_summary",
     ),
+    path("api/v1/uploads/", views.UploadSessionView.as_view(), name="upload_sessions"),
+    path("api/v1/uploads/<uuid:upload_id>/", views.UploadView.as_view(), name="upload"),
     path(
-        "api/v1/ratings/<int:user_id>/", views.UserRatingView.as_view(), name="ratings"
+        "api/v1/uploads/<uuid:upload_id>/finalize/",
+        views.UploadFinalizeView.as_view(),
+        name="upload_finalize",
     ),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -1,28 +1,117 @@
 """
 Views for profile app
 """
-import uuid
-import secrets
-
-from accounts.models import UserAccount
+import os
+from datetime import timedelta
+
+from jobs.tasks import enqueue
+from realtinger.routers import replica_reads
+from users_account.authentication import CachedTokenAuthentication
+from users_account.models import UserAccount
+from django.conf import settings
+from django.core.validators import get_available_image_extensions
+from django.db import transaction
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from rest_framework import status
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from . import cache as profile_cache
+from . import conditional, leaderboard, uploads
+from .images import variant_names
+from .models import (
+    Rating,
+    SocialLinks,
+    UploadSession,
+    UserProfile,
+    normalize_location,
+)
+from .pagination import KeysetPagination
+from .readers import profile_reader, rating_reader, read_profiles, read_ratings
 from .permissions import IsOwnerOrReadOnly
+from .search import text_filter
 from .serializers import UserProfileserializer, SocialLinksSerializer, RatingSerializer
 
 
+def get_user_with_profile(pk):
+    """
+    Loads a user and their profile, if any, in one query or raises Http404.
+    user.user_profile then needs no further query.
+    """
+    return get_object_or_404(UserAccount.objects.select_related("user_profile"), pk=pk)
+
+
+def render_image_variants(user_profile, stale=()):
+    """
+    Queues the rendering of the resized copies of a newly uploaded
+    profile image, see tasks.py
+    """
+    enqueue(
+        "render_profile_image",
+        {
+            "profile_id": user_profile.pk,
+            "user_id": user_profile.user_id,
+            "name": user_profile.profile_image.name,
+            "stale": list(stale),
+        },
+    )
+
+
+def social_rows(pk):
+    """
+    One row per social link of a user's profile, or a single row with no
+    link, each carrying the profile's updated_at
+    """
+    # pylint: disable=E1101
+    return (
+        UserProfile.objects.filter(user_id=pk)
+        .order_by("social_media_accounts__id")
+        .values(
+            "updated_at",
+            "social_media_accounts__site_name",
+            "social_media_accounts__link",
+            "social_media_accounts__id",
+        )
+    )
+
+
+def social_accounts(rows):
+    """
+    The social links serialized from social_rows()
+    """
+    return [
+        {
+            "site_name": row["social_media_accounts__site_name"],
+            "link": row["social_media_accounts__link"],
+            "id": row["social_media_accounts__id"],
+        }
+        for row in rows
+        if row["social_media_accounts__id"] is not None
+    ]
+
+
 class CreateProfile(APIView):
     """
     Class to create a profile
     """
 
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated, IsOwnerOrReadOnly]
+    # Worst cases of the writes, one query each unless counted:
+    # post: the user, locking and counting a new image file (lock, then
+    #   UPDATE and INSERT: 3), the profile, the render job and the social
+    #   links of the response
+    # put: as post with an UPDATE of the profile, plus releasing the old
+    #   image and deleting it on commit (2) and moving boards (6, see below)
+    # delete: the user, the profile's social links, board row and itself,
+    #   releasing and deleting its image (2) and filling its board (2)
+    # Moving boards runs leaderboard.update_broker: the profile, its board
+    # rows, deleting its old row, filling the old board (2) and joining the
+    # new one
+    query_budget = {"get": 3, "post": 7, "put": 15, "delete": 8}
 
     # pylint: disable=C0103
     # pylint: disable=W0613
@@ -30,17 +119,34 @@ class CreateProfile(APIView):
         """
         Gets a user profile and display it
         """
-        try:
-            user = UserAccount.objects.get(pk=pk)
-            user_profile = user.user_profile
-            serializer = UserProfileserializer(user_profile)
-            return Response(serializer.data, status=status.HTTP_200_OK)
-        # pylint: disable=E1101
-        except User.user_profile.RelatedObjectDoesNotExist:
-            return Response(
-                {"success": False, "message": "User does not exist"},
-                status=status.HTTP_404_NOT_FOUND,
-            )
+        with replica_reads(request.user.pk) as reads:
+            version, data = profile_cache.get_profile(pk)
+            if data is None:
+                # pylint: disable=E1101
+                row = (
+                    UserProfile.objects.filter(user_id=pk)
+                    .values(*profile_reader.columns)
+                    .first()
+                )
+                if row is None:
+                    return Response(
+                        {"success": False, "message": "User does not exist"},
+                        status=status.HTTP_404_NOT_FOUND,
+                    )
+                updated_at = row["updated_at"]
+            else:
+                updated_at = parse_datetime(data["updated_at"])
+
+            etag, last_modified = conditional.validators(request, updated_at)
+            not_modified = conditional.not_modified(request, etag, last_modified)
+            if not_modified is not None:
+                return not_modified
+
+            if data is None:
+                data = read_profiles([row])[0]
+                profile_cache.set_profile(pk, version, data, reads.from_replica)
+            response = Response(data, status=status.HTTP_200_OK)
+            return conditional.set_validators(response, etag, last_modified)
 
     # pylint: disable=C0103
     def post(self, request, pk):
@@ -48,9 +154,9 @@ class CreateProfile(APIView):
         Creates a profile
         """
         data = request.data
-        user = get_object_or_404(UserAccount, pk=pk)
+        user = get_user_with_profile(pk)
 
-        if request.user != user:
+        if request.user.pk != user.pk:
             return Response(
                 {"message": "User is not authorized", "success": False},
                 status=status.HTTP_403_FORBIDDEN,
@@ -60,19 +166,16 @@ class CreateProfile(APIView):
             error_response = {"message": "Profile already exists", "success": False}
             return Response(error_response, status=status.HTTP_400_BAD_REQUEST)
 
-        data["user"] = user.pk
         serializer = UserProfileserializer(data=data)
+        # Stored under a hash of its content, see storage.py
         image_file = request.FILES.get("profile_image")
-        if image_file:
-            unique_filename = (
-                f"profile_{uuid.uuid4().hex}_{secrets.token_urlsafe(8)}_"
-                f"{data['profile_image'].name}"
-            )
-            data["profile_image"].name = unique_filename
 
         if serializer.is_valid():
-            # pylint: disable=W0612
-            user_profile = serializer.save(user=user)
+            with transaction.atomic():
+                user_profile = serializer.save(user=user)
+                if image_file:
+                    render_image_variants(user_profile)
+            profile_cache.invalidate_profile(user.pk)
             response_data = {
                 "message": "Profile successfully created",
                 "success": True,
@@ -92,23 +195,27 @@ class CreateProfile(APIView):
         Updates a profile
         """
         data = request.data
-        user = get_object_or_404(UserAccount, pk=pk)
+        user = get_user_with_profile(pk)
 
         try:
             self.check_object_permissions(request, user.user_profile)
 
             user_profile = user.user_profile
             serializer = UserProfileserializer(user_profile, data=data, partial=True)
+            # Stored under a hash of its content, see storage.py
             image_file = request.FILES.get("profile_image")
-            if image_file:
-                unique_filename = (
-                    f"profile_{uuid.uuid4().hex}_{secrets.token_urlsafe(8)}_"
-                    f"{data['profile_image'].name}"
-                )
-                data["profile_image"].name = unique_filename
 
             if serializer.is_valid():
-                user_profile = serializer.save()
+                with transaction.atomic():
+                    if image_file:
+                        stale = variant_names(user_profile.image_variants)
+                        user_profile = serializer.save(image_variants={})
+                        render_image_variants(user_profile, stale)
+                    else:
+                        user_profile = serializer.save()
+                    if "location" in serializer.validated_data:
+                        leaderboard.update_broker(user.pk)
+                profile_cache.invalidate_profile(user.pk)
 
                 response_data = {
                     "message": "Profile successfully updated",
@@ -123,7 +230,7 @@ class CreateProfile(APIView):
             }
             return Response(error_response, status=status.HTTP_400_BAD_REQUEST)
         # pylint: disable=E1101
-        except User.user_profile.RelatedObjectDoesNotExist:
+        except UserAccount.user_profile.RelatedObjectDoesNotExist:
             return Response(
                 {
                     "message": "User doesn't have a profile to edit",
@@ -138,11 +245,16 @@ class CreateProfile(APIView):
         Deletes a profile
         """
         try:
-            user = UserAccount.objects.get(pk=pk)
+            user = get_user_with_profile(pk)
             user_profile = user.user_profile
 
             self.check_object_permissions(request, user_profile)
-            user.user_profile.delete()
+            with transaction.atomic():
+                user_profile.delete()
+                # Only rated profiles can have been on a leaderboard
+                if user_profile.rating_count:
+                    leaderboard.fill_vacancy(user_profile.location_key)
+            profile_cache.invalidate_profile(user.pk)
             return Response(
                 {"message": "Profile deleted successfully", "success": True},
                 status=status.HTTP_200_OK,
@@ -160,8 +272,9 @@ class CreateSocial(APIView):
     Class that handles a user social account
     """
 
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated, IsOwnerOrReadOnly]
+    query_budget = {"get": 3, "post": 5, "put": 5, "delete": 6}
 
     # pylint: disable=C0103
     # pylint: disable=W0613
@@ -169,25 +282,22 @@ class CreateSocial(APIView):
         """
         Gets and display the social account
         """
-        user = get_object_or_404(UserAccount, pk=pk)
+        with replica_reads(request.user.pk):
+            rows = list(social_rows(pk))
+            if not rows:
+                get_object_or_404(UserAccount, pk=pk)
+                error_response = {"message": "User has no profile", "success": False}
+                return Response(error_response, status=status.HTTP_400_BAD_REQUEST)
 
-        if not hasattr(user, "user_profile"):
-            error_response = {"message": "User has no profile", "success": False}
-            return Response(error_response, status=status.HTTP_400_BAD_REQUEST)
-        try:
-            user = UserAccount.objects.get(pk=pk)
-            user_social = user.user_profile.social_media_accounts.all()
-            if user_social.exists():
-                social_accounts = []
-                for accounts in user_social:
-                    social_accounts.append(
-                        {
-                            "site_name": accounts.site_name,
-                            "link": accounts.link,
-                            "id": accounts.id,
-                        }
-                    )
-                return Response(social_accounts, status=status.HTTP_200_OK)
+            etag, last_modified = conditional.validators(request, rows[0]["updated_at"])
+            not_modified = conditional.not_modified(request, etag, last_modified)
+            if not_modified is not None:
+                return not_modified
+
+            links = social_accounts(rows)
+            if links:
+                response = Response(links, status=status.HTTP_200_OK)
+                return conditional.set_validators(response, etag, last_modified)
             return Response(
                 {
                     "success": False,
@@ -195,12 +305,6 @@ class CreateSocial(APIView):
                 },
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        # pylint: disable=E1101
-        except User.DoesNotExist:
-            return Response(
-                {"success": False, "message": "User does not exist"},
-                status=status.HTTP_404_NOT_FOUND,
-            )
 
     # pylint: disable=C0103
     def post(self, request, pk):
@@ -208,21 +312,22 @@ class CreateSocial(APIView):
         Creates a social account
         """
         data = request.data
-        user = get_object_or_404(UserAccount, pk=pk)
-
-        self.check_object_permissions(request, user.user_profile)
+        user = get_user_with_profile(pk)
 
         if not hasattr(user, "user_profile"):
             error_response = {"message": "User has no profile", "success": False}
             return Response(error_response, status=status.HTTP_400_BAD_REQUEST)
 
-        user_profile = request.user.user_profile
+        user_profile = user.user_profile
+        self.check_object_permissions(request, user_profile)
 
         serializer = SocialLinksSerializer(data=data)
         if serializer.is_valid():
-            social_link = serializer.save()
-            user_profile.social_media_accounts.add(social_link)
-            user_profile.save()
+            with transaction.atomic():
+                social_link = serializer.save()
+                user_profile.social_media_accounts.add(social_link)
+                UserProfile.touch(user_profile.user_id)
+            profile_cache.invalidate_profile(user_profile.user_id)
             response_data = {
                 "message": "Social links created",
                 "success": True,
@@ -242,17 +347,12 @@ class CreateSocial(APIView):
         Updates a social account
         """
         data = request.data
-        user = get_object_or_404(UserAccount, pk=pk)
+        user = get_user_with_profile(pk)
 
         try:
-
             self.check_object_permissions(request, user.user_profile)
 
-            if not hasattr(user, "user_profile"):
-                error_response = {"message": "User has no profile", "success": False}
-                return Response(error_response, status=status.HTTP_400_BAD_REQUEST)
-
-            user_profile = request.user.user_profile
+            user_profile = user.user_profile
 
             social_link_id = data.get("social_link_id")
             social_link = user_profile.social_media_accounts.filter(
@@ -264,8 +364,10 @@ class CreateSocial(APIView):
                     instance=social_link, data=data, partial=True
                 )
                 if serializer.is_valid():
-                    # pylint: disable=W0612
-                    updated_social_link = serializer.save()
+                    with transaction.atomic():
+                        serializer.save()
+                        UserProfile.touch(user_profile.user_id)
+                    profile_cache.invalidate_profile(user_profile.user_id)
 
                     response_data = {
                         "message": "Social link updated",
@@ -299,24 +401,22 @@ class CreateSocial(APIView):
         Deletes a social account
         """
         data = request.data
-        user = get_object_or_404(UserAccount, pk=pk)
+        user = get_user_with_profile(pk)
 
         try:
-
-            self.check_object_permissions(request, user.user_profile)
-
-            # Check if the user has a profile
-            if not hasattr(user, "user_profile"):
-                error_response = {"message": "User has no profile", "success": False}
-                return Response(error_response, status=status.HTTP_400_BAD_REQUEST)
-
             # Get user profile
             user_profile = user.user_profile
+            self.check_object_permissions(request, user_profile)
 
-            social_link_id = data["social_link_id"]
-            social_account = user_profile.social_media_accounts.get(pk=social_link_id)
+            social_link_id = data.get("social_link_id")
+            social_account = user_profile.social_media_accounts.filter(
+                pk=social_link_id
+            ).first()
             if social_account:
-                social_account.delete()
+                with transaction.atomic():
+                    social_account.delete()
+                    UserProfile.touch(user_profile.user_id)
+                profile_cache.invalidate_profile(user_profile.user_id)
                 response_data = {
                     "message": "Social account deleted successfully",
                     "success": True,
@@ -342,9 +442,10 @@ class UserRatingView(APIView):
     Handles the rating system
     """
 
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
     serializer_class = RatingSerializer
+    query_budget = {"get": 3, "post": 8}
 
     def post(self, request, user_id):
         """
@@ -368,27 +469,422 @@ class UserRatingView(APIView):
             )
 
         # Check if the user has already rated the target user
+        # pylint: disable=E1101
         existing_rating = Rating.objects.filter(
-            user=request.user, rated_user_id=rated_user_id
-        ).first()
+            user_id=request.user.id, rated_user_id=rated_user_id
+        ).exists()
         if existing_rating:
             return Response(
                 {"error": "You have already rated this user."},
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        serializer.save(user=request.user, rated_user_id=rated_user_id)
+        with transaction.atomic():
+            rating = serializer.save(user=request.user, rated_user_id=rated_user_id)
 
-        # Update the average rating in the user profile
-        rated_user_profile = UserProfile.objects.get(user__id=rated_user_id)
-        rated_user_profile.update_average_rating()
+            # Update the rating counters in the user profile
+            if not UserProfile.add_rating(rated_user_id, rating.rating):
+                transaction.set_rollback(True)
+                return Response(
+                    {"error": "User has no profile to rate."},
+                    status=status.HTTP_404_NOT_FOUND,
+                )
+            leaderboard.update_broker(rated_user_id)
+            profile_cache.invalidate_profile(rated_user_id)
 
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def get(self, request, user_id):
         """
-        Gets all a users rating
+        Gets a page of a user's ratings, newest first
+        """
+        with replica_reads(request.user.pk):
+            # pylint: disable=E1101
+            updated_at = (
+                UserProfile.objects.filter(user_id=user_id)
+                .values_list("updated_at", flat=True)
+                .first()
+            )
+            validators = None
+            if updated_at is not None:
+                # Ratings can only be added to users with a profile
+                validators = conditional.validators(request, updated_at)
+                not_modified = conditional.not_modified(request, *validators)
+                if not_modified is not None:
+                    return not_modified
+
+            paginator = KeysetPagination()
+            ratings = paginator.paginate_queryset(
+                Rating.objects.filter(rated_user_id=user_id).values(
+                    *rating_reader.columns
+                ),
+                request,
+                view=self,
+            )
+            response = paginator.get_paginated_response(read_ratings(ratings))
+            if validators is not None:
+                conditional.set_validators(response, *validators)
+            return response
+
+
+class ProfileBatchView(APIView):
+    """
+    Returns several profiles in one response, for listing pages
+    """
+
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    query_budget = {"get": 3}
+    max_ids = 100
+
+    def get(self, request):
+        """
+        Gets the profiles of the comma-separated user ids in ?ids=, in the
+        order requested, and lists the ids that have no profile
+        """
+        try:
+            ids = [int(pk) for pk in request.query_params.get("ids", "").split(",")]
+        except ValueError:
+            return Response(
+                {"success": False, "message": "ids must be comma-separated integers"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        ids = list(dict.fromkeys(ids))
+        if len(ids) > self.max_ids:
+            return Response(
+                {
+                    "success": False,
+                    "message": f"At most {self.max_ids} ids can be requested",
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        # pylint: disable=E1101
+        profiles = {
+            row["user"]: row
+            for row in UserProfile.objects.filter(user_id__in=ids).values(
+                *profile_reader.columns
+            )
+        }
+        found = [profiles[pk] for pk in ids if pk in profiles]
+        return Response(
+            {
+                "results": read_profiles(found),
+                "missing": [pk for pk in ids if pk not in profiles],
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class RatingSummaryView(APIView):
+    """
+    Returns the precomputed rating histogram of a broker
+    """
+
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    query_budget = {"get": 2}
+
+    # pylint: disable=W0613
+    def get(self, request, user_id):
+        """
+        Gets the star histogram, count and average of a user's ratings
+        """
+        # pylint: disable=E1101
+        profile = (
+            UserProfile.objects.filter(user_id=user_id)
+            .only("user", *UserProfile.RATING_FIELDS)
+            .first()
+        )
+        if profile is None:
+            return Response(
+                {"success": False, "message": "User has no profile"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        return Response(
+            {
+                "user": profile.user_id,
+                "count": profile.rating_count,
+                "average": profile.average_rating,
+                "histogram": profile.rating_histogram,
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class BrokerSearchView(APIView):
+    """
+    Searches broker profiles by location, minimum rating and free text
+    """
+
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    query_budget = {"get": 3}
+    # Profiles are numbered in creation order, so "recent" sorts on the id
+    orderings = {
+        "rating": ("-average_rating", "-id"),
+        "recent": ("-id",),
+    }
+
+    def get(self, request):
+        """
+        Gets a page of brokers matching ?location=, ?min_rating= and ?q=,
+        sorted by ?sort=rating (default) or ?sort=recent
         """
-        ratings = Rating.objects.filter(rated_user_id=user_id)
-        serializer = RatingSerializer(ratings, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        params = request.query_params
+        ordering = self.orderings.get(params.get("sort", "rating"))
+        if ordering is None:
+            return Response(
+                {
+                    "success": False,
+                    "message": f"sort must be one of {', '.join(self.orderings)}",
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        # pylint: disable=E1101
+        profiles = UserProfile.objects.filter(user__user_type=UserAccount.LAND_BROKER)
+
+        location = normalize_location(params.get("location"))
+        if location:
+            profiles = profiles.filter(location_key=location)
+
+        if params.get("min_rating"):
+            try:
+                min_rating = float(params["min_rating"])
+            except ValueError:
+                return Response(
+                    {"success": False, "message": "min_rating must be a number"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            profiles = profiles.filter(average_rating__gte=min_rating)
+
+        text = params.get("q", "").strip()
+        if text:
+            profiles = profiles.filter(text_filter(text, profiles.db))
+
+        paginator = KeysetPagination(ordering=ordering)
+        page = paginator.paginate_queryset(
+            profiles.values(*profile_reader.columns), request, view=self
+        )
+        return paginator.get_paginated_response(read_profiles(page))
+
+
+class TopBrokersView(APIView):
+    """
+    Returns the top rated brokers of a location
+    """
+
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    query_budget = {"get": 2}
+
+    def get(self, request):
+        """
+        Gets the leaderboard of ?location=, best first
+        """
+        location = normalize_location(request.query_params.get("location"))
+        if not location:
+            return Response(
+                {"success": False, "message": "location is required"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return Response(
+            {"location": location, "results": leaderboard.top_brokers(location)},
+            status=status.HTTP_200_OK,
+        )
+
+
+def upload_state(session, offset=None):
+    """
+    What a client needs to know to resume an upload
+    """
+    return {
+        "id": session.pk,
+        "filename": session.filename,
+        "size": session.size,
+        "offset": uploads.get_offset(session) if offset is None else offset,
+        "expires_at": session.expires_at,
+    }
+
+
+class UploadSessionView(APIView):
+    """
+    Starts resumable profile image uploads
+    """
+
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    query_budget = {"post": 2}
+
+    def post(self, request):
+        """
+        Creates an upload session for a file of the given filename and size
+        """
+        filename = os.path.basename(str(request.data.get("filename", "")))
+        try:
+            size = int(request.data.get("size"))
+        except (TypeError, ValueError):
+            size = 0
+        if not 0 < size <= settings.PROFILE_UPLOAD_MAX_SIZE:
+            return Response(
+                {
+                    "success": False,
+                    "message": "size must be between 1 and "
+                    f"{settings.PROFILE_UPLOAD_MAX_SIZE} bytes",
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        extension = os.path.splitext(filename)[1][1:].lower()
+        if extension not in get_available_image_extensions() or len(filename) > 255:
+            return Response(
+                {"success": False, "message": "filename must name an image file"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        # pylint: disable=E1101
+        session = UploadSession.objects.create(
+            user=request.user,
+            filename=filename,
+            size=size,
+            expires_at=timezone.now()
+            + timedelta(seconds=settings.PROFILE_UPLOAD_EXPIRY),
+        )
+        return Response(upload_state(session, 0), status=status.HTTP_201_CREATED)
+
+
+class UploadMixin:
+    """
+    Loads the upload session named in the URL
+    """
+
+    def get_session(self, request, upload_id):
+        """
+        Returns (session, None) for a live session of the requesting user,
+        or (None, error response)
+        """
+        # pylint: disable=E1101
+        session = UploadSession.objects.filter(pk=upload_id, user=request.user).first()
+        if session is None:
+            return None, Response(
+                {"success": False, "message": "Upload does not exist"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        if uploads.is_expired(session):
+            session.delete()
+            return None, Response(
+                {"success": False, "message": "Upload has expired"},
+                status=status.HTTP_410_GONE,
+            )
+        return session, None
+
+
+class UploadView(UploadMixin, APIView):
+    """
+    Receives the chunks of a resumable upload
+    """
+
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    query_budget = {"get": 3, "put": 3, "delete": 3}
+
+    def get(self, request, upload_id):
+        """
+        Gets the offset to resume an upload from
+        """
+        session, error_response = self.get_session(request, upload_id)
+        if error_response:
+            return error_response
+        return Response(upload_state(session), status=status.HTTP_200_OK)
+
+    def put(self, request, upload_id):
+        """
+        Appends the request body to the upload at ?offset=, which must be
+        the number of bytes received so far
+        """
+        session, error_response = self.get_session(request, upload_id)
+        if error_response:
+            return error_response
+        try:
+            offset = int(request.query_params["offset"])
+        except (KeyError, ValueError):
+            return Response(
+                {"success": False, "message": "offset must be an integer"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            received = uploads.write_chunk(session, offset, request.stream)
+        except uploads.UploadError as error:
+            return Response(
+                {
+                    "success": False,
+                    "message": str(error),
+                    "offset": uploads.get_offset(session),
+                },
+                status=error.status_code,
+            )
+        return Response(upload_state(session, received), status=status.HTTP_200_OK)
+
+    # pylint: disable=W0613
+    def delete(self, request, upload_id):
+        """
+        Abandons an upload
+        """
+        session, error_response = self.get_session(request, upload_id)
+        if error_response:
+            return error_response
+        session.delete()
+        return Response(
+            {"success": True, "message": "Upload deleted"}, status=status.HTTP_200_OK
+        )
+
+
+class UploadFinalizeView(UploadMixin, APIView):
+    """
+    Turns a complete upload into the user's profile image
+    """
+
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    query_budget = {"post": 11}
+
+    def post(self, request, upload_id):
+        """
+        Attaches the uploaded file to the profile of the requesting user
+        """
+        session, error_response = self.get_session(request, upload_id)
+        if error_response:
+            return error_response
+        # pylint: disable=E1101
+        profile = UserProfile.objects.filter(user=request.user).first()
+        if profile is None:
+            return Response(
+                {"success": False, "message": "User has no profile"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        stale = variant_names(profile.image_variants)
+        with transaction.atomic():
+            # Stored in the transaction that retains it, see storage.py
+            try:
+                name = uploads.store(session)
+            except uploads.UploadError as error:
+                return Response(
+                    {"success": False, "message": str(error)},
+                    status=error.status_code,
+                )
+            profile.profile_image = name
+            profile.image_variants = {}
+            profile.save(update_fields=["profile_image", "image_variants"])
+            render_image_variants(profile, stale)
+            session.delete()
+        profile_cache.invalidate_profile(request.user.pk)
+        return Response(
+            {
+                "message": "Profile image updated",
+                "success": True,
+                "data": UserProfileserializer(profile).data,
+            },
+            status=status.HTTP_200_OK,
+        )
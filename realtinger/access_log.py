@@ -0,0 +1,275 @@
+"""
+Per-request access log, one JSON line per request.
+
+AccessLogMiddleware records the route name, status, latency, database
+query count and time (from QueryBudgetMiddleware's counter), cache hits
+and user id of every request. It is enabled with ACCESS_LOG and each
+worker process writes to a file of its own, ACCESS_LOG_FILE with the
+process id added to its name (access.jsonl becomes access-<pid>.jsonl), so
+that processes never rotate a file another one is writing to.
+
+Requests never wait on the disk: lines go into a bounded queue that a
+background thread drains, writing them in batches of up to
+ACCESS_LOG_BATCH_SIZE and rotating the file once it grows past
+ACCESS_LOG_MAX_BYTES, keeping ACCESS_LOG_BACKUPS old files. When the
+queue is full lines are dropped rather than blocking the request, and the
+drops are counted and written to the log as {"dropped": n} lines.
+"""
+import atexit
+import os
+import queue
+import threading
+import time
+from contextvars import ContextVar
+
+import orjson
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.functional import SimpleLazyObject, empty
+
+
+class RequestStats:
+    """
+    Counts of one request that are not kept on the request itself
+    """
+
+    def __init__(self):
+        self.cache_hits = 0
+
+
+current_stats = ContextVar("request_stats", default=None)
+
+
+def count_cache_hit():
+    """
+    Records a cache hit for the request in the current context
+    """
+    stats = current_stats.get()
+    if stats is not None:
+        stats.cache_hits += 1
+
+
+class AccessLogWriter:
+    """
+    Writes lines to a file from a background thread, in batches, with
+    size based rotation
+    """
+
+    def __init__(
+        self,
+        path,
+        max_bytes,
+        backups,
+        queue_size,
+        batch_size,
+        flush_seconds,
+    ):
+        # pylint: disable=R0913
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.queue = queue.Queue(queue_size)
+        self.lock = threading.Lock()
+        self.dropped = 0
+        self.unreported = 0
+        self.thread = None
+
+    def write(self, line):
+        """
+        Queues a line, or drops it if the queue is full
+        """
+        self.start()
+        try:
+            self.queue.put_nowait(line)
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+                self.unreported += 1
+
+    def start(self):
+        """
+        Starts the writer thread, once
+        """
+        if self.thread is not None:
+            return
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self.run, name="access-log", daemon=True
+                )
+                self.thread.start()
+                atexit.register(self.stop)
+
+    def stop(self):
+        """
+        Writes out the queued lines and stops the writer thread
+        """
+        with self.lock:
+            thread, self.thread = self.thread, None
+        if thread is not None:
+            # Waits for room rather than dropping the marker
+            self.queue.put(None)
+            thread.join()
+
+    def flush(self):
+        """
+        Waits until every queued line is written
+        """
+        self.queue.join()
+
+    def run(self):
+        """
+        Writer thread: writes what the queue holds every flush_seconds, or
+        as soon as a batch is full, until stop()
+        """
+        # pylint: disable=R1732
+        file = open(self.path, "ab")
+        try:
+            stopping = False
+            while not stopping:
+                taken = []
+                try:
+                    taken.append(self.queue.get(timeout=self.flush_seconds))
+                    while len(taken) < self.batch_size:
+                        taken.append(self.queue.get_nowait())
+                except queue.Empty:
+                    pass
+                stopping = None in taken
+                batch = [line for line in taken if line is not None]
+                with self.lock:
+                    dropped, self.unreported = self.unreported, 0
+                if dropped:
+                    batch.append(orjson.dumps({"dropped": dropped}) + b"\n")
+                if batch:
+                    file.write(b"".join(batch))
+                    file.flush()
+                    if file.tell() >= self.max_bytes:
+                        file.close()
+                        self.rotate()
+                        file = open(self.path, "ab")
+                # Only once written, for flush()
+                for _ in taken:
+                    self.queue.task_done()
+        finally:
+            file.close()
+
+    def rotate(self):
+        """
+        Moves the file to path.1, path.1 to path.2 and so on, deleting the
+        oldest past the number of backups kept
+        """
+        if not self.backups:
+            os.remove(self.path)
+            return
+        for number in range(self.backups - 1, 0, -1):
+            older = f"{self.path}.{number}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.path}.{number + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def process_path(path):
+    """
+    This process's file for the log file path
+    """
+    root, extension = os.path.splitext(path)
+    return f"{root}-{os.getpid()}{extension}"
+
+
+def get_writer():
+    """
+    The writer of this process's file for ACCESS_LOG_FILE, shared by every
+    middleware instance
+    """
+    path = process_path(settings.ACCESS_LOG_FILE)
+    with _writers_lock:
+        if path not in _writers:
+            _writers[path] = AccessLogWriter(
+                path,
+                max_bytes=settings.ACCESS_LOG_MAX_BYTES,
+                backups=settings.ACCESS_LOG_BACKUPS,
+                queue_size=settings.ACCESS_LOG_QUEUE_SIZE,
+                batch_size=settings.ACCESS_LOG_BATCH_SIZE,
+                flush_seconds=settings.ACCESS_LOG_FLUSH_SECONDS,
+            )
+        return _writers[path]
+
+
+def user_id(request):
+    """
+    Id of the authenticated user of a request, without loading the
+    session user if nothing did
+    """
+    user = getattr(request, "user", None)
+    # pylint: disable=W0212
+    if user is None or isinstance(user, SimpleLazyObject) and user._wrapped is empty:
+        return None
+    return user.pk if user.is_authenticated else None
+
+
+class AccessLogMiddleware:
+    """
+    Writes an access log line for every request. Goes before
+    QueryBudgetMiddleware, whose query counts it logs.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.ACCESS_LOG:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.writer = get_writer()
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        self.log(request, response, stats, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        self.log(request, response, stats, time.perf_counter() - started)
+        return response
+
+    def log(self, request, response, stats, seconds):
+        """
+        Queues the line of a request
+        """
+        match = getattr(request, "resolver_match", None)
+        entry = {
+            "time": time.time(),
+            "method": request.method,
+            "route": match.view_name if match else None,
+            "status": response.status_code,
+            "latency_ms": round(seconds * 1000, 3),
+            "db_queries": getattr(request, "query_count", None),
+            "db_ms": round(getattr(request, "query_time", 0) * 1000, 3),
+            "cache_hits": stats.cache_hits,
+            "user": user_id(request),
+        }
+        self.writer.write(orjson.dumps(entry) + b"\n")
@@ -0,0 +1,22 @@
+"""
+Whether the default cache is shared between worker processes.
+
+Token authentication, the profile cache, throttling and replica pinning
+are invalidated or updated by whichever process handles a write, and the
+other processes only see that through a cache they all read. CACHE_URL
+configures one (see settings.py). Without it every process has a local
+memory cache of its own, and each of those callers limits what a process
+that missed a write could serve.
+"""
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+PROCESS_LOCAL_BACKENDS = (LocMemCache, DummyCache)
+
+
+def is_shared(alias=DEFAULT_CACHE_ALIAS):
+    """
+    Whether what one process writes to a cache is seen by the others
+    """
+    return not isinstance(caches[alias], PROCESS_LOCAL_BACKENDS)
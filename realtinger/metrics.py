@@ -0,0 +1,405 @@
+"""
+In-process metrics: counters and fixed-bucket histograms, exposed in the
+Prometheus text format by realtinger.views.MetricsView.
+
+Metrics are declared once at module level with counter() or histogram()
+and recorded with inc(), observe() or time(). Recording takes no lock:
+every thread adds to its own shard of the values, and shards are only
+summed when the metrics are collected. Shards of threads that have ended
+are folded into one as new threads start recording.
+
+Each worker process has its own registry. With METRICS_DIR set, every
+process also writes its values to a file of its own in that directory at
+most every METRICS_FLUSH_SECONDS, and collecting sums the files of all
+processes, so any worker can serve the metrics of all of them. Files are
+kept after their process exits, as its counts still belong in the
+totals; the directory should be emptied when the whole service restarts.
+"""
+import atexit
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import orjson
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+# Upper bounds in seconds, suited to request and subsystem latencies
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+)
+
+
+class Metric:
+    """
+    A named metric with a fixed set of label names
+    """
+
+    kind = None
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def values(self, labels):
+        """
+        This thread's values for a set of labels
+        """
+        key = (self.name, tuple(str(labels[name]) for name in self.labelnames))
+        shard = self.registry.shard()
+        values = shard.get(key)
+        if values is None:
+            values = shard[key] = self.empty()
+        return values
+
+    def empty(self):
+        """
+        Values of a label set nothing was recorded for yet
+        """
+        raise NotImplementedError
+
+    def samples(self, values):
+        """
+        (name suffix, extra labels, value) of the samples exposed for the
+        values of one label set
+        """
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """
+    A count that only goes up
+    """
+
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        """
+        Adds amount to the count of a set of labels
+        """
+        self.values(labels)[0] += amount
+
+    def empty(self):
+        return [0]
+
+    def samples(self, values):
+        yield "", (), values[0]
+
+
+class Histogram(Metric):
+    """
+    Observations counted in buckets of fixed upper bounds, with their sum
+    """
+
+    kind = "histogram"
+
+    # pylint: disable=R0913
+    def __init__(
+        self, registry, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS
+    ):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        """
+        Records an observation for a set of labels
+        """
+        values = self.values(labels)
+        # One count per bucket, the last for values above every bound,
+        # then the sum
+        values[bisect.bisect_left(self.buckets, value)] += 1
+        values[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Observes the seconds the block inside takes
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def empty(self):
+        return [0] * (len(self.buckets) + 1) + [0.0]
+
+    def samples(self, values):
+        count = 0
+        for bound, bucket in zip(self.buckets + ("+Inf",), values):
+            count += bucket
+            yield "_bucket", (("le", format_value(bound)),), count
+        yield "_sum", (), values[-1]
+        yield "_count", (), count
+
+
+def format_value(value):
+    """
+    A number or bucket bound as the text format writes it
+    """
+    return value if isinstance(value, str) else repr(value)
+
+
+def escape(value):
+    """
+    A label value escaped for the text format
+    """
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def add(totals, values):
+    """
+    Adds values into totals, element by element
+    """
+    for index, value in enumerate(values):
+        totals[index] += value
+
+
+class Registry:
+    """
+    The metrics of a process, and the per-thread shards of their values
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        # (thread, shard) of every thread that recorded anything
+        self.shards = []
+        self.retired = {}
+        self.flushed = 0.0
+        self.flush_lock = threading.Lock()
+
+    def counter(self, name, documentation, labelnames=()):
+        """
+        Declares a counter, or returns the one declared under name
+        """
+        return self.register(Counter, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """
+        Declares a histogram, or returns the one declared under name
+        """
+        return self.register(
+            Histogram, name, documentation, labelnames, buckets=buckets
+        )
+
+    def register(self, metric_class, name, documentation, labelnames, **options):
+        """
+        Adds a metric, unless one is already declared under name
+        """
+        with self.lock:
+            if name not in self.metrics:
+                self.metrics[name] = metric_class(
+                    self, name, documentation, labelnames, **options
+                )
+            return self.metrics[name]
+
+    def shard(self):
+        """
+        This thread's values, {(name, label values): values}
+        """
+        try:
+            shard = self.local.shard
+        except AttributeError:
+            shard = self.local.shard = {}
+            with self.lock:
+                self.retire()
+                self.shards.append((threading.current_thread(), shard))
+        if settings.METRICS_DIR and time.monotonic() - self.flushed > (
+            settings.METRICS_FLUSH_SECONDS
+        ):
+            self.flush()
+        return shard
+
+    def retire(self):
+        """
+        Folds the shards of threads that have ended into one. Called with
+        the lock held.
+        """
+        alive = []
+        for thread, shard in self.shards:
+            if thread.is_alive():
+                alive.append((thread, shard))
+                continue
+            for key, values in shard.items():
+                if key in self.retired:
+                    add(self.retired[key], values)
+                else:
+                    self.retired[key] = list(values)
+        self.shards = alive
+
+    def totals(self):
+        """
+        Values of this process, {(name, label values): values}
+        """
+        with self.lock:
+            shards = [self.retired] + [shard for _, shard in self.shards]
+        totals = {}
+        for shard in shards:
+            # A thread may add a label set while this runs
+            for key, values in list(shard.items()):
+                if key in totals:
+                    add(totals[key], values)
+                else:
+                    totals[key] = list(values)
+        return totals
+
+    def path(self):
+        """
+        This process's file in METRICS_DIR
+        """
+        return os.path.join(settings.METRICS_DIR, f"metrics-{os.getpid()}.json")
+
+    def flush(self):
+        """
+        Writes the values of this process to its file in METRICS_DIR
+        """
+        if not settings.METRICS_DIR or not self.flush_lock.acquire(blocking=False):
+            return
+        try:
+            if not self.flushed:
+                atexit.register(self.flush)
+            self.flushed = time.monotonic()
+            data = [
+                [name, labels, values]
+                for (name, labels), values in self.totals().items()
+            ]
+            temporary = f"{self.path()}.tmp"
+            with open(temporary, "wb") as file:
+                file.write(orjson.dumps(data))
+            os.replace(temporary, self.path())
+        finally:
+            self.flush_lock.release()
+
+    def collect(self):
+        """
+        Values of every process sharing METRICS_DIR, or of this one only
+        """
+        if not settings.METRICS_DIR:
+            return self.totals()
+        self.flush()
+        totals = {}
+        for name in sorted(os.listdir(settings.METRICS_DIR)):
+            if not name.startswith("metrics-") or not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(settings.METRICS_DIR, name), "rb") as file:
+                    data = orjson.loads(file.read())
+            except (OSError, orjson.JSONDecodeError):
+                continue
+            for metric, labels, values in data:
+                key = (metric, tuple(labels))
+                if key in totals:
+                    add(totals[key], values)
+                else:
+                    totals[key] = values
+        return totals
+
+    def exposition(self):
+        """
+        All metrics in the Prometheus text format
+        """
+        by_metric = {}
+        for (name, labelvalues), values in sorted(self.collect().items()):
+            by_metric.setdefault(name, []).append((labelvalues, values))
+
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for labelvalues, values in by_metric.get(name, []):
+                labels = tuple(zip(metric.labelnames, labelvalues))
+                for suffix, extra, value in metric.samples(values):
+                    pairs = ",".join(
+                        f'{label}="{escape(text)}"' for label, text in labels + extra
+                    )
+                    pairs = f"{{{pairs}}}" if pairs else ""
+                    lines.append(f"{name}{suffix}{pairs} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+counter = registry.counter
+histogram = registry.histogram
+
+
+view_seconds = histogram(
+    "view_latency_seconds",
+    "Time to answer a request, per view class and method",
+    ["view", "method"],
+)
+view_responses = counter(
+    "view_responses_total",
+    "Responses sent, per view class, method and status code",
+    ["view", "method", "status"],
+)
+
+
+def view_name(request):
+    """
+    Name of the view class (or function) that handled a request, or None
+    for requests that matched no URL
+    """
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return None
+    view_class = getattr(match.func, "view_class", None)
+    return (view_class or match.func).__name__
+
+
+class MetricsMiddleware:
+    """
+    Times every request that reached a view, per view class and method
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        self.record(request, response, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self.record(request, response, time.perf_counter() - started)
+        return response
+
+    @staticmethod
+    def record(request, response, seconds):
+        """
+        Records the latency and status of a request
+        """
+        view = view_name(request)
+        if view is None:
+            return
+        method = request.method.lower()
+        view_seconds.observe(seconds, view=view, method=method)
+        view_responses.inc(view=view, method=method, status=response.status_code)
@@ -0,0 +1,167 @@
+"""
+Per-request query counting and query budgets.
+
+Views declare how many queries each method may run, either with a
+query_budget = {"get": 2, ...} attribute on the view class or with the
+@query_budget(post=2) decorator on function views. QueryBudgetMiddleware
+counts the queries every request runs and reports requests that go over
+their budget: a warning in production, an exception under
+QUERY_BUDGET_STRICT so tests fail on N+1 regressions.
+
+Queries are counted by a wrapper installed once on every connection,
+which adds to the counter of the request in the current context. Async
+views run their queries in other threads, which inherit that context, so
+the middleware works the same under WSGI and ASGI.
+"""
+import logging
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+# Transaction control statements are not data access. Savepoints would
+# otherwise be counted whenever atomic() nests inside a test's transaction,
+# and on SQLite every outermost atomic() block sends its own BEGIN.
+IGNORED_PREFIXES = (
+    "BEGIN",
+    "COMMIT",
+    "END",
+    "ROLLBACK",
+    "SAVEPOINT",
+    "RELEASE SAVEPOINT",
+)
+
+
+class QueryBudgetExceeded(Exception):
+    """
+    Raised in strict mode when a view runs more queries than its budget
+    """
+
+
+class QueryCounter:
+    """
+    Number of queries run by one request and the seconds they took
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+
+
+current_counter = ContextVar("query_counter", default=None)
+
+
+def count_queries(execute, sql, params, many, context):
+    """
+    Database execute wrapper adding to the counter of the current request
+    """
+    counter = current_counter.get()
+    if counter is None or sql.lstrip().upper().startswith(IGNORED_PREFIXES):
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        counter.count += 1
+        counter.time += time.perf_counter() - started
+
+
+# pylint: disable=W0613
+def install_counter(sender=None, connection=None, **kwargs):
+    """
+    Adds count_queries to a connection's execute wrappers, once
+    """
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
+
+
+def query_budget(**budgets):
+    """
+    Declares the query budget of a function view, per lowercase method
+    """
+
+    def decorator(view):
+        view.query_budget = budgets
+        return view
+
+    return decorator
+
+
+def get_budget(view_func, method):
+    """
+    Query budget a view declared for a method, or None
+    """
+    budgets = getattr(view_func, "query_budget", None)
+    if budgets is None:
+        view_class = getattr(view_func, "view_class", None)
+        budgets = getattr(view_class, "query_budget", None)
+    if budgets is None:
+        return None
+    return budgets.get(method.lower())
+
+
+class QueryBudgetMiddleware:
+    """
+    Counts the queries of every request on every database connection and
+    enforces the budget of the view that handled it
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        # Connections opened from now on, in any thread, and those that
+        # are already open in this one
+        connection_created.connect(install_counter)
+        for connection in connections.all():
+            install_counter(connection=connection)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        counter = QueryCounter()
+        token = current_counter.set(counter)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_counter.reset(token)
+        self.check_budget(request, counter)
+        return response
+
+    async def __acall__(self, request):
+        counter = QueryCounter()
+        token = current_counter.set(counter)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_counter.reset(token)
+        self.check_budget(request, counter)
+        return response
+
+    @staticmethod
+    def check_budget(request, counter):
+        """
+        Records the query count and time of a request and reports it if
+        it went over the budget of its view
+        """
+        request.query_count = counter.count
+        request.query_time = counter.time
+        match = getattr(request, "resolver_match", None)
+        budget = get_budget(match.func, request.method) if match else None
+        if budget is not None and counter.count > budget:
+            message = (
+                f"{request.method} {request.path} ran {counter.count} queries, "
+                f"over its budget of {budget}"
+            )
+            if settings.QUERY_BUDGET_STRICT:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
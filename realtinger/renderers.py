@@ -0,0 +1,104 @@
+"""
+orjson-backed drop-in replacements for DRF's JSONRenderer and JSONParser.
+
+ORJSONRenderer produces byte-for-byte the same output as JSONRenderer
+under the default COMPACT_JSON, UNICODE_JSON and STRICT_JSON settings.
+Types orjson does not handle the way DRF does (datetimes, Decimals, lazy
+strings, querysets...) are passed to DRF's own JSONEncoder.default, and
+anything orjson formats differently falls back to JSONRenderer:
+
+- floats Python writes in exponent form (below 1e-4 or from 1e16 up),
+  detected in the output, where a string that merely looks like one only
+  costs a slower render;
+- integers wider than 64 bits, which orjson refuses;
+- indented output and non-default JSON settings.
+
+The one difference left is NaN and infinity, which JSONRenderer refuses
+with a ValueError and orjson renders as null.
+"""
+import codecs
+import re
+from io import BytesIO
+
+import orjson
+from django.conf import settings
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+OPTIONS = (
+    orjson.OPT_NON_STR_KEYS
+    | orjson.OPT_PASSTHROUGH_DATETIME
+    | orjson.OPT_PASSTHROUGH_DATACLASS
+)
+
+# Candidates for an exponent; a literal first byte keeps the scan fast
+EXPONENT = re.compile(rb"e[-0-9]")
+# Integers orjson may read as floats instead of ints
+LONG_NUMBER = re.compile(rb"[0-9]{19}")
+
+
+def has_divergent_float(output):
+    """
+    Whether orjson output may hold a float written differently from
+    repr(): in exponent form, or below 1e-4, which orjson may write out in
+    full where repr() uses an exponent
+    """
+    if b"0.0000" in output:
+        return True
+    return any(
+        output[match.start() - 1 : match.start()].isdigit()
+        for match in EXPONENT.finditer(output)
+    )
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson whenever the output is the same
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        if (
+            not self.compact
+            or self.ensure_ascii
+            or not self.strict
+            or self.get_indent(accepted_media_type, renderer_context or {})
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(
+                data, default=self.encoder_class().default, option=OPTIONS
+            )
+        except orjson.JSONEncodeError:
+            # Re-raises anything that cannot be encoded at all
+            return super().render(data, accepted_media_type, renderer_context)
+        if has_divergent_float(ret):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # JSONRenderer escapes these for JavaScript, where they end a line
+        return ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(
+            b"\xe2\x80\xa9", b"\\u2029"
+        )
+
+
+class ORJSONParser(JSONParser):
+    """
+    JSONParser that decodes UTF-8 bodies with orjson, and anything orjson
+    rejects or reads differently (other encodings, lone surrogates, long
+    numbers) with JSONParser so errors and edge cases match
+    """
+
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get("encoding", settings.DEFAULT_CHARSET)
+        body = stream.read() if stream is not None else b""
+        if codecs.lookup(encoding).name == "utf-8" and not LONG_NUMBER.search(body):
+            try:
+                return orjson.loads(body)
+            except orjson.JSONDecodeError:
+                pass
+        return super().parse(BytesIO(body), media_type, parser_context)
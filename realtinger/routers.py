@@ -0,0 +1,261 @@
+"""
+Read replica routing.
+
+Views opt their reads in to the replicas listed in DATABASE_REPLICAS by
+running them inside replica_reads() (or areplica_reads() in async views),
+which ReplicaRouter sends to one healthy replica per block. Every other
+query, and every write, goes to the primary.
+
+Replicas lag behind the primary, so a client that has just written would
+not always read their own change back. ReplicaPinMiddleware pins
+authenticated users who made a successful write to the primary for
+REPLICA_PIN_SECONDS, and replica_reads() does nothing for them while it
+lasts. The pin is kept in the cache, and only holds in every worker when
+that cache is shared between them (see realtinger/caches.py), so with a
+process local cache the replicas are not used at all.
+
+Each process checks a replica with a SELECT 1 at most every
+REPLICA_HEALTH_INTERVAL seconds, and reads meant for a replica that
+failed its last check go to the primary.
+"""
+import logging
+import random
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+from .caches import is_shared
+from .query_budget import current_counter
+
+logger = logging.getLogger(__name__)
+
+# Reads of the block running in the current context, if any
+current_reads = ContextVar("replica_reads", default=None)
+
+_health = {}
+_health_lock = threading.Lock()
+
+
+def replicas():
+    """
+    Replicas reads may be sent to, none when a pin set by one worker
+    would not be seen by the others
+    """
+    return settings.DATABASE_REPLICAS if is_shared() else []
+
+
+def pin_key(user_id):
+    """
+    Cache key marking a user as pinned to the primary
+    """
+    return f"replica:pin:{user_id}"
+
+
+def pin(user_id):
+    """
+    Sends a user's reads to the primary for REPLICA_PIN_SECONDS
+    """
+    cache.set(pin_key(user_id), True, settings.REPLICA_PIN_SECONDS)
+
+
+async def apin(user_id):
+    """
+    pin() for async code
+    """
+    await cache.aset(pin_key(user_id), True, settings.REPLICA_PIN_SECONDS)
+
+
+def ping(alias):
+    """
+    Whether a database answers a trivial query
+    """
+    # The occasional health check is not counted against the budget of
+    # the request that happens to run it
+    token = current_counter.set(None)
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute("SELECT 1")
+    except DatabaseError as exception:
+        logger.warning("Replica %s failed its health check: %s", alias, exception)
+        return False
+    finally:
+        current_counter.reset(token)
+    return True
+
+
+def is_healthy(alias):
+    """
+    Whether a replica passed its last health check, checking it again
+    when that was over REPLICA_HEALTH_INTERVAL seconds ago
+    """
+    now = time.monotonic()
+    with _health_lock:
+        checked = _health.get(alias)
+    if checked is not None and now - checked[1] < settings.REPLICA_HEALTH_INTERVAL:
+        return checked[0]
+    healthy = ping(alias)
+    with _health_lock:
+        _health[alias] = (healthy, now)
+    return healthy
+
+
+def reset_health():
+    """
+    Forgets the results of past health checks
+    """
+    with _health_lock:
+        _health.clear()
+
+
+class ReplicaReads:
+    """
+    Reads of one replica_reads() block, all sent to the same replica
+    """
+
+    def __init__(self, replicas):
+        self.replicas = replicas
+        self.alias = None
+
+    def db_for_read(self):
+        """
+        Database the block reads from, a random healthy replica picked on
+        the first read or the primary when there is none
+        """
+        if self.alias is None:
+            healthy = [alias for alias in self.replicas if is_healthy(alias)]
+            self.alias = random.choice(healthy) if healthy else DEFAULT_DB_ALIAS
+        return self.alias
+
+    @property
+    def from_replica(self):
+        """
+        Whether the block read anything from a replica
+        """
+        return self.alias not in (None, DEFAULT_DB_ALIAS)
+
+
+@contextmanager
+def _reads(aliases):
+    """
+    Routes the reads inside it to one of the replicas aliases, or leaves
+    them be
+    """
+    reads = ReplicaReads(aliases)
+    token = current_reads.set(reads if aliases else None)
+    try:
+        yield reads
+    finally:
+        current_reads.reset(token)
+
+
+def replica_reads(user_id=None):
+    """
+    Context manager sending the reads inside it to a replica, unless the
+    user reading is pinned to the primary. Yields a ReplicaReads.
+    """
+    aliases = replicas()
+    if aliases and user_id is not None and cache.get(pin_key(user_id)):
+        aliases = []
+    return _reads(aliases)
+
+
+@asynccontextmanager
+async def areplica_reads(user_id=None):
+    """
+    replica_reads() for async views
+    """
+    aliases = replicas()
+    if aliases and user_id is not None and await cache.aget(pin_key(user_id)):
+        aliases = []
+    with _reads(aliases) as reads:
+        yield reads
+
+
+class ReplicaRouter:
+    """
+    Sends the reads of replica_reads() blocks to a replica and everything
+    else to the primary
+    """
+
+    # pylint: disable=W0613
+    def db_for_read(self, model, **hints):
+        """
+        The block's replica inside replica_reads(), else no opinion
+        """
+        reads = current_reads.get()
+        return reads.db_for_read() if reads is not None else None
+
+    def db_for_write(self, model, **hints):
+        """
+        Always the primary, even for objects read from a replica
+        """
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        """
+        Replicas hold the same data as the primary
+        """
+        return True
+
+
+class ReplicaPinMiddleware:
+    """
+    Pins users to the primary after a successful write
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        response = self.get_response(request)
+        if self.wrote(request, response):
+            user_id = self.user_id(request)
+            if user_id is not None:
+                pin(user_id)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if self.wrote(request, response):
+            # request.user may still be the session user, loaded lazily
+            user_id = await sync_to_async(self.user_id)(request)
+            if user_id is not None:
+                await apin(user_id)
+        return response
+
+    @staticmethod
+    def wrote(request, response):
+        """
+        Whether a request may have written, when there are replicas to
+        read stale data from
+        """
+        return (
+            bool(replicas())
+            and request.method not in ("GET", "HEAD", "OPTIONS", "TRACE")
+            and response.status_code < 400
+        )
+
+    @staticmethod
+    def user_id(request):
+        """
+        Id of the user behind a request, if authenticated. DRF sets
+        request.user to the user its authentication found.
+        """
+        user = getattr(request, "user", None)
+        if user is None or not user.is_authenticated:
+            return None
+        return user.pk
@@ -56,6 +56,25 @@ LOGGING = {
     },
 }
 
+# Access log, one JSON line per request (see realtinger/access_log.py).
+# Off unless ACCESS_LOG is set. Each process writes to ACCESS_LOG_FILE with
+# its pid added to the name, access-<pid>.jsonl by default.
+ACCESS_LOG = os.getenv("ACCESS_LOG", "false").lower() == "true"
+ACCESS_LOG_FILE = os.getenv(
+    "ACCESS_LOG_FILE", os.path.join(BASE_DIR, "access.jsonl")
+)
+ACCESS_LOG_MAX_BYTES = 50 * 1024 * 1024
+ACCESS_LOG_BACKUPS = 5
+# Lines waiting for the writer thread, past which new lines are dropped
+ACCESS_LOG_QUEUE_SIZE = 10000
+ACCESS_LOG_BATCH_SIZE = 500
+ACCESS_LOG_FLUSH_SECONDS = 1
+
+# Metrics (see realtinger/metrics.py). With METRICS_DIR set, the worker
+# processes share their metrics through files in that directory.
+METRICS_DIR = os.getenv("METRICS_DIR")
+METRICS_FLUSH_SECONDS = 5
+
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/4.1/howto/deployment/checklist/
 
@@ -72,6 +91,8 @@ ALLOWED_HOSTS = []
 
 INSTALLED_APPS = [
     "users_account",
+    "main_profile",
+    "jobs",
     "django.contrib.admin",
     "django.contrib.auth",
     "django.contrib.contenttypes",
@@ -84,6 +105,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "realtinger.access_log.AccessLogMiddleware",
+    "realtinger.metrics.MetricsMiddleware",
+    "realtinger.query_budget.QueryBudgetMiddleware",
+    "realtinger.routers.ReplicaPinMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -119,7 +144,7 @@ WSGI_APPLICATION = "realtinger.wsgi.application"
 
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.postgresql",
+        "ENGINE": os.getenv("DB_ENGINE", "django.db.backends.postgresql"),
         "NAME": os.getenv("DB_NAME"),
         "USER": os.getenv("DB_USER"),
         "PASSWORD": os.getenv("DB_PASSWORD"),
@@ -128,6 +153,62 @@ DATABASES = {
     }
 }
 
+# Cache shared by the worker processes, through which token authentication,
+# the profile cache, throttling and replica pinning see the writes of other
+# processes (see realtinger/caches.py). CACHE_URL is redis://host:port/db or
+# memcached://host:port; without it each process gets a local memory cache
+# of its own.
+_cache_url = os.getenv("CACHE_URL", "")
+if _cache_url.startswith(("redis://", "rediss://")):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": _cache_url,
+        }
+    }
+elif _cache_url.startswith("memcached://"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.memcached.PyMemcacheCache",
+            "LOCATION": _cache_url.removeprefix("memcached://"),
+        }
+    }
+else:
+    CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+    }
+
+# Read replicas (see realtinger/routers.py). DB_REPLICAS lists the hosts of
+# the replicas, or their files for SQLite, each otherwise set up like the
+# primary. Without any, a SQLite primary gets a stand-in replica database
+# that is only used where DATABASE_REPLICAS is overridden, to try out and
+# test routing locally. Replicas are only read from with CACHE_URL set, as
+# the pins that let writers read their own writes live in the cache.
+DATABASE_ROUTERS = ["realtinger.routers.ReplicaRouter"]
+DATABASE_REPLICAS = []
+_replica_setting = (
+    "NAME" if DATABASES["default"]["ENGINE"].endswith("sqlite3") else "HOST"
+)
+for _number, _location in enumerate(
+    filter(None, os.getenv("DB_REPLICAS", "").split(",")), 1
+):
+    DATABASES[f"replica{_number}"] = {
+        **DATABASES["default"],
+        _replica_setting: _location.strip(),
+        # Tests read the test database through the replicas
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(f"replica{_number}")
+if not DATABASE_REPLICAS and _replica_setting == "NAME":
+    DATABASES["replica"] = {
+        **DATABASES["default"],
+        "NAME": f"{DATABASES['default']['NAME']}-replica",
+    }
+# How long a client that wrote reads from the primary only
+REPLICA_PIN_SECONDS = 5
+# How long the result of a replica health check is trusted
+REPLICA_HEALTH_INTERVAL = 10
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -162,13 +243,74 @@ USE_TZ = True
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework.authentication.TokenAuthentication",
+        "users_account.authentication.CachedTokenAuthentication",
     ],
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
     ],
+    # Same output as the stock JSON classes, see realtinger/renderers.py
+    "DEFAULT_RENDERER_CLASSES": [
+        "realtinger.renderers.ORJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    # Proxies in front of the application, whose X-Forwarded-For entries
+    # identify clients for throttling. Without any, REMOTE_ADDR does.
+    "NUM_PROXIES": int(os.getenv("NUM_PROXIES", "0")),
+    "DEFAULT_PARSER_CLASSES": [
+        "realtinger.renderers.ORJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ],
+}
+
+# Raise instead of logging when a view runs over its query budget
+QUERY_BUDGET_STRICT = os.getenv("QUERY_BUDGET_STRICT", "false").lower() == "true"
+
+# Async profile, social link and rating GETs, see main_profile/async_views.py.
+# Only worth it under ASGI, where asgi.py turns them on.
+ASYNC_READ_VIEWS = os.getenv("ASYNC_READ_VIEWS", "false").lower() == "true"
+
+# Password hashing process pool (see users_account/hashing.py), 0 hashes
+# on the request thread
+PASSWORD_HASHING_WORKERS = int(os.getenv("PASSWORD_HASHING_WORKERS", "2"))
+
+# Throttling of the account endpoints (see users_account/throttling.py):
+# per scope, the (capacity, period in seconds) of the buckets per client IP
+# and per target email. "cache" shares buckets between processes through
+# the cache when CACHE_URL configures a shared one, "local" keeps them in
+# each process, as "cache" also does without CACHE_URL.
+THROTTLE_BACKEND = os.getenv("THROTTLE_BACKEND", "cache")
+THROTTLE_LOCAL_SIZE = 10000
+THROTTLE_RATES = {
+    "login": {"ip": (20, 60), "email": (5, 60)},
+    "register": {"ip": (5, 60), "email": (3, 3600)},
+    "verification_email": {"ip": (5, 60), "email": (3, 600)},
+    "password_reset": {"ip": (5, 60), "email": (3, 600)},
+    "password_reset_confirm": {"ip": (10, 60)},
 }
 
+# Token authentication cache (see users_account/authentication.py)
+AUTH_TOKEN_CACHE_SIZE = 10000
+AUTH_TOKEN_CACHE_TTL = 300
+AUTH_TOKEN_CACHE_LOCAL_TTL = 10
+
+# Serialized profile responses (see main_profile/cache.py)
+PROFILE_CACHE_TTL = 3600
+
+# Resized copies of profile images (see main_profile/images.py)
+PROFILE_IMAGE_SIZES = [64, 256, 1024]
+PROFILE_IMAGE_QUALITY = 80
+PROFILE_IMAGE_WORKERS = int(os.getenv("PROFILE_IMAGE_WORKERS", "2"))
+PROFILE_IMAGE_VARIANTS_DIR = "profile_images/variants"
+
+# Resumable profile image uploads (see main_profile/uploads.py)
+PROFILE_UPLOAD_MAX_SIZE = 20 * 1024 * 1024
+PROFILE_UPLOAD_EXPIRY = 24 * 3600
+PROFILE_UPLOAD_DIR = "profile_images/uploads"
+
+# Top rated brokers kept per location (see main_profile/leaderboard.py)
+LEADERBOARD_SIZE = 10
+
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = "smtp.elasticemail.com"
@@ -178,11 +320,22 @@ EMAIL_HOST_PASSWORD = os.getenv("HOST_PASSWORD")
 EMAIL_USE_TLS = True
 DEFAULT_FROM_EMAIL = os.getenv("DEFAULT_FROM_EMAIL")
 
+# Background jobs (see jobs/worker.py)
+JOBS_WORKER_THREADS = int(os.getenv("JOBS_WORKER_THREADS", "4"))
+JOBS_POLL_INTERVAL = 1.0
+JOBS_MAX_ATTEMPTS = 5
+JOBS_RETRY_BACKOFF = 30
+JOBS_RETRY_BACKOFF_MAX = 3600
+JOBS_LOCK_TIMEOUT = 600
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/4.1/howto/static-files/
 
 STATIC_URL = "static/"
 
+MEDIA_URL = "media/"
+MEDIA_ROOT = os.path.join(BASE_DIR, "media")
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
 
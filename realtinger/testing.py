@@ -0,0 +1,49 @@
+"""
+Test helpers shared by the apps
+"""
+import shutil
+import tempfile
+
+from django.test import override_settings
+
+
+class QueryBudgetTestMixin:
+    """
+    Makes every request in a test case fail with QueryBudgetExceeded when
+    its view runs more queries than it declared
+    """
+
+    def setUp(self):
+        strict = override_settings(QUERY_BUDGET_STRICT=True)
+        strict.enable()
+        self.addCleanup(strict.disable)
+        super().setUp()
+
+    def assertQueryCount(self, response, expected):
+        """
+        Checks the number of queries the request behind a response ran
+        """
+        # pylint: disable=C0103
+        self.assertEqual(response.wsgi_request.query_count, expected)
+
+
+class SharedCacheTestMixin:
+    """
+    Swaps the per-process test cache for a file based one, which
+    realtinger.caches counts as shared between processes
+    """
+
+    def setUp(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        shared = override_settings(
+            CACHES={
+                "default": {
+                    "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                    "LOCATION": location,
+                }
+            }
+        )
+        shared.enable()
+        self.addCleanup(shared.disable)
+        super().setUp()
@@ -0,0 +1,369 @@
+"""
+Tests for the project-wide helpers
+"""
+import datetime
+import decimal
+import json
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from io import BytesIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+
+from main_profile.models import Rating, UserProfile
+from main_profile.serializers import RatingSerializer
+from users_account.models import UserAccount
+from . import access_log, metrics
+from .renderers import ORJSONParser, ORJSONRenderer
+from .testing import SharedCacheTestMixin
+
+
+class ORJSONRendererTests(SimpleTestCase):
+    """
+    Checks ORJSONRenderer against JSONRenderer byte for byte
+    """
+
+    def assertSameOutput(self, data, accepted_media_type=None):
+        """
+        Renders data with both renderers and compares the bytes
+        """
+        # pylint: disable=C0103
+        self.assertEqual(
+            ORJSONRenderer().render(data, accepted_media_type),
+            JSONRenderer().render(data, accepted_media_type),
+        )
+
+    def test_scalars_and_containers(self):
+        self.assertSameOutput(None)
+        self.assertSameOutput(
+            {
+                "int": 1,
+                "big": 2**64,
+                "bool": [True, False, None],
+                "tuple": (1, "a"),
+                "nested": {"list": [{"x": []}], 1: "int key", None: "null key"},
+            }
+        )
+
+    def test_floats(self):
+        values = [0.0, -0.0, 0.1, 1 / 3, 11 / 3, 1e-4, 1e-5, 2.5e-7, 1e15, 1e16]
+        self.assertSameOutput(values + [-value for value in values] + [5e-324])
+
+    def test_strings(self):
+        self.assertSameOutput(
+            ["", "plain", 'quote " and \\ back', "\x00\x1f\x7f", "é ü 😀", "  "]
+        )
+        self.assertSameOutput("looks like 1e5 and 0.00001")
+
+    def test_types_serializers_emit(self):
+        utc = timezone.now()
+        self.assertSameOutput(
+            {
+                "uuid": uuid.uuid4(),
+                "aware": utc,
+                "naive": datetime.datetime(2024, 1, 2, 3, 4, 5, 6),
+                "offset": utc.astimezone(
+                    datetime.timezone(datetime.timedelta(hours=1))
+                ),
+                "date": datetime.date(2024, 1, 2),
+                "time": datetime.time(3, 4, 5),
+                "timedelta": datetime.timedelta(hours=1, microseconds=5),
+                "decimal": decimal.Decimal("4.50"),
+                "lazy": gettext_lazy("lazy string"),
+                "bytes": b"bytes",
+            }
+        )
+
+    def test_rating_payload(self):
+        ratings = [
+            Rating(
+                id=i,
+                user_id=i,
+                rated_user_id=1,
+                rating=1 + i % 5,
+                comment=f"Comment {i} é",
+                created_at=timezone.now(),
+            )
+            for i in range(200)
+        ]
+        self.assertSameOutput(RatingSerializer(ratings, many=True).data)
+
+    def test_indented_output_falls_back(self):
+        self.assertSameOutput({"a": [1, 2]}, "application/json; indent=4")
+
+    def test_unencodable_data_raises_like_json_renderer(self):
+        with self.assertRaises(TypeError):
+            ORJSONRenderer().render({"object": object()})
+
+
+class ORJSONParserTests(SimpleTestCase):
+    """
+    Checks ORJSONParser against JSONParser
+    """
+
+    def parse(self, parser, body):
+        """
+        Parses body, returning the error type if it is rejected
+        """
+        try:
+            return parser.parse(BytesIO(body), parser_context={})
+        except ParseError as exception:
+            return type(exception)
+
+    def test_same_results(self):
+        bodies = [
+            b'{"a": [1, 2.5, "x", null, true], "b": {"c": "\\u00e9"}}',
+            b'{"a": 1, "a": 2}',
+            b'{"big": 123456789012345678901234567890}',
+            b'"\\ud800"',
+            b'{"nan": NaN}',
+            b"{broken",
+            b"",
+        ]
+        for body in bodies:
+            with self.subTest(body=body):
+                self.assertEqual(
+                    self.parse(ORJSONParser(), body), self.parse(JSONParser(), body)
+                )
+
+
+class AccessLogWriterTests(SimpleTestCase):
+    """
+    Tests for the background access log writer
+    """
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, "access.jsonl")
+
+    def writer(self, **options):
+        """
+        A writer for the test file, stopped after the test
+        """
+        options = {
+            "max_bytes": 1 << 20,
+            "backups": 2,
+            "queue_size": 100,
+            "batch_size": 10,
+            "flush_seconds": 0.01,
+            **options,
+        }
+        writer = access_log.AccessLogWriter(self.path, **options)
+        self.addCleanup(writer.stop)
+        return writer
+
+    def read(self, path=None):
+        """
+        Lines of a log file
+        """
+        with open(path or self.path, "rb") as file:
+            return file.read().splitlines()
+
+    def test_writes_lines_in_order(self):
+        writer = self.writer()
+        for number in range(25):
+            writer.write(b"%d\n" % number)
+        writer.flush()
+        self.assertEqual(self.read(), [b"%d" % number for number in range(25)])
+
+    def test_rotates_by_size(self):
+        writer = self.writer(max_bytes=20, batch_size=1)
+        for number in range(7):
+            writer.write(b"line %d...\n" % number)
+        writer.flush()
+        self.assertEqual(self.read(f"{self.path}.2"), [b"line 2...", b"line 3..."])
+        self.assertEqual(self.read(f"{self.path}.1"), [b"line 4...", b"line 5..."])
+        self.assertEqual(self.read(), [b"line 6..."])
+        self.assertFalse(os.path.exists(f"{self.path}.3"))
+
+    def test_drops_and_counts_lines_when_full(self):
+        writer = self.writer(queue_size=2)
+        # The writer thread not running yet, nothing drains the queue
+        with mock.patch.object(writer, "start"):
+            for number in range(5):
+                writer.write(b"%d\n" % number)
+        self.assertEqual(writer.dropped, 3)
+
+        writer.start()
+        writer.stop()
+        self.assertEqual(self.read(), [b"0", b"1", b'{"dropped":3}'])
+
+
+class AccessLogMiddlewareTests(SharedCacheTestMixin, APITestCase):
+    """
+    Tests for the access log lines of requests
+    """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, "access.jsonl")
+        enabled = override_settings(ACCESS_LOG=True, ACCESS_LOG_FILE=self.path)
+        enabled.enable()
+        self.addCleanup(enabled.disable)
+        self.addCleanup(access_log.get_writer().stop)
+
+        self.user = UserAccount.objects.create_user(
+            email="user@example.com", password="pass1234", username="user"
+        )
+        # pylint: disable=E1101
+        UserProfile.objects.create(user=self.user, firstname="Ada", location="Lagos")
+
+    def lines(self):
+        """
+        The lines logged so far
+        """
+        access_log.get_writer().flush()
+        path = os.path.join(os.path.dirname(self.path), f"access-{os.getpid()}.jsonl")
+        with open(path, "rb") as file:
+            return [json.loads(line) for line in file]
+
+    def test_logs_each_request(self):
+        url = reverse("user_profile:user_profile", args=[self.user.pk])
+        self.client.force_authenticate(user=self.user)
+        self.client.get(url)
+        self.client.get(url)
+        self.client.force_authenticate(user=None)
+        self.client.get(url)
+
+        first, cached, anonymous = self.lines()
+        self.assertEqual(first["route"], "user_profile:user_profile")
+        self.assertEqual(first["method"], "GET")
+        self.assertEqual(first["status"], 200)
+        self.assertEqual(first["user"], self.user.pk)
+        self.assertEqual(first["db_queries"], 2)
+        self.assertGreater(first["db_ms"], 0)
+        self.assertGreaterEqual(first["latency_ms"], first["db_ms"])
+        self.assertEqual(first["cache_hits"], 0)
+        self.assertEqual((cached["cache_hits"], cached["db_queries"]), (1, 0))
+        self.assertEqual((anonymous["status"], anonymous["user"]), (401, None))
+
+    def test_unrouted_requests(self):
+        self.client.get("/nowhere/")
+        [line] = self.lines()
+        self.assertEqual((line["route"], line["status"]), (None, 404))
+
+
+class MetricsRegistryTests(SimpleTestCase):
+    """
+    Tests for the metrics registry and its exposition
+    """
+
+    def setUp(self):
+        self.registry = metrics.Registry()
+
+    def test_counters_and_histograms(self):
+        requests = self.registry.counter("requests_total", "Requests", ["view"])
+        latency = self.registry.histogram(
+            "latency_seconds", "Latency", buckets=(0.1, 1)
+        )
+        requests.inc(view="A")
+        requests.inc(2, view="A")
+        requests.inc(view='say "hi"')
+        for seconds in [0.05, 0.1, 0.5, 3]:
+            latency.observe(seconds)
+
+        self.assertEqual(
+            self.registry.exposition(),
+            "# HELP latency_seconds Latency\n"
+            "# TYPE latency_seconds histogram\n"
+            'latency_seconds_bucket{le="0.1"} 2\n'
+            'latency_seconds_bucket{le="1"} 3\n'
+            'latency_seconds_bucket{le="+Inf"} 4\n'
+            "latency_seconds_sum 3.65\n"
+            "latency_seconds_count 4\n"
+            "# HELP requests_total Requests\n"
+            "# TYPE requests_total counter\n"
+            'requests_total{view="A"} 3\n'
+            'requests_total{view="say \\"hi\\""} 1\n',
+        )
+
+    def test_declaring_twice_returns_the_same_metric(self):
+        first = self.registry.counter("requests_total", "Requests")
+        self.assertIs(self.registry.counter("requests_total", "Requests"), first)
+
+    def test_threads_are_summed(self):
+        requests = self.registry.counter("requests_total", "Requests")
+
+        def work():
+            for _ in range(1000):
+                requests.inc()
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # A new thread folds the shards of the ones that ended
+        last = threading.Thread(target=requests.inc)
+        last.start()
+        last.join()
+        requests.inc()
+        self.assertEqual(self.registry.totals()[("requests_total", ())], [4002])
+        self.assertLessEqual(len(self.registry.shards), 2)
+
+    def test_processes_share_a_directory(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with override_settings(METRICS_DIR=directory):
+            self.registry.counter("requests_total", "Requests").inc(2)
+            self.registry.flush()
+            # Another worker process
+            other = metrics.Registry()
+            other.counter("requests_total", "Requests").inc(3)
+            with mock.patch("os.getpid", return_value=0):
+                other.flush()
+
+            self.assertIn("requests_total 5\n", self.registry.exposition())
+            self.assertEqual(len(os.listdir(directory)), 2)
+
+
+class MetricsViewTests(APITestCase):
+    """
+    Tests for the metrics endpoint
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = UserAccount.objects.create_user(
+            email="user@example.com", password="pass1234", username="user"
+        )
+
+    def test_staff_only(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, 403)
+
+    def test_view_latency_is_exposed(self):
+        self.client.force_authenticate(user=self.user)
+        self.client.get(reverse("user_profile:user_profile", args=[self.user.pk]))
+        self.user.is_staff = True
+        response = self.client.get(reverse("metrics"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        body = response.content.decode()
+        self.assertIn("# TYPE view_latency_seconds histogram", body)
+        self.assertIn(
+            'view_latency_seconds_count{view="CreateProfile",method="get"}', body
+        )
+        self.assertIn(
+            'view_responses_total{view="CreateProfile",method="get",status="404"}',
+            body,
+        )
+        self.assertIn("# TYPE password_hashing_seconds histogram", body)
@@ -16,7 +16,11 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from .views import MetricsView
+
 urlpatterns = [
     path("owner/", admin.site.urls),
+    path("metrics/", MetricsView.as_view(), name="metrics"),
     path("", include("users_account.urls", namespace="authentication")),
+    path("", include("main_profile.urls", namespace="user_profile")),
 ]
@@ -0,0 +1,29 @@
+"""
+Views of the project itself rather than of an app
+"""
+from django.http import HttpResponse
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.permissions import IsAdminUser
+from rest_framework.views import APIView
+
+from users_account.authentication import CachedTokenAuthentication
+from .metrics import registry
+
+
+class MetricsView(APIView):
+    """
+    The metrics of every worker in the Prometheus text format, for staff
+    """
+
+    authentication_classes = [CachedTokenAuthentication, SessionAuthentication]
+    permission_classes = [IsAdminUser]
+    query_budget = {"get": 2}
+
+    # pylint: disable=W0613
+    def get(self, request):
+        """
+        Renders the metrics registry
+        """
+        return HttpResponse(
+            registry.exposition(), content_type="text/plain; version=0.0.4"
+        )
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class UsersAccountConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "users_account"
+
+    def ready(self):
+        # pylint: disable=C0415,W0611
+        from . import signals
@@ -0,0 +1,227 @@
+"""
+Token authentication backed by a two-level cache
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication, get_authorization_header
+
+from realtinger.access_log import count_cache_hit
+from realtinger.caches import is_shared
+
+
+class TokenCache:
+    """
+    Bounded token -> (user, token) cache. A process-local LRU with a short
+    TTL sits in front of the Django cache backend, which is shared between
+    processes and is where invalidations take effect everywhere; the local
+    TTL bounds how long another process may keep serving a stale entry.
+    While the backend is a per-process cache, invalidations only reach the
+    process that made them, so its entries get the local TTL too.
+
+    A request that read a token from the database just before it was
+    deleted would cache it again after its invalidation, so deleting a
+    token also leaves a revoked marker behind for revoked_ttl seconds,
+    and an entry cached while there is one is dropped straight away.
+    """
+
+    prefix = "authtoken"
+    # Longer than any request takes to authenticate
+    revoked_ttl = 60
+
+    def __init__(self, maxsize, ttl, local_ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.local_ttl = local_ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.user_keys = {}
+        self.counters = {"local_hits": 0, "shared_hits": 0, "misses": 0}
+
+    def count(self, name):
+        """
+        Bumps one of the hit/miss counters
+        """
+        with self.lock:
+            self.counters[name] += 1
+
+    def stats(self):
+        """
+        Snapshot of the hit/miss counters
+        """
+        with self.lock:
+            stats = dict(self.counters)
+            stats["size"] = len(self.entries)
+        stats["hits"] = stats["local_hits"] + stats["shared_hits"]
+        return stats
+
+    def get_local(self, key):
+        """
+        (user, token) for a token key from the process-local LRU, or None
+        """
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.entries.move_to_end(key)
+                self.counters["local_hits"] += 1
+                count_cache_hit()
+                return self.detach(entry[1])
+        return None
+
+    def get(self, key):
+        """
+        Cached (user, token) for a token key, or None
+        """
+        value = self.get_local(key)
+        if value is not None:
+            return value
+
+        value = cache.get(f"{self.prefix}:{key}")
+        if value is None:
+            self.count("misses")
+            return None
+        self.count("shared_hits")
+        count_cache_hit()
+        self.set_local(key, value)
+        return value
+
+    @staticmethod
+    def detach(value):
+        """
+        Copies a cached (user, token) so a request caching related objects
+        on it does not leak them into other requests
+        """
+        user, token = map(copy.copy, value)
+        token.user = user
+        return user, token
+
+    def set(self, key, value):
+        """
+        Caches (user, token) for a token key at both levels
+        """
+        user, _ = value
+        cache.set_many(
+            {f"{self.prefix}:{key}": value, f"{self.prefix}:user:{user.pk}": key},
+            self.shared_ttl(),
+        )
+        # Checked after the write, so a delete() either sees the entry and
+        # removes it or has left its marker by now
+        if cache.get(f"{self.prefix}:revoked:{key}"):
+            cache.delete(f"{self.prefix}:{key}")
+            return
+        self.set_local(key, value)
+
+    def shared_ttl(self):
+        """
+        How long entries are kept in the Django cache backend
+        """
+        return self.ttl if is_shared() else min(self.ttl, self.local_ttl)
+
+    def set_local(self, key, value):
+        """
+        Caches (user, token) in the process-local LRU only
+        """
+        user_id = value[0].pk
+        value = self.detach(value)
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.local_ttl, value)
+            self.entries.move_to_end(key)
+            self.user_keys.setdefault(user_id, set()).add(key)
+            while len(self.entries) > self.maxsize:
+                old_key, (_, (old_user, _)) = self.entries.popitem(last=False)
+                self.forget_user_key(old_user.pk, old_key)
+
+    def forget_user_key(self, user_id, key):
+        """
+        Drops key from the local user index, lock must be held
+        """
+        keys = self.user_keys.get(user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.user_keys[user_id]
+
+    def delete(self, key):
+        """
+        Invalidates a deleted token key at both levels, and stops requests
+        that are authenticating with it from caching it again
+        """
+        cache.set(f"{self.prefix}:revoked:{key}", True, self.revoked_ttl)
+        cache.delete(f"{self.prefix}:{key}")
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.forget_user_key(entry[1][0].pk, key)
+
+    def delete_user(self, user_id):
+        """
+        Invalidates every cached token of a user at both levels
+        """
+        shared_key = cache.get(f"{self.prefix}:user:{user_id}")
+        if shared_key is not None:
+            cache.delete_many(
+                [f"{self.prefix}:{shared_key}", f"{self.prefix}:user:{user_id}"]
+            )
+        with self.lock:
+            for key in self.user_keys.pop(user_id, ()):
+                self.entries.pop(key, None)
+
+    def clear(self):
+        """
+        Empties the local LRU and resets the counters
+        """
+        with self.lock:
+            self.entries.clear()
+            self.user_keys.clear()
+            self.counters = dict.fromkeys(self.counters, 0)
+
+
+token_cache = TokenCache(
+    maxsize=settings.AUTH_TOKEN_CACHE_SIZE,
+    ttl=settings.AUTH_TOKEN_CACHE_TTL,
+    local_ttl=settings.AUTH_TOKEN_CACHE_LOCAL_TTL,
+)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Drop-in replacement for TokenAuthentication that skips the Token and
+    UserAccount query when the token was seen recently. Entries are
+    invalidated when the token is deleted (logout) and whenever the user
+    is saved (password changes, deactivation), see signals.py.
+    """
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is not None:
+            return cached
+
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(key, (user, token))
+        return user, token
+
+    async def aauthenticate(self, request):
+        """
+        authenticate() for async views. Well-formed tokens found in the
+        process-local cache are answered on the event loop; anything else,
+        including every error case, goes through authenticate() in a thread.
+        """
+        header = get_authorization_header(request).split()
+        if len(header) == 2 and header[0].lower() == self.keyword.lower().encode():
+            cached = token_cache.get_local(header[1].decode(errors="replace"))
+            if cached is not None:
+                return cached
+        return await sync_to_async(self.authenticate)(request)
+
+    @staticmethod
+    def stats():
+        """
+        Hit/miss counters of the token cache in this process
+        """
+        return token_cache.stats()
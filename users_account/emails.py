@@ -0,0 +1,152 @@
+"""
+Rendering of the account emails.
+
+Each email has an HTML template whose <title> is the subject and whose
+text content is the plain-text body. Parsing the rendered HTML on every
+send is slow, so every template is parsed once with placeholder values
+and the extracted subject and body are kept with the placeholders in
+place. Sending an email then only renders the HTML and substitutes the
+real values into the cached subject and body.
+"""
+import html
+import re
+import secrets
+from functools import lru_cache
+
+from bs4 import BeautifulSoup
+from django.template import Context
+from django.template.base import TextNode, VariableNode, render_value_in_context
+from django.template.loader import get_template
+
+from realtinger.metrics import histogram
+
+render_seconds = histogram(
+    "email_render_seconds", "Time to render an email", ["template"]
+)
+
+
+def extract_confirm_email(email_html):
+    """
+    Subject and body of a confirmation email, parsed from its HTML
+    """
+    soup = BeautifulSoup(email_html, "html.parser")
+    subject = soup.title.string.strip()
+    message_elements = soup.find_all("td", class_="content-block")
+    message_parts = [element.get_text().strip() for element in message_elements]
+    return subject, "\n".join(message_parts)
+
+
+def extract_password_reset_email(email_html):
+    """
+    Subject and body of a password reset email, parsed from its HTML
+    """
+    soup = BeautifulSoup(email_html, "html.parser")
+    subject = soup.title.string.strip()
+    return subject, soup.find_all("p")[0].get_text()
+
+
+class EmailTemplate:
+    """
+    An HTML email template with its subject and body precompiled.
+
+    extract pulls (subject, body) out of the rendered HTML. It runs once
+    against the template rendered with placeholders, and on every render
+    only when the precompiled path cannot reproduce its output: templates
+    using tags or filters, and empty or whitespace-padded values.
+    """
+
+    def __init__(self, template_name, extract):
+        self.name = template_name
+        self.template = get_template(template_name)
+        self.extract = extract
+        self.variables = self.plain_variables(self.template.template.nodelist)
+        self.compiled = None
+        if self.variables is not None:
+            self.compile()
+
+    @staticmethod
+    def plain_variables(nodelist):
+        """
+        The variable nodes of a template made only of text and unfiltered
+        variables, or None if it uses anything else
+        """
+        variables = []
+        for node in nodelist:
+            if isinstance(node, VariableNode) and not node.filter_expression.filters:
+                variables.append(node.filter_expression)
+            elif not isinstance(node, TextNode):
+                return None
+        return variables
+
+    def compile(self):
+        """
+        Renders the template with a unique placeholder for every variable
+        and extracts the subject and body once
+        """
+        token = secrets.token_hex(8)
+        context = {}
+        self.placeholders = {}
+        for index, expression in enumerate(self.variables):
+            lookups = expression.var.lookups
+            if not lookups:
+                return
+            placeholder = f"emailvar{index}x{token}"
+            level = context
+            for name in lookups[:-1]:
+                level = level.setdefault(name, {})
+                if not isinstance(level, dict):
+                    return
+            if isinstance(level.get(lookups[-1]), dict):
+                return
+            placeholder = level.setdefault(lookups[-1], placeholder)
+            self.placeholders[placeholder] = expression
+
+        subject, body = self.extract(self.template.render(context))
+        pattern = re.compile("|".join(map(re.escape, self.placeholders)) or "(?!)")
+        self.compiled = (pattern, subject, body)
+
+    def render(self, context):
+        """
+        Returns (subject, plain-text body, HTML body) for a context,
+        identical to parsing the rendered HTML with extract
+        """
+        with render_seconds.time(template=self.name):
+            email_html = self.template.render(context)
+            if self.compiled is None:
+                return (*self.extract(email_html), email_html)
+
+            pattern, subject, body = self.compiled
+            template_context = Context(context)
+            values = {
+                placeholder: html.unescape(
+                    render_value_in_context(
+                        expression.resolve(template_context), template_context
+                    )
+                )
+                for placeholder, expression in self.placeholders.items()
+            }
+            # The extractors strip whitespace around each element's text, which
+            # would also eat into a value that is empty or padded with spaces
+            if any(not value or value != value.strip() for value in values.values()):
+                return (*self.extract(email_html), email_html)
+
+            def substitute(text):
+                return pattern.sub(lambda match: values[match.group(0)], text)
+
+            return substitute(subject), substitute(body), email_html
+
+
+@lru_cache(maxsize=None)
+def confirm_email():
+    """
+    The account confirmation email, compiled once per process
+    """
+    return EmailTemplate("user/confirm_email.html", extract_confirm_email)
+
+
+@lru_cache(maxsize=None)
+def password_reset_email():
+    """
+    The password reset email, compiled once per process
+    """
+    return EmailTemplate("user/password_reset_email.html", extract_password_reset_email)
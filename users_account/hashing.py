@@ -0,0 +1,123 @@
+"""
+Password hashing in a process pool.
+
+Hashing and verifying passwords is deliberately slow CPU work. Run on the
+request thread it stalls every other thread of the worker that needs the
+GIL for as long as it lasts, so it is handed to a pool of
+PASSWORD_HASHING_WORKERS processes instead, or done inline when that is
+0. The pool size also bounds how many hashes run at once, however many
+requests arrive together.
+
+make_password and check_password behave as Django's own, including
+rehashing passwords stored with outdated hasher parameters.
+"""
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import (
+    UNUSABLE_PASSWORD_PREFIX,
+    UNUSABLE_PASSWORD_SUFFIX_LENGTH,
+    get_hasher,
+    identify_hasher,
+    is_password_usable,
+)
+from django.utils.crypto import get_random_string
+
+from realtinger.metrics import histogram
+
+hashing_seconds = histogram(
+    "password_hashing_seconds",
+    "Time to hash or verify a password, waiting for the pool included",
+    ["operation"],
+)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool(workers):
+    """
+    The shared process pool, started on first use
+    """
+    # pylint: disable=W0603
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Forking a process that runs request threads and holds
+            # database connections is unsafe, so workers are spawned fresh
+            _pool = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+def shutdown_pool():
+    """
+    Stops the shared process pool, if it was started
+    """
+    # pylint: disable=W0603
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+
+def run(func, *args):
+    """
+    Calls a hasher method in the process pool, or inline when
+    PASSWORD_HASHING_WORKERS is 0
+    """
+    workers = settings.PASSWORD_HASHING_WORKERS
+    with hashing_seconds.time(operation=func.__name__):
+        if not workers:
+            return func(*args)
+        return get_pool(workers).submit(func, *args).result()
+
+
+def make_password(password):
+    """
+    Hashes a password with the preferred hasher, or returns an unusable
+    password for None
+    """
+    if password is None:
+        return UNUSABLE_PASSWORD_PREFIX + get_random_string(
+            UNUSABLE_PASSWORD_SUFFIX_LENGTH
+        )
+    if not isinstance(password, (bytes, str)):
+        raise TypeError(
+            "Password must be a string or bytes, got %s." % type(password).__qualname__
+        )
+    hasher = get_hasher("default")
+    return run(hasher.encode, password, hasher.salt())
+
+
+def check_password(password, encoded, setter=None):
+    """
+    Whether a password matches its hash. A correct password stored with
+    another hasher or outdated parameters is passed to setter to be
+    hashed again.
+    """
+    if password is None or not is_password_usable(encoded):
+        return False
+
+    preferred = get_hasher("default")
+    try:
+        hasher = identify_hasher(encoded)
+    except ValueError:
+        return False
+
+    hasher_changed = hasher.algorithm != preferred.algorithm
+    must_update = hasher_changed or preferred.must_update(encoded)
+    is_correct = run(hasher.verify, password, encoded)
+
+    # A wrong password against an outdated hash must take as long as
+    # against an up to date one, so it leaks nothing about the hash
+    if not is_correct and not hasher_changed and must_update:
+        run(hasher.harden_runtime, password, encoded)
+
+    if setter and is_correct and must_update:
+        setter(password)
+    return is_correct
@@ -0,0 +1,65 @@
+"""
+Management command that deletes expired unverified accounts
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from users_account.models import UserAccount
+
+
+class Command(BaseCommand):
+    """
+    Deletes accounts that were not verified within the verification
+    window, in small batches so no transaction holds locks for long
+    """
+
+    help = "Delete unverified accounts older than the verification window"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of accounts deleted per transaction",
+        )
+        parser.add_argument(
+            "--pause",
+            type=float,
+            default=0,
+            help="Seconds to sleep between batches",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only count the accounts that would be deleted",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        cutoff = timezone.now() - UserAccount.VERIFICATION_WINDOW
+        # pylint: disable=E1101
+        expired = UserAccount.objects.filter(
+            is_verified=False, date_joined__lt=cutoff
+        ).order_by("date_joined", "pk")
+
+        if options["dry_run"]:
+            self.stdout.write(f"{expired.count()} expired accounts would be deleted")
+            return
+
+        deleted = 0
+        while True:
+            with transaction.atomic():
+                ids = list(expired.values_list("pk", flat=True)[:batch_size])
+                if not ids:
+                    break
+                UserAccount.objects.filter(pk__in=ids).delete()
+
+            deleted += len(ids)
+            self.stdout.write(f"Deleted {deleted} expired accounts")
+            if options["pause"]:
+                time.sleep(options["pause"])
+
+        self.stdout.write(self.style.SUCCESS(f"Done: {deleted} accounts deleted"))
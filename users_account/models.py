@@ -3,15 +3,17 @@ Model representing the user authentication
 """
 
 import uuid
+from datetime import timedelta
 from django.contrib.auth.models import (
     AbstractBaseUser,
     PermissionsMixin,
     BaseUserManager,
 )
-from django.contrib.auth.hashers import make_password, check_password
 from django.db import models
 from django.utils import timezone
 
+from .hashing import check_password, make_password
+
 
 class UserManager(BaseUserManager):
     """
@@ -50,7 +52,7 @@ class UserAccount(AbstractBaseUser, PermissionsMixin):
     password = models.CharField(max_length=178)
     is_verified = models.BooleanField(default=False)
     date_joined = models.DateTimeField(default=timezone.now)
-    token = models.UUIDField(default=uuid.uuid4, editable=False)
+    token = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
     is_superuser = models.BooleanField(default=False)
     is_staff = models.BooleanField(default=False)
     is_active = models.BooleanField(default=True)
@@ -65,6 +67,9 @@ class UserAccount(AbstractBaseUser, PermissionsMixin):
         max_length=11, choices=USER_TYPE_CHOICES, default=BUYER
     )
 
+    # How long a new account may stay unverified
+    VERIFICATION_WINDOW = timedelta(days=3)
+
     objects = UserManager()
 
     USERNAME_FIELD = "email"
@@ -79,15 +84,21 @@ class UserAccount(AbstractBaseUser, PermissionsMixin):
 
     def set_password(self, password):
         """
-        Sets and hash the password
+        Sets and hash the password, in the hashing process pool
         """
         self.password = make_password(password)
 
     def check_password(self, password):
         """
-        Make sure the password matches
+        Make sure the password matches, and hash it again if the hasher's
+        parameters changed since it was stored
         """
-        return check_password(password, self.password)
+
+        def setter(password):
+            self.set_password(password)
+            self.save(update_fields=["password"])
+
+        return check_password(password, self.password, setter)
 
     class Meta:
         """
@@ -96,3 +107,10 @@ class UserAccount(AbstractBaseUser, PermissionsMixin):
 
         verbose_name = "User Account"
         verbose_name_plural = "User Accounts"
+        indexes = [
+            # Serves the sweep of expired unverified accounts
+            models.Index(
+                fields=["is_verified", "date_joined"],
+                name="account_verified_joined_idx",
+            ),
+        ]
@@ -0,0 +1,29 @@
+"""
+Signal handlers for the accounts app
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import token_cache
+from .models import UserAccount
+
+
+# pylint: disable=W0613
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    """
+    Stops a deleted (logged out) token from authenticating from the cache
+    """
+    token_cache.delete(instance.key)
+
+
+# pylint: disable=W0613
+@receiver(post_save, sender=UserAccount)
+def invalidate_saved_user(sender, instance, created, **kwargs):
+    """
+    Drops cached copies of a user whose password, active flag or other
+    fields may have changed
+    """
+    if not created:
+        token_cache.delete_user(instance.pk)
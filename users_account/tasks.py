@@ -0,0 +1,26 @@
+"""
+Background tasks for the accounts app
+"""
+from django.conf import settings
+from django.core.mail import send_mail
+
+from jobs.tasks import task
+from realtinger.metrics import histogram
+
+send_seconds = histogram("email_send_seconds", "Time to send an email")
+
+
+@task("send_email")
+def send_email(subject, message, recipient_list, html_message=None):
+    """
+    Sends an email through the configured backend
+    """
+    with send_seconds.time():
+        send_mail(
+            subject=subject,
+            message=message,
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            recipient_list=recipient_list,
+            html_message=html_message,
+            fail_silently=False,
+        )
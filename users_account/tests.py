@@ -1,3 +1,575 @@
-from django.test import TestCase
+"""
+Tests for the accounts app
+"""
+import threading
+import uuid
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core import mail
+from django.core.cache import cache
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.core.management import call_command
+from django.db import connection
+from django.template.loader import render_to_string
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase, APITransactionTestCase
+
+from jobs.models import Job
+from jobs.worker import Worker
+from realtinger.testing import QueryBudgetTestMixin, SharedCacheTestMixin
+from . import hashing, throttling
+from .authentication import CachedTokenAuthentication, token_cache
+from .emails import (
+    confirm_email,
+    extract_confirm_email,
+    extract_password_reset_email,
+    password_reset_email,
+)
+from .models import UserAccount
+
+
+class AccountTestCase(QueryBudgetTestMixin, APITestCase):
+    """
+    Creates a verified user
+    """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        token_cache.clear()
+        throttling.local_buckets.clear()
+        self.user = UserAccount.objects.create_user(
+            email="user@example.com",
+            password="pass1234",
+            username="user",
+            is_verified=True,
+        )
+
+    def run_jobs(self):
+        """
+        Runs every queued job inline
+        """
+        worker = Worker()
+        while worker.run_once():
+            pass
+
+
+class EmailJobTests(AccountTestCase):
+    """
+    Tests that account emails are sent by the job worker
+    """
+
+    def test_registration_queues_confirmation_email(self):
+        response = self.client.post(
+            reverse("authentication:register"),
+            {"email": "new@example.com", "password": "pass1234", "username": "new"},
+            HTTP_X_REQUESTED_FROM="example.com",
+        )
+
+        self.assertTrue(response.data["success"])
+        self.assertEqual(mail.outbox, [])
+
+        self.run_jobs()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["new@example.com"])
+        html, _ = mail.outbox[0].alternatives[0]
+        self.assertIn(str(response.data["token"]), html)
+
+    def test_relay_outage_keeps_the_new_user(self):
+        with mock.patch(
+            "users_account.tasks.send_mail", side_effect=OSError("relay down")
+        ):
+            response = self.client.post(
+                reverse("authentication:register"),
+                {"email": "new@example.com", "password": "pass1234", "username": "new"},
+            )
+            self.run_jobs()
+
+        self.assertTrue(response.data["success"])
+        self.assertTrue(UserAccount.objects.filter(email="new@example.com").exists())
+
+    def test_password_reset_queues_email(self):
+        response = self.client.post(
+            reverse("authentication:password_reset"), {"email": self.user.email}
+        )
+
+        self.assertTrue(response.data["success"])
+        self.run_jobs()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, [self.user.email])
+
+
+class EmailRenderingTests(AccountTestCase):
+    """
+    Tests that precompiled emails match parsing the rendered HTML
+    """
+
+    NAMES = ["user", "<b>bold</b>", "tom & jerry", 'it\'s "quoted"', "&amp;", ""]
+
+    def assert_matches_parsed(self, email, template_name, extract, context):
+        """
+        Compares the precompiled output with the BeautifulSoup path
+        """
+        email_html = render_to_string(template_name, context)
+        subject, message = extract(email_html)
+        self.assertEqual(email.render(context), (subject, message, email_html))
+
+    def test_confirm_email_matches_parsed_html(self):
+        self.assertIsNotNone(confirm_email().compiled)
+        for name in self.NAMES + [" padded "]:
+            self.assert_matches_parsed(
+                confirm_email(),
+                "user/confirm_email.html",
+                extract_confirm_email,
+                {
+                    "user": UserAccount(username=name),
+                    "site_url": "example.com",
+                    "token": uuid.uuid4(),
+                },
+            )
+
+    def test_password_reset_email_matches_parsed_html(self):
+        self.assertIsNotNone(password_reset_email().compiled)
+        for name in self.NAMES:
+            self.assert_matches_parsed(
+                password_reset_email(),
+                "user/password_reset_email.html",
+                extract_password_reset_email,
+                {
+                    "protocol": "https",
+                    "domain": name,
+                    "uidb64": "MQ",
+                    "token": "abc-123:1700000000",
+                },
+            )
+
+
+class PurgeUnverifiedTests(AccountTestCase):
+    """
+    Tests for the sweep of expired unverified accounts
+    """
+
+    def test_deletes_only_expired_unverified_accounts(self):
+        old = timezone.now() - UserAccount.VERIFICATION_WINDOW - timedelta(hours=1)
+        for i in range(3):
+            UserAccount.objects.create_user(
+                email=f"stale{i}@example.com",
+                username=f"stale{i}",
+                password="pass1234",
+                date_joined=old,
+            )
+        fresh = UserAccount.objects.create_user(
+            email="fresh@example.com", username="fresh", password="pass1234"
+        )
+        UserAccount.objects.filter(pk=self.user.pk).update(date_joined=old)
+
+        out = StringIO()
+        call_command("purge_unverified", batch_size=2, stdout=out)
+
+        self.assertEqual(
+            set(UserAccount.objects.values_list("pk", flat=True)),
+            {self.user.pk, fresh.pk},
+        )
+        self.assertIn("Deleted 2 expired accounts", out.getvalue())
+        self.assertIn("Done: 3 accounts deleted", out.getvalue())
+
+
+class CachedTokenAuthenticationTests(AccountTestCase):
+    """
+    Tests for the cached token authentication class
+    """
+
+    def setUp(self):
+        super().setUp()
+        # pylint: disable=E1101
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+        self.url = reverse("user_profile:rating_summary", args=[self.user.pk])
+
+    def test_cached_request_skips_the_token_query(self):
+        with self.assertNumQueries(2):
+            self.client.get(self.url)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        stats = CachedTokenAuthentication.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+
+    def test_shared_cache_serves_other_processes(self):
+        self.client.get(self.url)
+        token_cache.clear()
+
+        with self.assertNumQueries(1):
+            self.client.get(self.url)
+        self.assertEqual(CachedTokenAuthentication.stats()["shared_hits"], 1)
+
+    def test_logout_invalidates_token(self):
+        self.client.get(self.url)
+        response = self.client.post(reverse("authentication:logout"))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivation_invalidates_token(self):
+        self.client.get(self.url)
+        self.user.is_active = False
+        self.user.save()
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_password_change_invalidates_cached_user(self):
+        self.client.get(self.url)
+        self.user.set_password("new-pass1234")
+        self.user.save()
+
+        with self.assertNumQueries(2):
+            self.client.get(self.url)
+
+    def test_logout_while_authenticating_does_not_cache_the_token(self):
+        original = TokenAuthentication.authenticate_credentials
+
+        def authenticate_then_log_out(authentication, key):
+            value = original(authentication, key)
+            self.token.delete()
+            return value
+
+        with mock.patch.object(
+            TokenAuthentication, "authenticate_credentials", authenticate_then_log_out
+        ):
+            CachedTokenAuthentication().authenticate_credentials(self.token.key)
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+    )
+    def test_process_local_cache_keeps_entries_briefly(self):
+        token_cache.clear()
+        cache.clear()
+        with mock.patch.object(cache, "set_many") as set_many:
+            self.client.get(self.url)
+        self.assertEqual(set_many.call_args.args[1], token_cache.local_ttl)
+
+
+class SharedTokenCacheTests(SharedCacheTestMixin, CachedTokenAuthenticationTests):
+    """
+    Reruns the token cache tests against a cache shared between processes
+    """
+
+    def test_shared_cache_keeps_entries_for_the_full_ttl(self):
+        with mock.patch.object(cache, "set_many") as set_many:
+            self.client.get(self.url)
+        self.assertEqual(set_many.call_args.args[1], token_cache.ttl)
+
+
+class QueryBudgetTests(AccountTestCase):
+    """
+    Pins the number of queries each account endpoint runs
+    """
+
+    def test_registration_and_verification(self):
+        response = self.client.post(
+            reverse("authentication:register"),
+            {"email": "new@example.com", "password": "pass1234", "username": "new"},
+        )
+        self.assertQueryCount(response, 4)
+
+        response = self.client.post(
+            reverse("authentication:request-new-link"), {"email": "new@example.com"}
+        )
+        self.assertQueryCount(response, 3)
+
+        response = self.client.post(
+            reverse("authentication:verify"), {"token": response.data["token"]}
+        )
+        self.assertTrue(response.data["success"])
+        self.assertQueryCount(response, 2)
+
+    def test_expired_verification_link(self):
+        user = UserAccount.objects.create_user(
+            email="late@example.com",
+            username="late",
+            password="pass1234",
+            date_joined=timezone.now() - UserAccount.VERIFICATION_WINDOW,
+        )
+        response = self.client.post(
+            reverse("authentication:verify"), {"token": user.token}
+        )
+        self.assertFalse(response.data["success"])
+        self.assertFalse(UserAccount.objects.filter(pk=user.pk).exists())
+        self.assertQueryCount(response, 10)
+
+    def test_login_and_logout(self):
+        response = self.client.post(
+            reverse("authentication:login"),
+            {"email": self.user.email, "password": "pass1234"},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertQueryCount(response, 7)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {response.data['token']}")
+
+        # Token lookup and delete, then loading and flushing the session
+        response = self.client.post(reverse("authentication:logout"))
+        self.assertQueryCount(response, 4)
+
+    def test_password_reset(self):
+        response = self.client.post(
+            reverse("authentication:password_reset"), {"email": self.user.email}
+        )
+        self.assertQueryCount(response, 2)
+
+        response = self.client.post(
+            reverse("authentication:password_reset_confirm"),
+            {
+                "uidb64": response.data["uidb64"],
+                "token": response.data["token"],
+                "password1": "new-pass1234",
+                "password2": "new-pass1234",
+            },
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertQueryCount(response, 2)
+
+
+@skipUnless(connection.vendor == "sqlite", "SQLite sends BEGIN for atomic()")
+class TransactionQueryBudgetTests(QueryBudgetTestMixin, APITransactionTestCase):
+    """
+    Pins query counts outside the transaction every TestCase test runs in,
+    where atomic() blocks begin and commit real transactions
+    """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        token_cache.clear()
+        throttling.local_buckets.clear()
+        self.user = UserAccount.objects.create_user(
+            email="user@example.com",
+            password="pass1234",
+            username="user",
+            is_verified=True,
+        )
+
+    def test_login_stays_within_budget(self):
+        with self.assertNoLogs("realtinger.query_budget", "WARNING"):
+            response = self.client.post(
+                reverse("authentication:login"),
+                {"email": self.user.email, "password": "pass1234"},
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertQueryCount(response, 7)
+
+
+class PasswordHashingTests(AccountTestCase):
+    """
+    Tests for password hashing in the process pool
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(hashing.shutdown_pool)
+
+    def login(self, password="pass1234"):
+        """
+        Posts the user's credentials to the login endpoint
+        """
+        return self.client.post(
+            reverse("authentication:login"),
+            {"email": self.user.email, "password": password},
+        )
+
+    def test_pool_hashes_and_verifies(self):
+        with override_settings(PASSWORD_HASHING_WORKERS=1):
+            encoded = hashing.make_password("secret")
+            self.assertTrue(hashing.check_password("secret", encoded))
+            self.assertFalse(hashing.check_password("wrong", encoded))
+        self.assertIsNotNone(hashing._pool)  # pylint: disable=W0212
+        self.assertTrue(hashing.check_password("secret", encoded))
+        self.assertFalse(hashing.check_password(None, encoded))
+        self.assertFalse(hashing.check_password("secret", hashing.make_password(None)))
+
+    def test_login_rehashes_outdated_passwords(self):
+        old = PBKDF2PasswordHasher().encode("pass1234", "saltsalt", iterations=1000)
+        UserAccount.objects.filter(pk=self.user.pk).update(password=old)
+
+        self.assertEqual(self.login("wrong").status_code, 401)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.password, old)
+
+        response = self.login()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertQueryCount(response, 8)
+        self.user.refresh_from_db()
+        self.assertNotEqual(self.user.password, old)
+        self.assertFalse(PBKDF2PasswordHasher().must_update(self.user.password))
+
+        rehashed = self.user.password
+        self.login()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.password, rehashed)
+
+    def test_password_reset_hashes_once(self):
+        response = self.client.post(
+            reverse("authentication:password_reset"), {"email": self.user.email}
+        )
+        with mock.patch("users_account.hashing.run", wraps=hashing.run) as run:
+            response = self.client.post(
+                reverse("authentication:password_reset_confirm"),
+                {
+                    "uidb64": response.data["uidb64"],
+                    "token": response.data["token"],
+                    "password1": "new-pass1234",
+                    "password2": "new-pass1234",
+                },
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(run.call_count, 1)
+        self.assertEqual(self.login("new-pass1234").status_code, status.HTTP_200_OK)
+
+
+class TokenBucketTests(SimpleTestCase):
+    """
+    Tests for the local and shared token buckets
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.clock = mock.patch("users_account.throttling.time")
+        self.time = self.clock.start()
+        self.time.monotonic.return_value = self.time.time.return_value = 1000.0
+        self.addCleanup(self.clock.stop)
+
+    def advance(self, seconds):
+        """
+        Moves the buckets' clocks forward
+        """
+        self.time.monotonic.return_value += seconds
+        self.time.time.return_value += seconds
+
+    def buckets(self):
+        """
+        A fresh bucket store of each kind
+        """
+        return [throttling.LocalBuckets(100), throttling.CacheBuckets()]
+
+    def test_refill(self):
+        for buckets in self.buckets():
+            key = f"refill:{type(buckets).__name__}"
+            self.assertEqual(buckets.take(key, 2, 1), 0)
+            self.assertEqual(buckets.take(key, 2, 1), 0)
+            self.assertAlmostEqual(buckets.take(key, 2, 1), 1)
+            self.advance(0.5)
+            self.assertAlmostEqual(buckets.take(key, 2, 1), 0.5)
+            self.advance(0.5)
+            self.assertEqual(buckets.take(key, 2, 1), 0)
+
+            # Idle buckets fill up to their capacity and no further
+            self.advance(100)
+            waits = [buckets.take(key, 2, 1) for _ in range(3)]
+            self.assertEqual(waits[:2], [0, 0])
+            self.assertGreater(waits[2], 0)
+
+    def test_concurrent_takes_never_exceed_capacity(self):
+        for buckets in self.buckets():
+            allowed = []
+            barrier = threading.Barrier(8)
+
+            def take(buckets=buckets, allowed=allowed):
+                barrier.wait()
+                for _ in range(50):
+                    if not buckets.take("concurrent", 100, 0.001):
+                        allowed.append(1)
+
+            threads = [threading.Thread(target=take) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(len(allowed), 100, type(buckets).__name__)
+
+    def test_local_refusals_skip_the_cache(self):
+        throttling.local_buckets.clear()
+        with mock.patch.object(
+            throttling, "is_shared", return_value=True
+        ), mock.patch.object(
+            throttling.cache_buckets, "take", return_value=0
+        ) as shared:
+            self.assertEqual(throttling.take("fast", 1, 1), 0)
+            self.assertGreater(throttling.take("fast", 1, 1), 0)
+        self.assertEqual(shared.call_count, 1)
+        throttling.local_buckets.clear()
+
+    def test_process_local_cache_is_not_used(self):
+        throttling.local_buckets.clear()
+        self.addCleanup(throttling.local_buckets.clear)
+        with override_settings(
+            CACHES={
+                "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+            }
+        ), mock.patch.object(throttling.cache_buckets, "take") as shared:
+            self.assertEqual(throttling.take("local", 1, 1), 0)
+        shared.assert_not_called()
+
+
+@override_settings(
+    THROTTLE_RATES={
+        "login": {"ip": (100, 60), "email": (2, 60)},
+        "password_reset": {"ip": (1, 60)},
+    }
+)
+class ThrottlingTests(AccountTestCase):
+    """
+    Tests that over-limit requests are refused before any expensive work
+    """
+
+    def test_login_is_throttled_before_hashing(self):
+        url = reverse("authentication:login")
+        credentials = {"email": "User@example.com ", "password": "wrong"}
+        for _ in range(2):
+            self.assertEqual(self.client.post(url, credentials).status_code, 401)
+
+        with mock.patch("users_account.hashing.run") as run:
+            response = self.client.post(url, credentials)
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response.headers["Retry-After"], "30")
+        run.assert_not_called()
+
+        # Other addresses from the same client are still let through
+        credentials["email"] = "other@example.com"
+        self.assertEqual(self.client.post(url, credentials).status_code, 401)
+
+    def test_forwarded_for_header_does_not_reset_the_ip_bucket(self):
+        url = reverse("authentication:password_reset")
+        self.client.post(
+            url, {"email": "a@example.com"}, HTTP_X_FORWARDED_FOR="1.1.1.1"
+        )
+        response = self.client.post(
+            url, {"email": "b@example.com"}, HTTP_X_FORWARDED_FOR="2.2.2.2"
+        )
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_body_that_is_not_an_object(self):
+        response = self.client.post(
+            reverse("authentication:register"), ["email"], format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_password_reset_is_throttled_before_mail(self):
+        url = reverse("authentication:password_reset")
+        self.client.post(url, {"email": self.user.email})
+        response = self.client.post(url, {"email": self.user.email})
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn("Retry-After", response.headers)
+        # pylint: disable=E1101
+        self.assertEqual(Job.objects.filter(name="send_email").count(), 1)
@@ -0,0 +1,207 @@
+"""
+Token bucket throttling of the account endpoints anyone can call.
+
+Logging in, registering and asking for emails each cost a password hash
+or a message before anything else is checked, so bursts against them are
+turned away first, with a 429 and a Retry-After header, by DRF throttle
+classes that run before the view. Every request takes a token from a
+bucket per client IP and one per target email address, as configured per
+scope in THROTTLE_RATES; buckets hold up to capacity tokens and refill at
+capacity per period.
+
+Buckets are always kept in this process, where taking a token costs a
+dict lookup. With THROTTLE_BACKEND = "cache" and a cache shared between
+processes (see realtinger/caches.py) they are also kept in that cache so
+the limits hold across processes, and a request the local bucket already
+refuses never reaches the cache: this process alone seeing too many
+requests means all of them together have.
+
+Clients are told apart by REMOTE_ADDR, or behind NUM_PROXIES proxies by
+the address the outermost proxy added to X-Forwarded-For, never by a
+header value the client chose itself.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.throttling import BaseThrottle
+
+from realtinger.caches import is_shared
+
+
+class LocalBuckets:
+    """
+    Token buckets kept in this process, the least recently used dropped
+    past maxsize. A dropped bucket comes back full.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.buckets = OrderedDict()
+
+    def take(self, key, capacity, rate):
+        """
+        Takes a token from the bucket under key. Returns 0 if there was
+        one, else the seconds until there is.
+        """
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated = self.buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            if tokens >= 1:
+                wait, tokens = 0, tokens - 1
+            else:
+                wait = (1 - tokens) / rate
+            self.buckets[key] = (tokens, now)
+            self.buckets.move_to_end(key)
+            while len(self.buckets) > self.maxsize:
+                self.buckets.popitem(last=False)
+        return wait
+
+    def clear(self):
+        """
+        Refills every bucket
+        """
+        with self.lock:
+            self.buckets.clear()
+
+
+class CacheBuckets:
+    """
+    Token buckets kept in the Django cache and shared between processes.
+
+    A bucket is a start time and the number of tokens taken since, and
+    holds (now - start) * rate - taken tokens. Tokens are taken with an
+    atomic incr and given back with decr when there were none, so
+    concurrent requests never take more tokens than the bucket holds. A
+    bucket that has filled past its capacity while idle has its start
+    moved up so it is just full.
+    """
+
+    prefix = "throttle"
+
+    def take(self, key, capacity, rate):
+        """
+        Takes a token from the bucket under key. Returns 0 if there was
+        one, else the seconds until there is.
+        """
+        now = time.time()
+        # Both keys expire this long after they were created, which at
+        # worst hands a client a full bucket once per timeout
+        timeout = max(3600, 10 * capacity / rate)
+        start_key = f"{self.prefix}:{key}:start"
+        taken_key = f"{self.prefix}:{key}:taken"
+
+        cache.add(taken_key, 0, timeout)
+        start = cache.get(start_key)
+        if start is None:
+            cache.add(start_key, now - capacity / rate, timeout)
+            start = cache.get(start_key)
+        taken = cache.incr(taken_key)
+
+        available = (now - start) * rate
+        if available - taken >= capacity:
+            # Full before this request took its token
+            available = capacity + taken - 1
+            cache.set(start_key, now - available / rate, timeout)
+        if taken <= available:
+            return 0
+        cache.decr(taken_key)
+        return (taken - available) / rate
+
+
+local_buckets = LocalBuckets(settings.THROTTLE_LOCAL_SIZE)
+cache_buckets = CacheBuckets()
+
+
+def take(key, capacity, rate):
+    """
+    Takes a token from a bucket, locally and then in the shared cache when
+    that is the backend. Returns 0 if there was one, else the seconds
+    until there is.
+    """
+    wait = local_buckets.take(key, capacity, rate)
+    # A cache of this process only would hold the same buckets again
+    if wait or settings.THROTTLE_BACKEND != "cache" or not is_shared():
+        return wait
+    return cache_buckets.take(key, capacity, rate)
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Throttles requests by client IP and by the email address they target,
+    at the rates THROTTLE_RATES gives for the class's scope
+    """
+
+    scope = None
+
+    def __init__(self):
+        self.wait_time = 0
+
+    def get_email(self, request):
+        """
+        The email address a request is about, if any
+        """
+        # A JSON body may also be a list, a string or a number
+        if not isinstance(request.data, dict):
+            return None
+        email = str(request.data.get("email") or "").strip().lower()
+        return email or None
+
+    def allow_request(self, request, view):
+        idents = {"ip": self.get_ident(request), "email": self.get_email(request)}
+        for kind, (capacity, period) in settings.THROTTLE_RATES.get(
+            self.scope, {}
+        ).items():
+            if idents.get(kind) is not None:
+                wait = take(
+                    f"{self.scope}:{kind}:{idents[kind]}", capacity, capacity / period
+                )
+                self.wait_time = max(self.wait_time, wait)
+        return not self.wait_time
+
+    def wait(self):
+        return self.wait_time
+
+
+class LoginThrottle(TokenBucketThrottle):
+    """
+    Throttles login attempts
+    """
+
+    scope = "login"
+
+
+class RegistrationThrottle(TokenBucketThrottle):
+    """
+    Throttles registrations
+    """
+
+    scope = "register"
+
+
+class VerificationEmailThrottle(TokenBucketThrottle):
+    """
+    Throttles requests for a new verification email
+    """
+
+    scope = "verification_email"
+
+
+class PasswordResetThrottle(TokenBucketThrottle):
+    """
+    Throttles requests for a password reset email
+    """
+
+    scope = "password_reset"
+
+
+class PasswordResetConfirmThrottle(TokenBucketThrottle):
+    """
+    Throttles password reset confirmations, which hash the new password
+    """
+
+    scope = "password_reset_confirm"
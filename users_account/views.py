@@ -8,20 +8,15 @@ import uuid
 
 from datetime import timedelta, datetime
 from urllib.parse import urlparse, unquote
-from django.core.mail import send_mail
-from django.conf import settings
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.tokens import default_token_generator
-from django.template.loader import render_to_string
-from bs4 import BeautifulSoup
 from django.utils import timezone
 from django.utils.encoding import force_bytes
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.views.decorators.csrf import csrf_protect
 from rest_framework import status
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.authtoken.models import Token
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework.views import APIView
@@ -30,8 +25,19 @@ from django.contrib.auth import get_user_model
 
 import pytz
 
+from jobs.tasks import enqueue
+from realtinger.query_budget import query_budget
+from .authentication import CachedTokenAuthentication
+from .emails import confirm_email, password_reset_email
 from .models import UserAccount
 from .serializers import UserSerializer
+from .throttling import (
+    LoginThrottle,
+    PasswordResetConfirmThrottle,
+    PasswordResetThrottle,
+    RegistrationThrottle,
+    VerificationEmailThrottle,
+)
 
 User = get_user_model()
 logger = logging.getLogger(__name__)
@@ -43,6 +49,8 @@ class RegistrationView(APIView):
     """
 
     permission_classes = [AllowAny]
+    throttle_classes = [RegistrationThrottle]
+    query_budget = {"post": 4}
 
     def post(self, request):
         """
@@ -52,10 +60,8 @@ class RegistrationView(APIView):
         if serializer.is_valid():
             email = serializer.validated_data["email"]
             try:
-                user = serializer.save()
                 token = uuid.uuid4()
-                user.token = token
-                user.save()
+                user = serializer.save(token=token)
                 site_url = request.headers.get("X-Requested-From")
 
                 email_context = {
@@ -63,29 +69,21 @@ class RegistrationView(APIView):
                     "site_url": site_url,
                     "token": token,
                 }
-                email_html = render_to_string("user/confirm_email.html", email_context)
-                soup = BeautifulSoup(email_html, "html.parser")
-                subject = soup.title.string.strip()
-
-                message_elements = soup.find_all("td", class_="content-block")
-                message_parts = [
-                    element.get_text().strip() for element in message_elements
-                ]
-                message = "\n".join(message_parts)
-                sender_email = settings.DEFAULT_FROM_EMAIL
+                subject, message, email_html = confirm_email().render(email_context)
                 recipient_list = [email]
                 success_message = (
                     "Registration successful. "
                     "Verify your account with the email sent to you."
                 )
 
-                send_mail(
-                    subject=subject,
-                    message=message,
-                    from_email=sender_email,
-                    recipient_list=recipient_list,
-                    html_message=email_html,
-                    fail_silently=False,
+                enqueue(
+                    "send_email",
+                    {
+                        "subject": subject,
+                        "message": message,
+                        "recipient_list": recipient_list,
+                        "html_message": email_html,
+                    },
                 )
                 response_data = {
                     "message": success_message,
@@ -120,6 +118,8 @@ class RequestNewLinkView(APIView):
     """
 
     permission_classes = [AllowAny]
+    throttle_classes = [VerificationEmailThrottle]
+    query_budget = {"post": 3}
 
     def post(self, request):
         """
@@ -131,7 +131,7 @@ class RequestNewLinkView(APIView):
             if user.is_active:
                 token = uuid.uuid4()
                 user.token = token
-                user.save()
+                user.save(update_fields=["token"])
 
                 site_url = request.headers.get("X-Requested-From")
                 email_context = {
@@ -139,28 +139,20 @@ class RequestNewLinkView(APIView):
                     "site_url": site_url,
                     "token": token,
                 }
-                email_html = render_to_string("user/confirm_email.html", email_context)
-                soup = BeautifulSoup(email_html, "html.parser")
-                subject = soup.title.string.strip()
-
-                message_elements = soup.find_all("td", class_="content-block")
-                message_parts = [
-                    element.get_text().strip() for element in message_elements
-                ]
-                message = "\n".join(message_parts)
-                sender_email = settings.DEFAULT_FROM_EMAIL
+                subject, message, email_html = confirm_email().render(email_context)
                 recipient_list = [email]
                 success_message = (
                     "New email verification link has been sent. "
                     "Please check your email."
                 )
-                send_mail(
-                    subject=subject,
-                    message=message,
-                    from_email=sender_email,
-                    recipient_list=recipient_list,
-                    html_message=email_html,
-                    fail_silently=False,
+                enqueue(
+                    "send_email",
+                    {
+                        "subject": subject,
+                        "message": message,
+                        "recipient_list": recipient_list,
+                        "html_message": email_html,
+                    },
                 )
                 response_data = {
                     "message": success_message,
@@ -179,8 +171,11 @@ class LoginView(APIView):
     API view for user login.
     """
 
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [AllowAny]
+    throttle_classes = [LoginThrottle]
+    # One more when the password is rehashed with new hasher parameters
+    query_budget = {"post": 8}
 
     def post(self, request):
         """
@@ -215,18 +210,27 @@ class LogoutView(APIView):
     API view for user logout.
     """
 
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget = {"post": 4}
 
     def post(self, request):
         """
         Handle POST request for user logout.
         """
-        request.user.auth_token.delete()
+        # request.auth is the Token the request authenticated with
+        request.auth.delete()
         logout(request)
         return Response({"message": None}, status=status.HTTP_204_NO_CONTENT)
 
 
+# A valid link: the user and marking them verified. An expired one: the
+# user, then deleting them, which looks up their profile, upload sessions
+# and token (3) and the ratings they gave (1, see main_profile/signals.py)
+# and deletes their groups, permissions, ratings, admin log entries and the
+# user itself (5). An unverified user cannot log in, so they have no
+# profile, uploads, token or ratings whose own cascades would add more.
+@query_budget(post=10)
 @csrf_protect
 @api_view(["POST"])
 @permission_classes([AllowAny])
@@ -243,9 +247,9 @@ def verify(request):
         user = None
 
     if user is not None and not user.is_verified:
-        if timezone.now() <= user.date_joined + timedelta(days=3):
+        if timezone.now() <= user.date_joined + UserAccount.VERIFICATION_WINDOW:
             user.is_verified = True
-            user.save()
+            user.save(update_fields=["is_verified"])
             data = {"success": True, "message": "Your account is verified"}
         else:
             user.delete()
@@ -261,9 +265,11 @@ def verify(request):
     return Response(data)
 
 
+@query_budget(post=2)
 @csrf_protect
 @api_view(["POST"])
 @permission_classes([AllowAny])
+@throttle_classes([PasswordResetThrottle])
 def password_reset(request):
     """
     View function for requesting password reset.
@@ -281,27 +287,23 @@ def password_reset(request):
         uidb64 = urlsafe_base64_encode(force_bytes(user.pk))
 
         domain = request.headers.get("X-Requested-From")
-        email_html = render_to_string(
-            "user/password_reset_email.html",
+        subject, message, email_html = password_reset_email().render(
             {
                 "protocol": "https",
                 "domain": domain,
                 "uidb64": uidb64,
                 "token": token,
-            },
+            }
         )
-        soup = BeautifulSoup(email_html, "html.parser")
-        subject = soup.title.string.strip()
-        message = soup.find_all("p")[0].get_text()
-        sender_email = settings.DEFAULT_FROM_EMAIL
         to_email = [email]
-        send_mail(
-            subject=subject,
-            message=message,
-            from_email=sender_email,
-            html_message=email_html,
-            recipient_list=to_email,
-            fail_silently=False,
+        enqueue(
+            "send_email",
+            {
+                "subject": subject,
+                "message": message,
+                "html_message": email_html,
+                "recipient_list": to_email,
+            },
         )
         success_message = "Password reset link has been sent to your email."
         data = {
@@ -319,9 +321,11 @@ def password_reset(request):
     return Response(data)
 
 
+@query_budget(post=2)
 @csrf_protect
 @api_view(["POST"])
 @permission_classes([AllowAny])
+@throttle_classes([PasswordResetConfirmThrottle])
 def password_reset_confirm(request):
     """
     View function for confirming password reset.
@@ -357,8 +361,7 @@ def password_reset_confirm(request):
                         status=status.HTTP_400_BAD_REQUEST,
                     )
                 user.set_password(password1)
-                user.save()
-                user = authenticate(username=user.username, password=password1)
+                user.save(update_fields=["password"])
                 return Response(
                     {"success": "Password reset successful."},
                     status=status.HTTP_200_OK,